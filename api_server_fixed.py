@@ -1,100 +1,1664 @@
+import argparse
 import sqlite3
+import hashlib
+import itertools
+import json
+import multiprocessing
 import os
+import queue
+import re
+import sys
+import threading
+import time
 import uuid
-from flask import Flask, jsonify, request, g, send_from_directory
-from werkzeug.security import generate_password_hash, check_password_hash
+from collections import Counter as SampleCounter, OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from flask import Flask, abort, jsonify, request, g, send_from_directory, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
+from jose import JWTError, jwt
 from datetime import datetime
 
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow es opcional: sin él se sirven siempre los originales
+    Image = None
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el json de la librería estándar
+    orjson = None
+
 # --- CONFIGURACIÓN ---
 DATABASE = 'social_app_db.sqlite'
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4'} 
+MAX_PAGE_SIZE = 100
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 500))  # filas por fetchmany al listar sin paginar
+POST_LIST_COLUMNS = "p.id, p.user_id, p.description, p.media_url, p.media_type, p.created_at, p.author_username, p.author_avatar_url"
+# Un post con el autor tal y como lo espera post_row_to_json (sin JOIN: copia del autor en el propio post)
+POST_DETAIL_SELECT = "SELECT p.*, p.author_username AS username, p.author_avatar_url AS user_avatar FROM posts p"
+AUTHOR_REFRESH_BATCH = int(os.getenv('AUTHOR_REFRESH_BATCH', 500))  # posts por transacción al propagar un cambio de perfil
+
+# Timelines personales: ids de los últimos posts de las cuentas seguidas, materializados por usuario
+TIMELINE_MAX_LENGTH = int(os.getenv('TIMELINE_MAX_LENGTH', 800))
+# Cuentas con más seguidores no se reparten al escribir: sus posts se mezclan al leer
+FANOUT_ON_READ_THRESHOLD = int(os.getenv('FANOUT_ON_READ_THRESHOLD', 10000))
+MAX_BATCH_IDS = int(os.getenv('MAX_BATCH_IDS', 100))  # ids por petición en las lecturas por lotes
+SEARCH_MAX_TERMS = 8  # palabras de la consulta que se tienen en cuenta
+SYNC_MAX_CHANGES = int(os.getenv('SYNC_MAX_CHANGES', 500))  # cambios por respuesta de /sync
+SEARCH_MAX_OFFSET = int(os.getenv('SEARCH_MAX_OFFSET', 1000))  # más allá, el ranking deja de ser útil y cuesta más
+MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 100 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))
+UPLOAD_FORM_OVERHEAD = 1024 * 1024  # cabeceras multipart y campos de texto que acompañan al archivo
+
+# Variantes redimensionadas de las imágenes (lado mayor en px) generadas en segundo plano
+VARIANT_SIZES = {'thumb': 200, 'feed': 720, 'full': 1600}
+VARIANT_SOURCE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+VARIANT_QUALITY = int(os.getenv('VARIANT_QUALITY', 80))
+MEDIA_WORKERS = int(os.getenv('MEDIA_WORKERS', 2))
+
+# Caché HTTP de /uploads: los nombres por hash/UUID nunca cambian de contenido
+MEDIA_MAX_AGE = 365 * 24 * 3600
+MEDIA_FALLBACK_MAX_AGE = 60
+X_ACCEL_REDIRECT_PREFIX = os.getenv('X_ACCEL_REDIRECT_PREFIX')  # p. ej. '/protected-uploads/' detrás de nginx
+HASHED_MEDIA_NAME = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}(?:\.[a-z]+)?)\.[a-z0-9]+$')
+UUID_MEDIA_NAME = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}[._]')
+
+# Tokens JWT firmados; mismo formato, SECRET_KEY y ALGORITHM que backend/app/auth.py
+SECRET_KEY = os.getenv('SECRET_KEY')
+if not SECRET_KEY:
+    # Sin valor por defecto: con una clave conocida cualquiera podría firmar tokens válidos
+    raise RuntimeError("Falta la variable de entorno SECRET_KEY (la misma que usa backend/app/auth.py)")
+JWT_ALGORITHM = os.getenv('ALGORITHM', 'HS256')
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', 30))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', 30))
+
+# Caché de respuestas de las lecturas calientes: 'memory' (LRU local), 'none' o una URL redis://
+RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL', 'memory')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 2048))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 300))
+
+# Pool de conexiones SQLite y PRAGMAs de rendimiento
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 8))
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 5))
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', 256))
+
+# Cola de trabajos persistente (tabla jobs) para los efectos secundarios de las escrituras
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+JOB_LEASE = float(os.getenv('JOB_LEASE', 300))  # segundos antes de reintentar un trabajo cuyo hilo murió
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1))
+JOB_RETENTION = float(os.getenv('JOB_RETENTION', 24 * 3600))  # segundos que se conservan los trabajos terminados
+
+# Hash de contraseñas en un pool de procesos acotado y límite de intentos fallidos de login
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')  # al cambiarlo se re-hashea en el login
+PASSWORD_WORKERS = int(os.getenv('PASSWORD_WORKERS', 2))
+PASSWORD_MAX_PENDING = int(os.getenv('PASSWORD_MAX_PENDING', 16))  # más allá se responde 503 en vez de encolar
+LOGIN_MAX_FAILURES = int(os.getenv('LOGIN_MAX_FAILURES', 5))  # por cuenta (email) y ventana
+LOGIN_IP_MAX_FAILURES = int(os.getenv('LOGIN_IP_MAX_FAILURES', 50))  # por IP y ventana
+LOGIN_FAILURE_WINDOW = float(os.getenv('LOGIN_FAILURE_WINDOW', 300))
+
+# Métricas en formato Prometheus (/metrics) y muestreo opcional de pilas de las peticiones lentas
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROFILE_SLOW_REQUEST_MS = float(os.getenv('PROFILE_SLOW_REQUEST_MS', 0))  # 0: profiler desactivado
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', 0.005))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 20))  # peticiones lentas que se conservan en /metrics/slow-requests
+
+# Modo de producción (python api_server_fixed.py): gunicorn con varios procesos; --dev usa el servidor de desarrollo
+WEB_BIND = os.getenv('WEB_BIND', '0.0.0.0:5000')
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', os.cpu_count() or 1))
+WEB_THREADS = int(os.getenv('WEB_THREADS', 4))  # hilos por proceso con el worker gthread
+# 'gthread' o 'gevent' (requiere gevent; cada consulta SQLite bloquea el proceso mientras dura)
+WEB_WORKER_CLASS = os.getenv('WEB_WORKER_CLASS', 'gthread')
+WEB_KEEPALIVE = int(os.getenv('WEB_KEEPALIVE', 5))  # segundos que se mantiene abierta una conexión ociosa
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', 60))  # un proceso que no responde en este tiempo se reinicia
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))  # margen para terminar peticiones al recargar/parar
+WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', 0))  # >0: cada proceso se recicla tras ese número de peticiones
+# El proceso maestro de serve() crea el esquema una vez; sus procesos hijos arrancan con INIT_DB_ON_IMPORT=0
+INIT_DB_ON_IMPORT = os.getenv('INIT_DB_ON_IMPORT', '1') == '1'
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['SECRET_KEY'] = 'una-clave-secreta-fuerte-para-jwt'
+app.config['SECRET_KEY'] = SECRET_KEY
+# Werkzeug rechaza el cuerpo al parsearlo, antes de volcar el archivo a disco; staged_upload comprueba el archivo exacto
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE') == '1'  # Apache/lighttpd sirven el archivo
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+# --- MÉTRICAS ---
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+class MetricCounter:
+    """Contador de Prometheus con etiquetas, seguro entre hilos."""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class MetricHistogram:
+    """Histograma de Prometheus con etiquetas y buckets fijos, seguro entre hilos."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=METRICS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}  # etiquetas -> [conteo por bucket..., +Inf, suma]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ('le',)
+        with self._lock:
+            for labels, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(names, labels + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {series[-1]}")
+                lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+http_request_duration = MetricHistogram(
+    'http_request_duration_seconds', 'Latencia de las peticiones HTTP.', ('method', 'route', 'status'))
+http_request_sql_statements = MetricCounter(
+    'http_request_sql_statements_total', 'Sentencias SQL ejecutadas al atender cada ruta.', ('method', 'route'))
+http_request_sql_seconds = MetricCounter(
+    'http_request_sql_seconds_total', 'Tiempo dentro de SQLite al atender cada ruta.', ('method', 'route'))
+sql_statements = MetricCounter('sql_statements_total', 'Sentencias SQL ejecutadas (incluye triggers).', ('operation',))
+sql_seconds = MetricCounter('sql_seconds_total', 'Tiempo dentro de SQLite (execute y fetch).', ('operation',))
+uploads_bytes_served = MetricCounter('uploads_bytes_served_total', 'Bytes enviados desde /uploads (sin X-Accel-Redirect).')
+METRICS = [http_request_duration, http_request_sql_statements, http_request_sql_seconds,
+           sql_statements, sql_seconds, uploads_bytes_served]
+
+# Sentencias y segundos de SQL de la petición en curso en este hilo ([n, segundos] o None fuera de peticiones)
+request_sql_stats = threading.local()
+
+def sql_operation(statement):
+    """Primera palabra de la sentencia (SELECT, INSERT...); las de los triggers llegan como '-- TRIGGER nombre'."""
+    statement = statement.lstrip()
+    if statement.startswith('--'):
+        return 'TRIGGER'
+    return statement.split(None, 1)[0].upper() if statement else ''
+
+def trace_sql_statement(statement):
+    """Callback de sqlite3 (set_trace_callback): una llamada por sentencia ejecutada."""
+    sql_statements.inc(sql_operation(statement))
+    stats = getattr(request_sql_stats, 'current', None)
+    if stats is not None:
+        stats[0] += 1
+
+def record_sql_time(operation, elapsed):
+    sql_seconds.inc(operation, amount=elapsed)
+    stats = getattr(request_sql_stats, 'current', None)
+    if stats is not None:
+        stats[1] += elapsed
+
+class MetricsCursor(sqlite3.Cursor):
+    """Cursor que mide el tiempo pasado en SQLite; los fetch se atribuyen a la última sentencia."""
+
+    _operation = ''
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            record_sql_time(self._operation, time.perf_counter() - start)
+
+    def execute(self, sql, parameters=()):
+        self._operation = sql_operation(sql)
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._operation = sql_operation(sql)
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._operation = 'SCRIPT'
+        return self._timed(sqlite3.Cursor.executescript, sql_script)
+
+    def fetchone(self):
+        return self._timed(sqlite3.Cursor.fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed(sqlite3.Cursor.fetchall)
+
+    def __next__(self):
+        return self._timed(sqlite3.Cursor.__next__)
+
+class MetricsConnection(sqlite3.Connection):
+    """Conexión cuyos cursores (también los de execute()) son MetricsCursor."""
+
+    def cursor(self, factory=MetricsCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def render_metrics():
+    """Todas las métricas en el formato de texto de Prometheus."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class SlowRequestProfiler:
+    """Profiler por muestreo: un hilo toma la pila de cada petición en curso cada PROFILE_SAMPLE_INTERVAL.
+
+    Sólo se conservan (y se registran en el log) las pilas de las peticiones que
+    superan threshold_ms, en formato "collapsed" (func;func;func -> muestras).
+    """
+
+    def __init__(self, threshold_ms, interval, keep):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.slow_requests = deque(maxlen=keep)
+        self._active = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def start(self):
+        """Empieza a muestrear el hilo actual; devuelve la clave para stop() o None si está desactivado."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._sample, name='profiler', daemon=True).start()
+            key = next(self._ids)
+            self._active[key] = (threading.get_ident(), SampleCounter())
+        return key
+
+    def stop(self, key, description, duration):
+        with self._lock:
+            _, samples = self._active.pop(key)
+        duration_ms = duration * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        top = [{"stack": stack, "samples": count} for stack, count in samples.most_common(20)]
+        self.slow_requests.append({"request": description, "duration_ms": round(duration_ms, 1), "stacks": top})
+        app.logger.warning("Petición lenta %s (%.0f ms); pilas más frecuentes: %s", description, duration_ms, top[:3])
+
+    def _sample(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self._active.values())
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own:
+                    samples[collapsed_stack(frame)] += 1
+
+def collapsed_stack(frame, limit=40):
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+profiler = SlowRequestProfiler(PROFILE_SLOW_REQUEST_MS, PROFILE_SAMPLE_INTERVAL, PROFILE_KEEP)
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    g.metrics_profile = profiler.start()
+    request_sql_stats.current = [0, 0.0]
+
+@app.after_request
+def record_response_metrics(response):
+    g.metrics_status = response.status_code
+    if request.endpoint == 'uploaded_file' and response.content_length:
+        uploads_bytes_served.inc(amount=response.content_length)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exception):
+    """Registra la petición al terminar de atenderla.
+
+    Con stream_with_context el teardown se ejecuta dos veces: al volver la vista
+    y al agotarse el generador; en ese caso se espera a la segunda.
+    """
+    if g.pop('metrics_streaming', False):
+        return
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    status = g.pop('metrics_status', 500)
+    http_request_duration.observe(duration, request.method, route, str(status))
+    statements, sql_time = request_sql_stats.current
+    request_sql_stats.current = None
+    http_request_sql_statements.inc(request.method, route, amount=statements)
+    http_request_sql_seconds.inc(request.method, route, amount=sql_time)
+    key = g.pop('metrics_profile', None)
+    if key is not None:
+        profiler.stop(key, f"{request.method} {request.path} -> {status} ({statements} SQL, {sql_time * 1000:.1f} ms)", duration)
+
 # --- UTILS DE BASE DE DATOS ---
 
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite reutilizables entre peticiones.
+
+    Cada conexión la usa un solo hilo a la vez (se toma en get_db y se devuelve
+    en el teardown), por eso es seguro desactivar check_same_thread.
+    """
+
+    def __init__(self, database, size):
+        if SQLITE_SYNCHRONOUS not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+            raise ValueError(f"SQLITE_SYNCHRONOUS inválido: {SQLITE_SYNCHRONOUS}")
+        self.database = database
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+
+    def _connect(self):
+        db = sqlite3.connect(
+            self.database,
+            timeout=SQLITE_BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+            factory=MetricsConnection,
+        )
+        db.row_factory = sqlite3.Row
+        db.set_trace_callback(trace_sql_statement)
+        # WAL: los lectores del feed no se bloquean mientras se crean posts
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        db.execute(f"PRAGMA cache_size={-SQLITE_CACHE_SIZE_KB}")
+        db.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        return db
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            # Tras un fork no se reutilizan las conexiones del padre: SQLite no admite compartirlas entre procesos
+            self._idle = queue.LifoQueue(maxsize=self.size)
+            self._pid = os.getpid()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, db):
+        if self._pid != os.getpid():
+            return
+        if db.in_transaction:
+            db.rollback()
+        try:
+            self._idle.put_nowait(db)
+        except queue.Full:
+            db.close()
+
+db_pool = ConnectionPool(DATABASE, SQLITE_POOL_SIZE)
+
 def get_db():
-    """Establece la conexión a la base de datos SQLite."""
+    """Obtiene del pool la conexión SQLite de la petición actual."""
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row 
+        db = g._database = db_pool.acquire()
     return db
 
 @app.teardown_appcontext
 def close_connection(exception):
-    """Cierra la conexión DB al final de la petición."""
-    db = getattr(g, '_database', None)
+    """Devuelve la conexión DB al pool al final de la petición."""
+    db = g.pop('_database', None)
     if db is not None:
-        db.close()
+        db_pool.release(db)
+
+# --- MIGRACIONES DEL ESQUEMA ---
+
+def execute_statements(cursor, script):
+    """Ejecuta un script SQL sentencia a sentencia dentro de la transacción en curso.
+
+    executescript() hace COMMIT antes de empezar y soltaría el lock de init_db().
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            cursor.execute(statement)
+            statement = ""
+
+# Triggers que mantienen posts_fts al día; se recrean cada vez que se reconstruye la tabla posts
+POSTS_FTS_TRIGGERS = """
+        CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN
+            INSERT INTO posts_fts(rowid, description) VALUES (new.id, new.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN
+            INSERT INTO posts_fts(posts_fts, rowid, description) VALUES ('delete', old.id, old.description);
+        END;
+        CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF description ON posts BEGIN
+            INSERT INTO posts_fts(posts_fts, rowid, description) VALUES ('delete', old.id, old.description);
+            INSERT INTO posts_fts(rowid, description) VALUES (new.id, new.description);
+        END;
+"""
+
+def migrate_initial_schema(cursor):
+    """Esquema anterior a las migraciones versionadas.
+
+    Es idempotente: también pone al día las bases creadas por versiones de
+    init_db() anteriores a schema_migrations (columnas añadidas, FTS, índices).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE,
+            passwordHash TEXT NOT NULL, 
+            bio TEXT,
+            avatar_url TEXT,
+            follower_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    user_columns = {row['name'] for row in cursor.execute("PRAGMA table_info(users)")}
+    if 'follower_count' not in user_columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN follower_count INTEGER NOT NULL DEFAULT 0")
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            media_url TEXT NOT NULL, 
+            media_type TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            author_username TEXT,
+            author_avatar_url TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+
+    # Copia del autor en cada post (para leer el feed sin JOIN); las bases anteriores se rellenan aquí
+    post_columns = {row['name'] for row in cursor.execute("PRAGMA table_info(posts)")}
+    if 'author_username' not in post_columns:
+        cursor.execute("ALTER TABLE posts ADD COLUMN author_username TEXT")
+        cursor.execute("ALTER TABLE posts ADD COLUMN author_avatar_url TEXT")
+        cursor.execute("""
+            UPDATE posts SET
+                author_username = (SELECT username FROM users WHERE users.id = posts.user_id),
+                author_avatar_url = (SELECT avatar_url FROM users WHERE users.id = posts.user_id)
+        """)
+
+    # Almacén de medios direccionado por contenido: una fila por archivo con su contador de referencias
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS media (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS follows (
+            follower_id INTEGER NOT NULL,
+            followee_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (follower_id, followee_id),
+            FOREIGN KEY (follower_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (followee_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_follows_followee ON follows (followee_id, follower_id)")
+
+    # Timeline materializada: la clave primaria es el propio orden de lectura del feed personal
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS timeline (
+            user_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            post_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, created_at, post_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_timeline_post ON timeline (post_id)")
+
+    # Cola de trabajos: se escriben en la misma transacción que el cambio que los origina
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at)")
+
+    # Índices de texto completo (FTS5 con contenido externo): los triggers los mantienen al día
+    # en cada INSERT/UPDATE/DELETE; al crearlos sobre una base existente se reconstruyen una vez
+    existing_fts = {row['name'] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE name IN ('posts_fts', 'users_fts')")}
+    execute_statements(cursor, f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+            description, content='posts', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        );
+        {POSTS_FTS_TRIGGERS}
+
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            username, name, content='users', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts(rowid, username, name) VALUES (new.id, new.username, new.name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts(users_fts, rowid, username, name) VALUES ('delete', old.id, old.username, old.name);
+        END;
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username, name ON users BEGIN
+            INSERT INTO users_fts(users_fts, rowid, username, name) VALUES ('delete', old.id, old.username, old.name);
+            INSERT INTO users_fts(rowid, username, name) VALUES (new.id, new.username, new.name);
+        END;
+    """)
+    for table in {'posts_fts', 'users_fts'} - existing_fts:
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+    # Índices para la paginación por cursor (keyset) del feed y de los posts por usuario
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_at_id ON posts (created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_user_created_at_id ON posts (user_id, created_at, id)")
+
+def migrate_partial_job_indexes(cursor):
+    """Un índice parcial por consulta de la cola: los pendientes salen ya ordenados por run_at y la
+    limpieza recorre sólo los terminados. Las condiciones de las consultas deben ser literales, no parámetros."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_pending_run_at ON jobs (run_at) WHERE status IN ('pending', 'running')")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_done_run_at ON jobs (run_at) WHERE status = 'done'")
+    cursor.execute("DROP INDEX IF EXISTS idx_jobs_status_run_at")
+
+def migrate_epoch_ms_timestamps(cursor):
+    """created_at de posts y timeline pasa de TEXT en hora local del servidor a INTEGER en epoch ms (UTC).
+
+    SQLite no cambia el tipo de una columna: se copian ambas tablas y se
+    recrean sus índices, los triggers de posts_fts (el índice sigue valiendo
+    porque se conservan los ids) y el contador AUTOINCREMENT. El texto se
+    interpreta en la zona horaria local, la misma con la que se escribió.
+    """
+    execute_statements(cursor, f"""
+        CREATE TABLE posts_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            media_url TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            author_username TEXT,
+            author_avatar_url TEXT,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        );
+        INSERT INTO posts_new (id, user_id, description, media_url, media_type, created_at, author_username, author_avatar_url)
+            SELECT id, user_id, description, media_url, media_type,
+                   CAST(strftime('%s', created_at, 'utc') AS INTEGER) * 1000, author_username, author_avatar_url
+            FROM posts;
+        DELETE FROM sqlite_sequence WHERE name = 'posts_new';
+        INSERT INTO sqlite_sequence (name, seq) SELECT 'posts_new', seq FROM sqlite_sequence WHERE name = 'posts';
+        DROP TABLE posts;
+        ALTER TABLE posts_new RENAME TO posts;
+        CREATE INDEX idx_posts_created_at_id ON posts (created_at, id);
+        CREATE INDEX idx_posts_user_created_at_id ON posts (user_id, created_at, id);
+        {POSTS_FTS_TRIGGERS}
+
+        CREATE TABLE timeline_new (
+            user_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL,
+            post_id INTEGER NOT NULL,
+            author_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, created_at, post_id)
+        ) WITHOUT ROWID;
+        INSERT INTO timeline_new (user_id, created_at, post_id, author_id)
+            SELECT t.user_id, p.created_at, t.post_id, t.author_id FROM timeline t JOIN posts p ON p.id = t.post_id;
+        DROP TABLE timeline;
+        ALTER TABLE timeline_new RENAME TO timeline;
+        CREATE INDEX idx_timeline_post ON timeline (post_id);
+    """)
+
+def migrate_change_log(cursor):
+    """Registro de cambios para GET /sync: una fila por post o usuario con la versión de su último cambio.
+
+    Lo mantienen triggers, así ninguna escritura puede olvidarse de anotar:
+    cada cambio borra la fila anterior de la entidad e inserta otra, y
+    AUTOINCREMENT garantiza versiones crecientes que nunca se reutilizan.
+    Como SQLite serializa a los escritores, el orden de versión es el de
+    commit. Los posts sólo anotan cambios de su contenido: la copia del autor
+    se refresca con el cambio de perfil, que ya viaja como cambio de usuario.
+    Las filas existentes entran con las primeras versiones (since=0 es la
+    sincronización completa).
+    """
+    execute_statements(cursor, """
+        CREATE TABLE change_log (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (entity, entity_id)
+        );
+        INSERT INTO change_log (entity, entity_id) SELECT 'user', id FROM users ORDER BY id;
+        INSERT INTO change_log (entity, entity_id) SELECT 'post', id FROM posts ORDER BY id;
+
+        CREATE TRIGGER change_log_posts_insert AFTER INSERT ON posts BEGIN
+            DELETE FROM change_log WHERE entity = 'post' AND entity_id = new.id;
+            INSERT INTO change_log (entity, entity_id) VALUES ('post', new.id);
+        END;
+        CREATE TRIGGER change_log_posts_update AFTER UPDATE OF description, media_url, media_type ON posts BEGIN
+            DELETE FROM change_log WHERE entity = 'post' AND entity_id = new.id;
+            INSERT INTO change_log (entity, entity_id) VALUES ('post', new.id);
+        END;
+        CREATE TRIGGER change_log_posts_delete AFTER DELETE ON posts BEGIN
+            DELETE FROM change_log WHERE entity = 'post' AND entity_id = old.id;
+            INSERT INTO change_log (entity, entity_id, deleted) VALUES ('post', old.id, 1);
+        END;
+        CREATE TRIGGER change_log_users_insert AFTER INSERT ON users BEGIN
+            DELETE FROM change_log WHERE entity = 'user' AND entity_id = new.id;
+            INSERT INTO change_log (entity, entity_id) VALUES ('user', new.id);
+        END;
+        CREATE TRIGGER change_log_users_update AFTER UPDATE OF name, username, email, bio, avatar_url ON users BEGIN
+            DELETE FROM change_log WHERE entity = 'user' AND entity_id = new.id;
+            INSERT INTO change_log (entity, entity_id) VALUES ('user', new.id);
+        END;
+        CREATE TRIGGER change_log_users_delete AFTER DELETE ON users BEGIN
+            DELETE FROM change_log WHERE entity = 'user' AND entity_id = old.id;
+            INSERT INTO change_log (entity, entity_id, deleted) VALUES ('user', old.id, 1);
+        END;
+    """)
+
+# (versión, descripción, función): las ya publicadas no se modifican; cada cambio de esquema va en una nueva al final
+MIGRATIONS = [
+    (1, 'esquema inicial', migrate_initial_schema),
+    (2, 'índices parciales de la cola de trabajos', migrate_partial_job_indexes),
+    (3, 'created_at de posts y timeline en epoch ms (UTC)', migrate_epoch_ms_timestamps),
+    (4, 'registro de cambios para /sync', migrate_change_log),
+]
 
 def init_db():
-    """Crea las tablas de Users y Posts si no existen."""
+    """Aplica, en orden y una sola vez, las migraciones de MIGRATIONS que faltan en schema_migrations.
+
+    Cada migración corre con el lock de escritura tomado (BEGIN IMMEDIATE) y
+    vuelve a leer las versiones aplicadas dentro de él: los workers de
+    gunicorn que arrancan a la vez esperan en lugar de repetir migraciones
+    que no son idempotentes. La migración y su versión se confirman juntas.
+    """
     with app.app_context():
         db = get_db()
         cursor = db.cursor()
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                username TEXT NOT NULL UNIQUE,
-                email TEXT NOT NULL UNIQUE,
-                passwordHash TEXT NOT NULL, 
-                bio TEXT,
-                avatar_url TEXT
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS posts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                description TEXT NOT NULL,
-                media_url TEXT NOT NULL, 
-                media_type TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
+        for version, description, migrate in MIGRATIONS:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TEXT NOT NULL
+                    )
+                """)
+                if cursor.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,)).fetchone():
+                    db.rollback()
+                    continue
+                migrate(cursor)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                )
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+            app.logger.info("Migración %s aplicada: %s", version, description)
+
+if INIT_DB_ON_IMPORT:
+    init_db()
+
+# --- CACHÉ EN MEMORIA ---
+
+class TTLCache:
+    """Caché LRU acotada con expiración por entrada, segura entre hilos."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate):
+        """Elimina todas las entradas cuyo valor cumpla el predicado."""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+class MemoryCacheBackend:
+    """Backend por defecto: LRU en memoria del proceso."""
+
+    name = 'memory'
+
+    def __init__(self, maxsize, ttl):
+        self._entries = TTLCache(maxsize, ttl)
+        self._clock = itertools.count(1)
+
+    def get_many(self, keys):
+        return [self._entries.get(key) for key in keys]
+
+    def set(self, key, value):
+        self._entries.set(key, value)
+
+    def next_version(self):
+        return next(self._clock)
+
+class NullCacheBackend:
+    """Sin caché: con varios procesos y sin Redis, una LRU por proceso serviría respuestas ya invalidadas en otro."""
+
+    name = 'none'
+
+    def __init__(self):
+        self._clock = itertools.count(1)
+
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value):
+        pass
+
+    def next_version(self):
+        return next(self._clock)
+
+class RedisCacheBackend:
+    """Backend compartido entre procesos (Redis o compatible); requiere el paquete redis."""
+
+    name = 'redis'
+
+    def __init__(self, url, ttl):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+
+    def get_many(self, keys):
+        return [json.loads(value) if value is not None else None for value in self._redis.mget(keys)]
+
+    def set(self, key, value):
+        self._redis.set(key, json.dumps(value), ex=self.ttl)
+
+    def next_version(self):
+        return self._redis.incr('respcache:clock')
+
+class ResponseCache:
+    """Caché de respuestas JSON por ruta y parámetros, invalidada por etiquetas.
+
+    Cada entrada guarda la versión de sus etiquetas ('feed', 'author:3', 'post:7',
+    'user:3') en el momento de construirse; invalidar una etiqueta le asigna una
+    versión nueva y todas las entradas que la usaban dejan de ser válidas.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def versions(self, tags):
+        values = self.backend.get_many([f"tag:{tag}" for tag in tags]) if tags else []
+        return dict(zip(tags, values))
+
+    def get(self, key):
+        entry = self.backend.get_many([f"resp:{key}"])[0]
+        if entry is not None and self.versions(list(entry['tags'])) == entry['tags']:
+            self._count('hits')
+            return entry
+        self._count('misses')
+        return None
+
+    def set(self, key, versions, body, headers):
+        self.backend.set(f"resp:{key}", {'tags': versions, 'body': body, 'headers': headers})
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.set(f"tag:{tag}", self.backend.next_version())
+        self._count('invalidations')
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
+
+if RESPONSE_CACHE_URL == 'memory':
+    response_cache = ResponseCache(MemoryCacheBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL))
+elif RESPONSE_CACHE_URL == 'none':
+    response_cache = ResponseCache(NullCacheBackend())
+else:
+    response_cache = ResponseCache(RedisCacheBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL))
+
+CACHED_RESPONSE_HEADERS = ('X-Next-Cursor',)
+
+def cached_json(tags, build):
+    """Devuelve la respuesta cacheada de esta petición GET o la construye con build(tags).
+
+    build puede añadir etiquetas que sólo conoce tras consultar (p. ej. el autor).
+    Las versiones de las etiquetas se leen antes de consultar la BD, así una
+    invalidación concurrente nunca deja guardada una respuesta vieja.
+    """
+    key = f"{request.host}{request.full_path}"
+    entry = response_cache.get(key)
+    if entry is not None:
+        return app.response_class(entry['body'], headers=entry['headers'], mimetype='application/json')
+
+    tags = list(tags)
+    versions = response_cache.versions(tags)
+    response = app.make_response(build(tags))
+    if response.status_code == 200:
+        versions.update(response_cache.versions([tag for tag in tags if tag not in versions]))
+        headers = {name: response.headers[name] for name in CACHED_RESPONSE_HEADERS if name in response.headers}
+        response_cache.set(key, versions, response.get_data(as_text=True), headers)
+    return response
+
+
+# --- COLA DE TRABAJOS ---
+
+class JobQueue:
+    """Cola de trabajos persistente en la tabla jobs, atendida por hilos del propio proceso.
+
+    enqueue() inserta con el cursor de la petición, así el trabajo existe si y
+    sólo si el cambio que lo origina se confirma. Un trabajo en curso tiene un
+    plazo (JOB_LEASE): si el proceso muere, otro hilo lo vuelve a tomar. Los
+    fallos se reintentan con espera exponencial hasta JOB_MAX_ATTEMPTS, y un
+    idempotency_key repetido no crea un segundo trabajo. Los manejadores deben
+    ser idempotentes, porque un trabajo puede ejecutarse más de una vez.
+    """
+
+    def __init__(self, pool, workers):
+        self.pool = pool
+        self.workers = workers
+        self.handlers = {}
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next_cleanup = 0
+
+    def handler(self, kind):
+        """Decorador que registra la función que ejecuta los trabajos de tipo kind."""
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    def enqueue(self, cursor, kind, payload, key=None):
+        """Añade un trabajo dentro de la transacción en curso (sin commit)."""
+        now = time.time()
+        cursor.execute(
+            "INSERT INTO jobs (kind, payload, idempotency_key, run_at, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(idempotency_key) DO NOTHING",
+            (kind, json.dumps(payload), key, now, now)
+        )
+        self.start()
+        # El hilo que despierte esperará al lock de escritura hasta el commit de la petición
+        self._wakeup.set()
+
+    def start(self):
+        """Arranca los hilos en este proceso (también tras un fork, donde los hilos no se heredan)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            for number in range(self.workers):
+                threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True).start()
+
+    def _work(self):
+        while True:
+            try:
+                if not self.run_next():
+                    self._wakeup.wait(JOB_POLL_INTERVAL)
+                    self._wakeup.clear()
+            except Exception:
+                app.logger.exception("Error en la cola de trabajos")
+                time.sleep(JOB_POLL_INTERVAL)
+
+    def run_next(self):
+        """Toma y ejecuta el siguiente trabajo vencido; devuelve False si no había ninguno."""
+        db = self.pool.acquire()
+        try:
+            now = time.time()
+            job = db.execute("""
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, run_at = ?
+                WHERE id = (
+                    SELECT id FROM jobs WHERE status IN ('pending', 'running') AND run_at <= ?
+                    ORDER BY run_at LIMIT 1
+                )
+                RETURNING id, kind, payload, attempts
+            """, (now + JOB_LEASE, now)).fetchone()
+            db.commit()
+            if job is None:
+                self._cleanup(db, now)
+                return False
+
+            try:
+                self.handlers[job['kind']](**json.loads(job['payload']))
+            except Exception as e:
+                failed = job['attempts'] >= JOB_MAX_ATTEMPTS
+                app.logger.warning("Trabajo %s (%s) falló en el intento %s: %s", job['id'], job['kind'], job['attempts'], e)
+                db.execute(
+                    "UPDATE jobs SET status = ?, run_at = ?, last_error = ? WHERE id = ?",
+                    ('failed' if failed else 'pending', time.time() + min(2 ** job['attempts'], 300), repr(e), job['id'])
+                )
+            else:
+                db.execute("UPDATE jobs SET status = 'done', run_at = ? WHERE id = ?", (time.time(), job['id']))
+            db.commit()
+            return True
+        finally:
+            db.rollback()
+            self.pool.release(db)
+
+    def _cleanup(self, db, now):
+        """Borra de vez en cuando los trabajos terminados hace más de JOB_RETENTION."""
+        if now < self._next_cleanup:
+            return
+        self._next_cleanup = now + 60
+        db.execute("DELETE FROM jobs WHERE status = 'done' AND run_at < ?", (now - JOB_RETENTION,))
         db.commit()
 
-init_db()
+    def stats(self):
+        db = self.pool.acquire()
+        try:
+            return {row['status']: row['total'] for row in db.execute(
+                "SELECT status, COUNT(*) AS total FROM jobs GROUP BY status"
+            )}
+        finally:
+            self.pool.release(db)
+
+job_queue = JobQueue(db_pool, JOB_WORKERS)
+
+@app.before_request
+def start_job_workers():
+    # Los trabajos pendientes de una ejecución anterior se atienden aunque nadie encole nada nuevo
+    job_queue.start()
+
 
 # --- UTILS DE SEGURIDAD Y ARCHIVOS ---
 
+def create_token(user, token_type):
+    """Firma un token 'access' o 'refresh' con los claims de backend/app/auth.py (sub = email)."""
+    lifetime = ACCESS_TOKEN_EXPIRE_MINUTES * 60 if token_type == 'access' else REFRESH_TOKEN_EXPIRE_DAYS * 86400
+    claims = {
+        "sub": user['email'],
+        "user_id": user['id'],
+        "username": user['username'],
+        "type": token_type,
+        "exp": int(time.time()) + lifetime,
+    }
+    return jwt.encode(claims, SECRET_KEY, algorithm=JWT_ALGORITHM)
+
+def token_response(user, status):
+    """Respuesta de register/login/refresh: token de acceso, token de refresco e id."""
+    return jsonify({
+        "token": create_token(user, 'access'),
+        "refresh_token": create_token(user, 'refresh'),
+        "user_id": user['id'],
+    }), status
+
+def decode_token(token, token_type):
+    """Claims de un token válido, sin expirar y del tipo pedido; None en otro caso."""
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[JWT_ALGORITHM])
+    except JWTError:
+        return None
+    if claims.get('type', 'access') != token_type or 'user_id' not in claims:
+        return None
+    return claims
+
 def get_user_from_token(auth_header):
-    """Simula la autenticación extrayendo el ID del usuario del header Bearer."""
+    """Usuario del header Bearer, tomado de los claims del JWT (solo se verifica la firma, sin consultar la BD).
+
+    Devuelve {"id", "username", "email"} o None si el token falta, no es válido o expiró.
+    """
     if not auth_header or not auth_header.startswith("Bearer "):
         return None
-    try:
-        user_id = int(auth_header.split(" ")[1])
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-        user = cursor.fetchone()
-        return dict(user) if user else None
-    except Exception:
+    claims = decode_token(auth_header[len("Bearer "):], 'access')
+    if claims is None:
         return None
+    return {"id": int(claims['user_id']), "username": claims.get('username'), "email": claims['sub']}
+
+class PasswordPoolBusy(Exception):
+    """Hay PASSWORD_MAX_PENDING operaciones de contraseña en curso."""
+
+class PasswordHasher:
+    """Calcula y verifica hashes en un pool de procesos acotado.
+
+    El hash es CPU pura: en procesos aparte no bloquea los hilos que sirven el
+    feed, y el semáforo rechaza las ráfagas en lugar de acumularlas.
+    """
+
+    def __init__(self, workers, max_pending, method):
+        self.workers = workers
+        self.method = method
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # 'spawn': no se hereda el estado del servidor; tras un fork se crea un pool nuevo
+                    self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._pid = os.getpid()
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True si el hash se calculó con otro método o coste distinto de PASSWORD_HASH_METHOD."""
+        return password_hash.split('$', 1)[0] != self.method
+
+password_hasher = PasswordHasher(PASSWORD_WORKERS, PASSWORD_MAX_PENDING, PASSWORD_HASH_METHOD)
+
+class LoginRateLimiter:
+    """Cuenta los logins fallidos por clave (email o IP) en una ventana fija desde el primer fallo."""
+
+    def __init__(self, max_failures, window, maxsize=100000):
+        self.max_failures = max_failures
+        self.window = window
+        self._failures = TTLCache(maxsize, window)
+        self._lock = threading.Lock()
+
+    def retry_after(self, key):
+        """Segundos que faltan para volver a intentarlo, o 0 si la clave no está bloqueada."""
+        item = self._failures.get(key)
+        if item is None or item[0] < self.max_failures:
+            return 0
+        remaining = item[1] + self.window - time.monotonic()
+        return int(remaining) + 1 if remaining > 0 else 0
+
+    def record_failure(self, key):
+        with self._lock:
+            item = self._failures.get(key)
+            if item is None or item[1] + self.window <= time.monotonic():
+                item = (0, time.monotonic())
+            self._failures.set(key, (item[0] + 1, item[1]))
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.set(key, (0, time.monotonic()))
+
+account_login_limiter = LoginRateLimiter(LOGIN_MAX_FAILURES, LOGIN_FAILURE_WINDOW)
+ip_login_limiter = LoginRateLimiter(LOGIN_IP_MAX_FAILURES, LOGIN_FAILURE_WINDOW)
 
 def allowed_file(filename):
     """Verifica la extensión del archivo."""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def save_file(uploaded_file):
-    """Guarda un archivo subido con un nombre único (UUID)."""
+class UploadTooLarge(Exception):
+    """El archivo subido supera MAX_UPLOAD_SIZE."""
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(error):
+    """El cuerpo supera MAX_CONTENT_LENGTH: misma respuesta que UploadTooLarge en las rutas de subida."""
+    return jsonify({"message": "El archivo es demasiado grande"}), 413
+
+def media_path(sha256, extension):
+    """Ruta relativa (dentro de uploads/) de un archivo según su hash: ab/cd/<sha256>.<ext>."""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension}"
+
+@contextmanager
+def staged_upload(uploaded_file):
+    """Escribe el upload por bloques a un temporal y calcula su SHA-256 al vuelo.
+
+    Devuelve (ruta_relativa, tamaño). El archivo sólo se publica en su ruta por
+    contenido al salir del bloque sin errores, es decir, después del commit que
+    registra la referencia; si hay una excepción se descarta el temporal.
+    Los archivos con el mismo contenido comparten ruta, así que no se duplican.
+    """
+    folder = app.config['UPLOAD_FOLDER']
     extension = uploaded_file.filename.rsplit('.', 1)[1].lower()
-    filename = str(uuid.uuid4()) + '.' + extension
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    uploaded_file.save(filepath)
-    return filename 
+    tmp_path = os.path.join(folder, f".tmp-{uuid.uuid4().hex}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as buffer:
+            while True:
+                chunk = uploaded_file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                buffer.write(chunk)
+
+        path = media_path(digest.hexdigest(), extension)
+        yield path, size
+
+        final_path = os.path.join(folder, path)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def add_media_ref(cursor, path, size):
+    """Suma una referencia al archivo (dentro de la transacción del post/avatar)."""
+    cursor.execute(
+        "INSERT INTO media (path, size, refcount) VALUES (?, ?, 1) "
+        "ON CONFLICT(path) DO UPDATE SET refcount = refcount + 1",
+        (path, size)
+    )
+
+def release_media_ref(cursor, path):
+    """Resta una referencia; si el archivo queda huérfano encola su borrado.
+
+    Los archivos antiguos (nombres UUID) no están en la tabla y se ignoran.
+    """
+    if not path:
+        return
+    cursor.execute("UPDATE media SET refcount = refcount - 1 WHERE path = ?", (path,))
+    cursor.execute("SELECT refcount FROM media WHERE path = ?", (path,))
+    row = cursor.fetchone()
+    if row and row['refcount'] <= 0:
+        cursor.execute("DELETE FROM media WHERE path = ?", (path,))
+        job_queue.enqueue(cursor, 'remove_media', {"path": path})
+
+@job_queue.handler('remove_media')
+def remove_orphan_media(path):
+    """Borra el archivo (y sus variantes) si sigue sin referencias.
+
+    Comprueba y borra con el lock de escritura tomado (BEGIN IMMEDIATE): una
+    subida concurrente del mismo contenido o bien ya registró su referencia y
+    el archivo se conserva, o bien lo publica de nuevo tras su commit.
+    """
+    db = db_pool.acquire()
+    try:
+        db.execute("BEGIN IMMEDIATE")
+        if db.execute("SELECT 1 FROM media WHERE path = ?", (path,)).fetchone() is None:
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], path)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            remove_variants(path)
+            # Si el mismo contenido vuelve a subirse, sus variantes tienen que generarse de nuevo
+            db.execute("DELETE FROM jobs WHERE idempotency_key = ?", (f"variants:{path}",))
+        db.commit()
+    finally:
+        db.rollback()
+        db_pool.release(db)
+
+def variant_file(path, variant, extension):
+    """Ruta de una variante junto al original: ab/cd/<sha256>.<variant>.<webp|jpg>."""
+    return f"{os.path.splitext(path)[0]}.{variant}.{extension}"
+
+def generate_variants(source_path):
+    """Genera las variantes redimensionadas de una imagen (se ejecuta en el pool de procesos)."""
+    use_webp = features.check('webp')
+    extension = 'webp' if use_webp else 'jpg'
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if not use_webp or image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        for variant, max_side in VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side))
+            target = variant_file(source_path, variant, extension)
+            tmp_target = target + '.tmp'
+            resized.save(tmp_target, format='WEBP' if use_webp else 'JPEG', quality=VARIANT_QUALITY)
+            os.replace(tmp_target, target)
+
+variant_pool = None
+variant_pool_lock = threading.Lock()
+
+def schedule_variants(cursor, path):
+    """Encola (en la transacción en curso) la generación de variantes de una imagen.
+
+    La clave de idempotencia es la ruta: el mismo contenido sólo se procesa una vez.
+    """
+    if Image is None or path.rsplit('.', 1)[-1] not in VARIANT_SOURCE_EXTENSIONS:
+        return
+    job_queue.enqueue(cursor, 'generate_variants', {"path": path}, key=f"variants:{path}")
+
+@job_queue.handler('generate_variants')
+def run_generate_variants(path):
+    """Genera las variantes en el pool de procesos y espera el resultado para poder reintentar.
+
+    El archivo se publica justo después del commit que encoló el trabajo; si aún
+    no existe, el trabajo falla y se reintenta (salvo que ya no tenga referencias).
+    """
+    global variant_pool
+    with variant_pool_lock:
+        if variant_pool is None:
+            # 'spawn': no se hereda el estado (hilos, conexiones) del proceso del servidor
+            variant_pool = ProcessPoolExecutor(MEDIA_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        variant_pool.submit(generate_variants, os.path.join(app.config['UPLOAD_FOLDER'], path)).result()
+    except FileNotFoundError:
+        db = db_pool.acquire()
+        try:
+            referenced = db.execute("SELECT 1 FROM media WHERE path = ?", (path,)).fetchone() is not None
+        finally:
+            db_pool.release(db)
+        if referenced:
+            raise
+    except Image.UnidentifiedImageError as e:
+        # No es una imagen válida: reintentar no va a cambiar nada
+        app.logger.warning("No se generan variantes de %s: %s", path, e)
+
+def remove_variants(path):
+    """Borra las variantes de un archivo que ya no tiene referencias."""
+    for variant in VARIANT_SIZES:
+        for extension in ('webp', 'jpg'):
+            file_path = os.path.join(app.config['UPLOAD_FOLDER'], variant_file(path, variant, extension))
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+# --- COPIA DEL AUTOR EN LOS POSTS ---
+
+@job_queue.handler('refresh_author')
+def refresh_author_snapshot(user_id):
+    """Copia el username/avatar actuales del usuario a sus posts, por lotes.
+
+    Cada lote es una transacción corta para no bloquear las escrituras del resto.
+    Lee siempre el valor vigente de users, así que es idempotente y da igual el
+    orden en que se ejecuten refrescos repetidos. Sólo invalida las cachés si
+    algún post cambió: un refresco repetido no vacía el feed global.
+    """
+    updated = 0
+    db = db_pool.acquire()
+    try:
+        while True:
+            cursor = db.execute("""
+                UPDATE posts SET
+                    author_username = (SELECT username FROM users WHERE id = ?),
+                    author_avatar_url = (SELECT avatar_url FROM users WHERE id = ?)
+                WHERE id IN (
+                    SELECT p.id FROM posts p JOIN users u ON u.id = p.user_id
+                    WHERE p.user_id = ?
+                      AND (p.author_username IS NOT u.username OR p.author_avatar_url IS NOT u.avatar_url)
+                    LIMIT ?
+                )
+            """, (user_id, user_id, user_id, AUTHOR_REFRESH_BATCH))
+            db.commit()
+            updated += cursor.rowcount
+            if cursor.rowcount < AUTHOR_REFRESH_BATCH:
+                break
+    finally:
+        db_pool.release(db)
+    if updated:
+        response_cache.invalidate('feed', f"author:{user_id}")
+
+
+# --- TIMELINES PERSONALES (FAN-OUT AL ESCRIBIR) ---
+
+TRIM_TIMELINE_SQL = """
+    DELETE FROM timeline
+    WHERE user_id = ? AND (created_at, post_id) <= (
+        SELECT created_at, post_id FROM timeline WHERE user_id = ?
+        ORDER BY created_at DESC, post_id DESC LIMIT 1 OFFSET ?
+    )
+"""
+
+def trim_timelines(db, user_ids):
+    """Deja cada timeline con sus TIMELINE_MAX_LENGTH entradas más recientes."""
+    db.executemany(TRIM_TIMELINE_SQL, [(user_id, user_id, TIMELINE_MAX_LENGTH) for user_id in user_ids])
+
+@job_queue.handler('fan_out_post')
+def fan_out_post(post_id):
+    """Añade un post recién creado a la timeline de su autor y de sus seguidores.
+
+    Los autores con más de FANOUT_ON_READ_THRESHOLD seguidores sólo se escriben
+    en su propia timeline; sus seguidores los leen en get_home_feed. Todo sale de
+    un INSERT ... SELECT sobre posts, así un post ya borrado no se reparte.
+    """
+    db = db_pool.acquire()
+    try:
+        db.execute("""
+            INSERT OR IGNORE INTO timeline (user_id, created_at, post_id, author_id)
+            SELECT user_id, created_at, id, user_id FROM posts WHERE id = ?
+        """, (post_id,))
+        db.execute("""
+            INSERT OR IGNORE INTO timeline (user_id, created_at, post_id, author_id)
+            SELECT f.follower_id, p.created_at, p.id, p.user_id
+            FROM posts p
+            JOIN users u ON u.id = p.user_id
+            JOIN follows f ON f.followee_id = p.user_id
+            WHERE p.id = ? AND u.follower_count <= ?
+        """, (post_id, FANOUT_ON_READ_THRESHOLD))
+        # Siempre incluye al autor, aunque no tenga seguidores o supere el umbral y no se reparta a nadie
+        trim_timelines(db, [row[0] for row in db.execute(
+            "SELECT user_id FROM timeline WHERE post_id = ?", (post_id,)
+        )])
+        db.commit()
+    finally:
+        db_pool.release(db)
+
+@job_queue.handler('backfill_timeline')
+def backfill_timeline(follower_id, followee_id):
+    """Copia los últimos posts de una cuenta recién seguida a la timeline del seguidor."""
+    db = db_pool.acquire()
+    try:
+        # EXISTS: si el seguidor ya dejó de seguirla mientras esto esperaba en cola, no se copia nada
+        db.execute("""
+            INSERT OR IGNORE INTO timeline (user_id, created_at, post_id, author_id)
+            SELECT ?, created_at, id, user_id FROM posts
+            WHERE user_id = ? AND EXISTS (SELECT 1 FROM follows WHERE follower_id = ? AND followee_id = ?)
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        """, (follower_id, followee_id, follower_id, followee_id, TIMELINE_MAX_LENGTH))
+        trim_timelines(db, [follower_id])
+        db.commit()
+    finally:
+        db_pool.release(db)
+
+def merge_post_rows(*row_lists, limit):
+    """Mezcla listas de filas ya ordenadas por (created_at, id) DESC, sin duplicados."""
+    merged = {}
+    for rows in row_lists:
+        for row in rows:
+            merged[row[0]] = row
+    return sorted(merged.values(), key=lambda row: (row[5], row[0]), reverse=True)[:limit]
+
+def variant_urls(media_url, media_type):
+    """URLs de las variantes; el servidor devuelve el original mientras la variante no exista."""
+    if media_type != 'image':
+        return {"thumbnail_url": None, "feed_url": None, "full_url": None}
+    return {
+        "thumbnail_url": f"{media_url}?variant=thumb",
+        "feed_url": f"{media_url}?variant=feed",
+        "full_url": f"{media_url}?variant=full",
+    }
+
+def now_ms():
+    """Instante actual en epoch ms (UTC), el formato de created_at en posts y timeline."""
+    return int(time.time() * 1000)
+
+def format_timestamp(ms):
+    """Epoch ms a ISO 8601 en UTC con milisegundos (2024-01-01T10:00:00.000Z), como lo devuelve la API."""
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(ms // 1000)) + f".{ms % 1000:03d}Z"
+
+def parse_page_args(args):
+    """Lee ?limit= y ?before=<created_at,id> (created_at en epoch ms) del query string.
+
+    Devuelve (limit, cursor); ambos son None si el cliente no pidió paginación.
+    Lanza ValueError si los parámetros no son válidos.
+    """
+    limit = args.get('limit')
+    before = args.get('before')
+    if limit is None and before is None:
+        return None, None
+
+    limit = int(limit) if limit is not None else MAX_PAGE_SIZE
+    if limit < 1:
+        raise ValueError("limit debe ser mayor que 0")
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor = None
+    if before:
+        created_at, post_id = before.rsplit(',', 1)
+        cursor = (int(created_at), int(post_id))
+    return limit, cursor
+
+def time_range_conditions(args, column):
+    """Condiciones de ?since= (exclusivo) y ?until= (inclusivo), en epoch ms, sobre column.
+
+    Devuelve (condiciones, parámetros): sobre los índices (…, created_at, id) son
+    un recorrido de rango, así que sondear "posts nuevos desde el último
+    refresco" cuesta lo que devuelve. Lanza ValueError si no son enteros.
+    """
+    conditions, params = [], []
+    if args.get('since'):
+        conditions.append(f"{column} > ?")
+        params.append(int(args['since']))
+    if args.get('until'):
+        conditions.append(f"{column} <= ?")
+        params.append(int(args['until']))
+    return conditions, params
+
+def parse_batch_ids(values):
+    """Convierte ids ('1,2,3' o lista JSON) en enteros sin duplicados, en el orden pedido.
+
+    Lanza ValueError si no hay ids, alguno no es entero o pasan de MAX_BATCH_IDS.
+    """
+    if isinstance(values, str):
+        values = [value for value in values.split(',') if value.strip()]
+    if not isinstance(values, list):
+        raise ValueError("ids debe ser una lista")
+    ids = list(dict.fromkeys(int(value) for value in values))
+    if not ids or len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f"Se admiten entre 1 y {MAX_BATCH_IDS} ids")
+    return ids
+
+def search_terms(query):
+    """Palabras de la consulta de búsqueda, en minúsculas y sin operadores (como mucho SEARCH_MAX_TERMS)."""
+    return re.findall(r'\w+', query.lower())[:SEARCH_MAX_TERMS]
+
+def fts_match_query(terms):
+    """Consulta MATCH de FTS5: todas las palabras entre comillas (sin sintaxis del usuario) y la última como prefijo."""
+    return " ".join(f'"{term}"' for term in terms) + "*"
+
+def post_list_query(where, params, limit=None, before=None):
+    """Construye (sql, params) de la consulta de posts ordenada por (created_at, id) DESC.
+
+    No hace JOIN con users: el autor viene de la copia guardada en cada post.
+    """
+    conditions = list(where)
+    params = list(params)
+    if before is not None:
+        conditions.append("(p.created_at, p.id) < (?, ?)")
+        params.extend(before)
+
+    sql = f"""
+        SELECT {POST_LIST_COLUMNS}
+        FROM posts p
+    """
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY p.created_at DESC, p.id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def fetch_post_page(cursor, where, params, limit, before):
+    """Ejecuta la consulta de posts y devuelve (filas, next_cursor).
+
+    Si limit es None devuelve todas las filas; si no, aplica la condición keyset
+    sobre el índice (created_at, id).
+    """
+    sql, params = post_list_query(where, params, limit, before)
+    cursor.row_factory = None  # tuplas: mucho más baratas que sqlite3.Row para listas grandes
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if limit is not None and len(rows) == limit:
+        post_id, created_at = rows[-1][0], rows[-1][5]
+        next_cursor = f"{created_at},{post_id}"
+    return rows, next_cursor
+
+def dumps(value):
+    """Codifica a JSON con orjson si está instalado (varias veces más rápido que json)."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+def post_tuples_to_dicts(rows):
+    """Convierte filas (tuplas en el orden de POST_LIST_COLUMNS) en dicts listos para JSON.
+
+    Equivale a post_row_to_json por fila, pero el prefijo de URL se calcula una
+    sola vez por petición y no se crean objetos sqlite3.Row.
+    """
+    uploads_url = f"http://{request.host}/uploads/"
+    posts = []
+    append = posts.append
+    for post_id, user_id, description, media_url, media_type, created_at, username, user_avatar in rows:
+        full_media_url = uploads_url + media_url
+        append({
+            "id": post_id,
+            "user_id": user_id,
+            "description": description,
+            "username": username,
+            "user_avatar": uploads_url + user_avatar if user_avatar else None,
+            "media_url": full_media_url,
+            "media_type": media_type,
+            "created_at": format_timestamp(created_at),
+            **variant_urls(full_media_url, media_type),
+        })
+    return posts
+
+def post_tuples_to_json(rows):
+    """Serializa de una vez una lista de filas (ver post_tuples_to_dicts)."""
+    return dumps(post_tuples_to_dicts(rows))
+
+def streamed_posts_response(where, params):
+    """Lista completa de posts como array JSON emitido por lotes de STREAM_BATCH_SIZE filas.
+
+    La memoria por petición queda acotada al lote, no al tamaño de la tabla.
+    stream_with_context mantiene viva la petición (y su conexión del pool)
+    hasta que el generador termina.
+    """
+    sql, params = post_list_query(where, params)
+
+    def generate():
+        cursor = get_db().cursor()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        separator = b'['
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            chunk = post_tuples_to_json(rows)
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            yield separator + chunk[1:-1]
+            separator = b','
+        yield b'[]' if separator == b'[' else b']'
+
+    g.metrics_streaming = True  # las métricas se registran al terminar el stream
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+def paginated_response(rows, next_cursor):
+    """Serializa la página; el cursor siguiente viaja en la cabecera X-Next-Cursor."""
+    response = app.response_class(post_tuples_to_json(rows), mimetype='application/json')
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response, 200
+
+def batch_response(body, missing):
+    """Respuesta de una lectura por lotes; los ids que no existen viajan en la cabecera X-Missing-Ids."""
+    response = app.response_class(body, mimetype='application/json')
+    if missing:
+        response.headers['X-Missing-Ids'] = ",".join(map(str, missing))
+    return response, 200
+
+def batch_posts_response(ids):
+    """Resuelve varios posts con una sola consulta IN, en el orden de ids."""
+    cursor = get_db().cursor()
+    cursor.row_factory = None
+    placeholders = ", ".join("?" * len(ids))
+    rows = cursor.execute(f"SELECT {POST_LIST_COLUMNS} FROM posts p WHERE p.id IN ({placeholders})", ids).fetchall()
+    by_id = {row[0]: row for row in rows}
+    found = [by_id[post_id] for post_id in ids if post_id in by_id]
+    return batch_response(post_tuples_to_json(found), [post_id for post_id in ids if post_id not in by_id])
+
+def batch_users_response(ids):
+    """Resuelve varios usuarios con una sola consulta IN, en el orden de ids."""
+    cursor = get_db().cursor()
+    placeholders = ", ".join("?" * len(ids))
+    rows = cursor.execute(f"SELECT * FROM users WHERE id IN ({placeholders})", ids).fetchall()
+    by_id = {row['id']: row for row in rows}
+    found = [user_row_to_json(by_id[user_id]) for user_id in ids if user_id in by_id]
+    return batch_response(dumps(found), [user_id for user_id in ids if user_id not in by_id])
 
 def user_row_to_json(user_row):
     """Formatea la fila de usuario del DB a un objeto JSON compatible con GSON/Retrofit."""
@@ -125,7 +1689,8 @@ def post_row_to_json(post_row):
         "user_avatar": avatar_url,             
         "media_url": full_media_url, 
         "media_type": post_row['media_type'],
-        "created_at": post_row['created_at']
+        "created_at": format_timestamp(post_row['created_at']),
+        **variant_urls(full_media_url, post_row['media_type'])
     }
 
 
@@ -148,20 +1713,18 @@ def register():
     db = get_db()
     cursor = db.cursor()
     
-    password_hash = generate_password_hash(password)
-    
+    try:
+        password_hash = password_hasher.hash(password)
+    except PasswordPoolBusy:
+        return jsonify({"message": "Servidor ocupado, inténtalo de nuevo"}), 503, {"Retry-After": "1"}
+
     try:
         cursor.execute(
             "INSERT INTO users (name, username, email, passwordHash, bio, avatar_url) VALUES (?, ?, ?, ?, ?, ?)",
             (name, username, email, password_hash, "¡Hola! Soy nuevo aquí.", None)
         )
         db.commit()
-        user_id = cursor.lastrowid
-        
-        return jsonify({
-            "token": str(user_id), 
-            "user_id": user_id
-        }), 201
+        return token_response({"id": cursor.lastrowid, "email": email, "username": username}, 201)
 
     except sqlite3.IntegrityError:
         return jsonify({"message": "El email o nombre de usuario ya existe"}), 409
@@ -178,20 +1741,51 @@ def login():
     if not all([email, password]):
         return jsonify({"message": "Faltan campos requeridos"}), 400
 
+    account_key, ip_key = email.lower(), request.remote_addr
+    retry_after = max(account_login_limiter.retry_after(account_key), ip_login_limiter.retry_after(ip_key))
+    if retry_after:
+        return jsonify({"message": "Demasiados intentos fallidos"}), 429, {"Retry-After": str(retry_after)}
+
     db = get_db()
     cursor = db.cursor()
     cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
     user = cursor.fetchone()
 
-    if user and check_password_hash(user['passwordHash'], password):
-        user_id = user['id']
-        return jsonify({
-            "token": str(user_id),
-            "user_id": user_id
-        }), 200
+    try:
+        valid = user is not None and password_hasher.verify(user['passwordHash'], password)
+        if valid and password_hasher.needs_rehash(user['passwordHash']):
+            # Cambió PASSWORD_HASH_METHOD: se aprovecha que tenemos la contraseña en claro
+            cursor.execute(
+                "UPDATE users SET passwordHash = ? WHERE id = ? AND passwordHash = ?",
+                (password_hasher.hash(password), user['id'], user['passwordHash'])
+            )
+            db.commit()
+    except PasswordPoolBusy:
+        return jsonify({"message": "Servidor ocupado, inténtalo de nuevo"}), 503, {"Retry-After": "1"}
+
+    if valid:
+        account_login_limiter.reset(account_key)
+        return token_response(user, 200)
     else:
+        account_login_limiter.record_failure(account_key)
+        ip_login_limiter.record_failure(ip_key)
         return jsonify({"message": "Credenciales inválidas"}), 401
 
+@app.route('/auth/refresh', methods=['POST'])
+def refresh_token():
+    """POST /auth/refresh: Cambia un refresh_token válido por tokens nuevos (con el perfil actual)."""
+    data = request.get_json(silent=True) or {}
+    claims = decode_token(data.get('refresh_token') or '', 'refresh')
+    if claims is None:
+        return jsonify({"message": "Token de refresco inválido"}), 401
+
+    cursor = get_db().cursor()
+    cursor.execute("SELECT * FROM users WHERE id = ?", (int(claims['user_id']),))
+    user = cursor.fetchone()
+    if user is None:
+        return jsonify({"message": "Token de refresco inválido"}), 401
+    return token_response(user, 200)
+
 
 # ----------------------------------------------------
 # RUTAS DE USUARIOS (USERS)
@@ -205,8 +1799,13 @@ def get_me():
     
     if not current_user:
         return jsonify({"message": "No autorizado"}), 401
-    
-    return jsonify(user_row_to_json(current_user)), 200
+
+    cursor = get_db().cursor()
+    cursor.execute("SELECT * FROM users WHERE id = ?", (current_user['id'],))
+    user = cursor.fetchone()
+    if user is None:
+        return jsonify({"message": "No autorizado"}), 401
+    return jsonify(user_row_to_json(user)), 200
 
 @app.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
@@ -215,14 +1814,44 @@ def get_user(user_id):
     if not get_user_from_token(auth_header):
         return jsonify({"message": "No autorizado"}), 401
     
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
-    
-    if user:
-        return jsonify(user_row_to_json(user)), 200
-    return jsonify({"message": "Usuario no encontrado"}), 404
+    def build(tags):
+        db = get_db()
+        cursor = db.cursor()
+        cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        user = cursor.fetchone()
+        
+        if user:
+            return jsonify(user_row_to_json(user)), 200
+        return jsonify({"message": "Usuario no encontrado"}), 404
+
+    return cached_json([f"user:{user_id}"], build)
+
+@app.route('/users', methods=['GET'])
+def get_users():
+    """GET /users?ids=1,2,3: Varios usuarios en una petición (ver batch_users_response)."""
+    auth_header = request.headers.get('Authorization')
+    if not get_user_from_token(auth_header):
+        return jsonify({"message": "No autorizado"}), 401
+
+    try:
+        ids = parse_batch_ids(request.args.get('ids', ''))
+    except ValueError:
+        return jsonify({"message": f"Parámetro ids inválido (máximo {MAX_BATCH_IDS})"}), 400
+    return batch_users_response(ids)
+
+@app.route('/users/batch', methods=['POST'])
+def get_users_batch():
+    """POST /users/batch: Igual que GET /users?ids= con el cuerpo JSON {"ids": [...]}."""
+    auth_header = request.headers.get('Authorization')
+    if not get_user_from_token(auth_header):
+        return jsonify({"message": "No autorizado"}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = parse_batch_ids(data.get('ids'))
+    except (TypeError, ValueError):
+        return jsonify({"message": f"Campo ids inválido (máximo {MAX_BATCH_IDS})"}), 400
+    return batch_users_response(ids)
 
 @app.route('/users/me', methods=['PUT'])
 def update_profile():
@@ -242,8 +1871,10 @@ def update_profile():
         if new_bio is None:
             return jsonify({"message": "Falta el campo 'bio'"}), 400
             
+        # La bio no forma parte de la copia del autor en los posts: no hace falta refresh_author
         cursor.execute("UPDATE users SET bio = ? WHERE id = ?", (new_bio, current_user['id']))
         db.commit()
+        response_cache.invalidate(f"user:{current_user['id']}")
         
         cursor.execute("SELECT * FROM users WHERE id = ?", (current_user['id'],))
         updated_user = cursor.fetchone()
@@ -272,17 +1903,29 @@ def update_avatar():
         
     if file and allowed_file(file.filename):
         try:
-            filename = save_file(file)
-            
             db = get_db()
             cursor = db.cursor()
-            cursor.execute("UPDATE users SET avatar_url = ? WHERE id = ?", (filename, current_user['id']))
-            db.commit()
+
+            with staged_upload(file) as (path, size):
+                # Lock de escritura antes de leer el avatar actual: dos subidas a la vez no liberan el mismo archivo
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("SELECT avatar_url FROM users WHERE id = ?", (current_user['id'],))
+                old_avatar = cursor.fetchone()['avatar_url']
+                cursor.execute("UPDATE users SET avatar_url = ? WHERE id = ?", (path, current_user['id']))
+                add_media_ref(cursor, path, size)
+                release_media_ref(cursor, old_avatar)
+                # refresh_author invalida feed y author al terminar si algún post cambió
+                job_queue.enqueue(cursor, 'refresh_author', {"user_id": current_user['id']})
+                schedule_variants(cursor, path)
+                db.commit()
+            response_cache.invalidate(f"user:{current_user['id']}")
             
             cursor.execute("SELECT * FROM users WHERE id = ?", (current_user['id'],))
             updated_user = cursor.fetchone()
             
             return jsonify(user_row_to_json(updated_user)), 200
+        except UploadTooLarge:
+            return jsonify({"message": "El archivo es demasiado grande"}), 413
         except Exception as e:
             return jsonify({"message": f"Error al subir avatar: {e}"}), 500
     
@@ -295,50 +1938,79 @@ def update_avatar():
 
 @app.route('/posts', methods=['GET'])
 def get_posts():
-    """GET /posts: Obtiene todos los posts."""
+    """GET /posts: Obtiene los posts (paginación opcional con ?limit=&before=<created_at,id>).
+
+    ?since= y ?until= (epoch ms) acotan el rango de created_at; con ?ids=1,2,3
+    devuelve solo esos posts (ver batch_posts_response).
+    """
     auth_header = request.headers.get('Authorization')
     if not get_user_from_token(auth_header):
         return jsonify({"message": "No autorizado"}), 401
+
+    if 'ids' in request.args:
+        try:
+            ids = parse_batch_ids(request.args['ids'])
+        except ValueError:
+            return jsonify({"message": f"Parámetro ids inválido (máximo {MAX_BATCH_IDS})"}), 400
+        return batch_posts_response(ids)
+
+    try:
+        limit, before = parse_page_args(request.args)
+        where, params = time_range_conditions(request.args, "p.created_at")
+    except ValueError:
+        return jsonify({"message": "Parámetros de paginación inválidos"}), 400
+
+    if limit is None:
+        # Sin paginar se transmite en streaming y no se cachea: el cuerpo crece con la tabla
+        return streamed_posts_response(where, params)
     
-    db = get_db()
-    cursor = db.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            p.*, 
-            u.username, 
-            u.avatar_url AS user_avatar 
-        FROM posts p
-        JOIN users u ON p.user_id = u.id
-        ORDER BY p.created_at DESC
-    """)
-    
-    posts = [post_row_to_json(row) for row in cursor.fetchall()]
+    def build(tags):
+        db = get_db()
+        cursor = db.cursor()
+        rows, next_cursor = fetch_post_page(cursor, where, params, limit, before)
+        return paginated_response(rows, next_cursor)
     
-    return jsonify(posts), 200
+    return cached_json(['feed'], build)
+
+@app.route('/posts/batch', methods=['POST'])
+def get_posts_batch():
+    """POST /posts/batch: Igual que GET /posts?ids= con el cuerpo JSON {"ids": [...]}."""
+    auth_header = request.headers.get('Authorization')
+    if not get_user_from_token(auth_header):
+        return jsonify({"message": "No autorizado"}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        ids = parse_batch_ids(data.get('ids'))
+    except (TypeError, ValueError):
+        return jsonify({"message": f"Campo ids inválido (máximo {MAX_BATCH_IDS})"}), 400
+    return batch_posts_response(ids)
 
 @app.route('/users/<int:user_id>/posts', methods=['GET'])
 def get_user_posts(user_id):
-    """GET /users/{id}/posts: Obtiene los posts de un usuario específico."""
+    """GET /users/{id}/posts: Obtiene los posts de un usuario específico (mismo contrato de paginación que /posts)."""
     auth_header = request.headers.get('Authorization')
     if not get_user_from_token(auth_header):
         return jsonify({"message": "No autorizado"}), 401
+
+    try:
+        limit, before = parse_page_args(request.args)
+        where, params = time_range_conditions(request.args, "p.created_at")
+    except ValueError:
+        return jsonify({"message": "Parámetros de paginación inválidos"}), 400
+    where, params = ["p.user_id = ?", *where], [user_id, *params]
+
+    if limit is None:
+        # Sin paginar se transmite en streaming y no se cachea: el cuerpo crece con la tabla
+        return streamed_posts_response(where, params)
     
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("""
-        SELECT 
-            p.*, 
-            u.username, 
-            u.avatar_url AS user_avatar 
-        FROM posts p
-        JOIN users u ON p.user_id = u.id
-        WHERE p.user_id = ? 
-        ORDER BY p.created_at DESC
-    """, (user_id,))    
-    posts = [post_row_to_json(row) for row in cursor.fetchall()]
+    def build(tags):
+        db = get_db()
+        cursor = db.cursor()
+        rows, next_cursor = fetch_post_page(cursor, where, params, limit, before)
+        return paginated_response(rows, next_cursor)
     
-    return jsonify(posts), 200
+    return cached_json([f"author:{user_id}"], build)
 
 @app.route('/posts/<int:post_id>', methods=['GET'])
 def get_post_by_id(post_id):
@@ -347,25 +2019,21 @@ def get_post_by_id(post_id):
     if not get_user_from_token(auth_header):
         return jsonify({"message": "No autorizado"}), 401
     
-    db = get_db()
-    cursor = db.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            p.*, 
-            u.username, 
-            u.avatar_url AS user_avatar 
-        FROM posts p
-        JOIN users u ON p.user_id = u.id
-        WHERE p.id = ?
-    """, (post_id,))
-    
-    post = cursor.fetchone()
-    
-    if not post:
-        return jsonify({"message": "Post no encontrado"}), 404
+    def build(tags):
+        db = get_db()
+        cursor = db.cursor()
         
-    return jsonify(post_row_to_json(post)), 200
+        cursor.execute(f"{POST_DETAIL_SELECT} WHERE p.id = ?", (post_id,))
+        
+        post = cursor.fetchone()
+        
+        if not post:
+            return jsonify({"message": "Post no encontrado"}), 404
+
+        tags.append(f"author:{post['user_id']}")
+        return jsonify(post_row_to_json(post)), 200
+
+    return cached_json([f"post:{post_id}"], build)
 
 
 @app.route('/posts', methods=['POST'])
@@ -388,35 +2056,33 @@ def create_post():
 
     if file and allowed_file(file.filename):
         try:
-            filename = save_file(file)
-            extension = filename.rsplit('.', 1)[1].lower()
+            extension = file.filename.rsplit('.', 1)[1].lower()
             media_type = 'image' if extension in ['png', 'jpg', 'jpeg', 'gif'] else 'video'
-            created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            created_at = now_ms()
             
             db = get_db()
             cursor = db.cursor()
             
-            cursor.execute(
-                "INSERT INTO posts (user_id, description, media_url, media_type, created_at) VALUES (?, ?, ?, ?, ?)",
-                (current_user['id'], description, filename, media_type, created_at)
-            )
-            db.commit()
-            post_id = cursor.lastrowid
-            
-            cursor.execute("""
-                SELECT
-                    p.*,
-                    u.username,
-                    u.avatar_url AS user_avatar
-                FROM posts p
-                JOIN users u ON p.user_id = u.id
-                WHERE p.id = ?
-            """, (post_id,))
-            
-            new_post = cursor.fetchone()
+            with staged_upload(file) as (path, size):
+                # El autor se copia de users dentro de la misma transacción, no de los claims del token (pueden estar desfasados)
+                # RETURNING: la respuesta sale del propio INSERT, sin volver a consultar
+                cursor.execute("""
+                    INSERT INTO posts (user_id, description, media_url, media_type, created_at, author_username, author_avatar_url)
+                    SELECT id, ?, ?, ?, ?, username, avatar_url FROM users WHERE id = ?
+                    RETURNING *, author_username AS username, author_avatar_url AS user_avatar
+                """, (description, path, media_type, created_at, current_user['id']))
+                new_post = cursor.fetchone()
+                add_media_ref(cursor, path, size)
+                # Efectos secundarios: se confirman junto con el post y se ejecutan fuera de la petición
+                job_queue.enqueue(cursor, 'fan_out_post', {"post_id": new_post['id']}, key=f"fan_out_post:{new_post['id']}")
+                schedule_variants(cursor, path)
+                db.commit()
+            response_cache.invalidate('feed', f"author:{current_user['id']}")
             
             return jsonify(post_row_to_json(new_post)), 201
             
+        except UploadTooLarge:
+            return jsonify({"message": "El archivo es demasiado grande"}), 413
         except Exception as e:
             return jsonify({"message": f"Error al crear post: {e}"}), 500
     
@@ -434,7 +2100,7 @@ def delete_post(post_id):
     db = get_db()
     cursor = db.cursor()
     
-    cursor.execute("SELECT user_id FROM posts WHERE id = ?", (post_id,))
+    cursor.execute("SELECT user_id, media_url FROM posts WHERE id = ?", (post_id,))
     post = cursor.fetchone()
     
     if not post:
@@ -445,7 +2111,10 @@ def delete_post(post_id):
         
     try:
         cursor.execute("DELETE FROM posts WHERE id = ?", (post_id,))
+        cursor.execute("DELETE FROM timeline WHERE post_id = ?", (post_id,))
+        release_media_ref(cursor, post['media_url'])
         db.commit()
+        response_cache.invalidate('feed', f"author:{current_user['id']}", f"post:{post_id}")
         
         return '', 204
         
@@ -481,16 +2150,9 @@ def update_post(post_id):
             
         cursor.execute("UPDATE posts SET description = ? WHERE id = ?", (new_description, post_id))
         db.commit()
+        response_cache.invalidate('feed', f"author:{current_user['id']}", f"post:{post_id}")
         
-        cursor.execute("""
-            SELECT 
-                p.*, 
-                u.username, 
-                u.avatar_url AS user_avatar 
-            FROM posts p
-            JOIN users u ON p.user_id = u.id
-            WHERE p.id = ?
-        """, (post_id,))
+        cursor.execute(f"{POST_DETAIL_SELECT} WHERE p.id = ?", (post_id,))
         updated_post = cursor.fetchone()
         
         return jsonify(post_row_to_json(updated_post)), 200
@@ -499,20 +2161,347 @@ def update_post(post_id):
         return jsonify({"message": f"Error al actualizar post: {e}"}), 500
 
 
+@app.route('/feed/home', methods=['GET'])
+def get_home_feed():
+    """GET /feed/home: Posts propios y de las cuentas seguidas (siempre paginado con ?limit=&before=;
+    admite ?since=&until= como /posts).
+
+    Lee una página de la timeline materializada y la mezcla con los últimos
+    posts de las cuentas seguidas que superan FANOUT_ON_READ_THRESHOLD.
+    """
+    auth_header = request.headers.get('Authorization')
+    current_user = get_user_from_token(auth_header)
+    if not current_user:
+        return jsonify({"message": "No autorizado"}), 401
+
+    try:
+        limit, before = parse_page_args(request.args)
+        timeline_range = time_range_conditions(request.args, "t.created_at")
+        pulled_range = time_range_conditions(request.args, "p.created_at")
+    except ValueError:
+        return jsonify({"message": "Parámetros de paginación inválidos"}), 400
+    limit = limit or MAX_PAGE_SIZE
+
+    db = get_db()
+    cursor = db.cursor()
+    cursor.row_factory = None
+
+    sql = f"""
+        SELECT {POST_LIST_COLUMNS}
+        FROM timeline t
+        JOIN posts p ON p.id = t.post_id
+        WHERE t.user_id = ?
+    """
+    params = [current_user['id']]
+    for condition in timeline_range[0]:
+        sql += f" AND {condition}"
+    params.extend(timeline_range[1])
+    if before is not None:
+        sql += " AND (t.created_at, t.post_id) < (?, ?)"
+        params.extend(before)
+    sql += " ORDER BY t.created_at DESC, t.post_id DESC LIMIT ?"
+    params.append(limit)
+    rows = cursor.execute(sql, params).fetchall()
+
+    cursor.execute("""
+        SELECT f.followee_id FROM follows f JOIN users u ON u.id = f.followee_id
+        WHERE f.follower_id = ? AND u.follower_count > ?
+    """, (current_user['id'], FANOUT_ON_READ_THRESHOLD))
+    pulled_ids = [row[0] for row in cursor.fetchall()]
+    if pulled_ids:
+        placeholders = ", ".join("?" * len(pulled_ids))
+        pulled_rows, _ = fetch_post_page(cursor, [f"p.user_id IN ({placeholders})", *pulled_range[0]],
+                                         [*pulled_ids, *pulled_range[1]], limit, before)
+        rows = merge_post_rows(rows, pulled_rows, limit=limit)
+
+    next_cursor = f"{rows[-1][5]},{rows[-1][0]}" if len(rows) == limit else None
+    return paginated_response(rows, next_cursor)
+
+@app.route('/users/<int:user_id>/follow', methods=['POST', 'DELETE'])
+def follow_user(user_id):
+    """POST/DELETE /users/{id}/follow: Empieza o deja de seguir a un usuario."""
+    auth_header = request.headers.get('Authorization')
+    current_user = get_user_from_token(auth_header)
+    if not current_user:
+        return jsonify({"message": "No autorizado"}), 401
+    if user_id == current_user['id']:
+        return jsonify({"message": "No puedes seguirte a ti mismo"}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute("SELECT id FROM users WHERE id = ?", (user_id,))
+    if cursor.fetchone() is None:
+        return jsonify({"message": "Usuario no encontrado"}), 404
+
+    try:
+        if request.method == 'POST':
+            cursor.execute(
+                "INSERT OR IGNORE INTO follows (follower_id, followee_id, created_at) VALUES (?, ?, ?)",
+                (current_user['id'], user_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            if cursor.rowcount:
+                cursor.execute("UPDATE users SET follower_count = follower_count + 1 WHERE id = ?", (user_id,))
+                job_queue.enqueue(cursor, 'backfill_timeline', {"follower_id": current_user['id'], "followee_id": user_id})
+            db.commit()
+        else:
+            cursor.execute("DELETE FROM follows WHERE follower_id = ? AND followee_id = ?", (current_user['id'], user_id))
+            if cursor.rowcount:
+                cursor.execute("UPDATE users SET follower_count = follower_count - 1 WHERE id = ?", (user_id,))
+            cursor.execute("DELETE FROM timeline WHERE user_id = ? AND author_id = ?", (current_user['id'], user_id))
+            db.commit()
+        return '', 204
+    except Exception as e:
+        return jsonify({"message": f"Error al actualizar seguimiento: {e}"}), 500
+
+@app.route('/search', methods=['GET'])
+def search():
+    """GET /search?q=&type=posts|users: Búsqueda de texto completo ordenada por relevancia (bm25).
+
+    Pagina con ?limit=&offset=; el offset siguiente viaja en la cabecera X-Next-Cursor.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not get_user_from_token(auth_header):
+        return jsonify({"message": "No autorizado"}), 401
+
+    terms = search_terms(request.args.get('q', ''))
+    kind = request.args.get('type', 'posts')
+    if not terms or kind not in ('posts', 'users'):
+        return jsonify({"message": "Se requiere q y type debe ser posts o users"}), 400
+    try:
+        limit = min(int(request.args.get('limit', MAX_PAGE_SIZE)), MAX_PAGE_SIZE)
+        offset = int(request.args.get('offset', 0))
+    except ValueError:
+        return jsonify({"message": "Parámetros de paginación inválidos"}), 400
+    if limit < 1 or not 0 <= offset <= SEARCH_MAX_OFFSET:
+        return jsonify({"message": "Parámetros de paginación inválidos"}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+    params = (fts_match_query(terms), limit, offset)
+    if kind == 'posts':
+        cursor.row_factory = None
+        rows = cursor.execute(f"""
+            SELECT {POST_LIST_COLUMNS} FROM posts_fts
+            JOIN posts p ON p.id = posts_fts.rowid
+            WHERE posts_fts MATCH ?
+            ORDER BY posts_fts.rank, p.id DESC LIMIT ? OFFSET ?
+        """, params).fetchall()
+        body = post_tuples_to_json(rows)
+    else:
+        rows = cursor.execute("""
+            SELECT u.* FROM users_fts
+            JOIN users u ON u.id = users_fts.rowid
+            WHERE users_fts MATCH ?
+            ORDER BY users_fts.rank, u.id LIMIT ? OFFSET ?
+        """, params).fetchall()
+        body = dumps([user_row_to_json(row) for row in rows])
+
+    response = app.response_class(body, mimetype='application/json')
+    if len(rows) == limit and offset + limit <= SEARCH_MAX_OFFSET:
+        response.headers['X-Next-Cursor'] = str(offset + limit)
+    return response, 200
+
+# ----------------------------------------------------
+# SINCRONIZACIÓN INCREMENTAL
+# ----------------------------------------------------
+
+@app.route('/sync', methods=['GET'])
+def sync():
+    """GET /sync?since=<versión>: Posts y perfiles cambiados después de esa versión (ver migrate_change_log).
+
+    Devuelve {version, has_more, posts, deleted_post_ids, users, deleted_user_ids}
+    con como mucho ?limit= cambios (SYNC_MAX_CHANGES); el cliente guarda version
+    y repite con ella mientras has_more sea true. since=0 es la sincronización
+    completa. Un cambio de perfil también afecta a username/user_avatar de los
+    posts de ese usuario que el cliente tenga guardados.
+    """
+    auth_header = request.headers.get('Authorization')
+    if not get_user_from_token(auth_header):
+        return jsonify({"message": "No autorizado"}), 401
+
+    try:
+        since = int(request.args.get('since', 0))
+        limit = min(int(request.args.get('limit', SYNC_MAX_CHANGES)), SYNC_MAX_CHANGES)
+    except ValueError:
+        return jsonify({"message": "Parámetros since/limit inválidos"}), 400
+    if since < 0 or limit < 1:
+        return jsonify({"message": "Parámetros since/limit inválidos"}), 400
+
+    db = get_db()
+    cursor = db.cursor()
+    cursor.row_factory = None
+    changes = cursor.execute(
+        "SELECT version, entity, entity_id, deleted FROM change_log WHERE version > ? ORDER BY version LIMIT ?",
+        (since, limit + 1)
+    ).fetchall()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    post_ids = [entity_id for _, entity, entity_id, deleted in changes if entity == 'post' and not deleted]
+    user_ids = [entity_id for _, entity, entity_id, deleted in changes if entity == 'user' and not deleted]
+    # Una fila borrada después de leer el registro se omite: su lápida llega con una versión posterior
+    posts = []
+    if post_ids:
+        placeholders = ", ".join("?" * len(post_ids))
+        posts = cursor.execute(f"SELECT {POST_LIST_COLUMNS} FROM posts p WHERE p.id IN ({placeholders})", post_ids).fetchall()
+    users = []
+    if user_ids:
+        placeholders = ", ".join("?" * len(user_ids))
+        users = db.cursor().execute(f"SELECT * FROM users WHERE id IN ({placeholders})", user_ids).fetchall()
+
+    body = dumps({
+        "version": changes[-1][0] if changes else since,
+        "has_more": has_more,
+        "posts": post_tuples_to_dicts(posts),
+        "deleted_post_ids": [entity_id for _, entity, entity_id, deleted in changes if entity == 'post' and deleted],
+        "users": [user_row_to_json(row) for row in users],
+        "deleted_user_ids": [entity_id for _, entity, entity_id, deleted in changes if entity == 'user' and deleted],
+    })
+    return app.response_class(body, mimetype='application/json'), 200
+
+
+@app.route('/jobs/stats', methods=['GET'])
+def jobs_stats():
+    """GET /jobs/stats: Trabajos de la cola por estado (pending, running, done, failed)."""
+    auth_header = request.headers.get('Authorization')
+    if not get_user_from_token(auth_header):
+        return jsonify({"message": "No autorizado"}), 401
+    return jsonify(job_queue.stats()), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """GET /metrics: Métricas en formato de texto de Prometheus (sin autenticación, para el scraper)."""
+    return app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow-requests', methods=['GET'])
+def slow_requests():
+    """GET /metrics/slow-requests: Últimas peticiones lentas con sus pilas muestreadas (PROFILE_SLOW_REQUEST_MS)."""
+    auth_header = request.headers.get('Authorization')
+    if not get_user_from_token(auth_header):
+        return jsonify({"message": "No autorizado"}), 401
+    return jsonify({"enabled": profiler.enabled, "requests": list(profiler.slow_requests)}), 200
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """GET /cache/stats: Aciertos/fallos de la caché de respuestas."""
+    auth_header = request.headers.get('Authorization')
+    if not get_user_from_token(auth_header):
+        return jsonify({"message": "No autorizado"}), 401
+    return jsonify(response_cache.stats()), 200
+
+
 # ----------------------------------------------------
 # RUTA PARA SERVIR ARCHIVOS SUBIDOS
 # ----------------------------------------------------
 
-@app.route('/uploads/<filename>')
+def send_media(path, immutable):
+    """Respuesta de un archivo de uploads/ con cabeceras de caché.
+
+    Los archivos con nombre por hash o UUID son inmutables: Cache-Control de un
+    año con 'immutable' y, si el nombre es un hash, ETag fuerte derivado de él.
+    send_from_directory ya resuelve 304 (If-None-Match/If-Modified-Since) y
+    peticiones Range (206) para poder saltar dentro de los videos.
+    """
+    match = HASHED_MEDIA_NAME.match(path)
+    etag = match.group(1) if match else True
+    max_age = MEDIA_MAX_AGE if immutable else MEDIA_FALLBACK_MAX_AGE
+
+    if X_ACCEL_REDIRECT_PREFIX:
+        # nginx sirve el archivo (Range, sendfile); aquí sólo validamos la ruta
+        full_path = safe_join(app.config['UPLOAD_FOLDER'], path)
+        if full_path is None or not os.path.isfile(full_path):
+            abort(404)
+        response = app.response_class()
+        response.headers['X-Accel-Redirect'] = X_ACCEL_REDIRECT_PREFIX + path
+        if match:
+            response.set_etag(etag)
+    else:
+        response = send_from_directory(app.config['UPLOAD_FOLDER'], path, etag=etag, max_age=max_age)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = immutable
+    return response
+
+@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """Sirve archivos estáticos (imágenes/videos) desde la carpeta 'uploads'."""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Sirve archivos estáticos (imágenes/videos) desde la carpeta 'uploads'.
+
+    Con ?variant=thumb|feed|full sirve la versión redimensionada si ya se generó;
+    mientras no exista se sirve el original con una caché corta.
+    """
+    immutable = bool(HASHED_MEDIA_NAME.match(filename) or UUID_MEDIA_NAME.match(filename))
+    variant = request.args.get('variant')
+    if variant in VARIANT_SIZES:
+        for extension in ('webp', 'jpg'):
+            candidate = variant_file(filename, variant, extension)
+            if os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], candidate)):
+                return send_media(candidate, immutable)
+        return send_media(filename, immutable=False)
+    return send_media(filename, immutable)
 
 
 # ----------------------------------------------------
 # EJECUCIÓN DEL SERVIDOR
 # ----------------------------------------------------
 
+def serve(bind, workers, threads, worker_class):
+    """Sirve la app con gunicorn: un maestro y workers procesos hijos que cargan api_server_fixed:app.
+
+    El esquema ya lo creó este proceso al importarse, así que los hijos arrancan
+    con INIT_DB_ON_IMPORT=0. Los hijos importan el módulo por su cuenta (sin
+    preload), de modo que kill -HUP al maestro los sustituye de forma gradual
+    por otros con el código nuevo; SIGTERM espera hasta WEB_GRACEFUL_TIMEOUT a
+    que terminen las peticiones en curso. Los hilos de la cola de trabajos, el
+    pool de contraseñas y el profiler se arrancan dentro de cada hijo.
+
+    Los límites de login y las métricas de /metrics son por proceso.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+        from gunicorn.util import import_app
+    except ImportError:
+        sys.exit("El modo de producción necesita gunicorn (pip install gunicorn); usa --dev para el servidor de desarrollo")
+
+    os.environ['INIT_DB_ON_IMPORT'] = '0'
+    if workers > 1 and RESPONSE_CACHE_URL == 'memory':
+        app.logger.warning("Con varios procesos la caché en memoria no se comparte: se desactiva (usa RESPONSE_CACHE_URL=redis://...)")
+        os.environ['RESPONSE_CACHE_URL'] = 'none'
+
+    options = {
+        'bind': bind,
+        'workers': workers,
+        'worker_class': worker_class,
+        'threads': threads,
+        'keepalive': WEB_KEEPALIVE,
+        'timeout': WEB_TIMEOUT,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        'max_requests': WEB_MAX_REQUESTS,
+        'max_requests_jitter': WEB_MAX_REQUESTS // 10,
+        'accesslog': '-',
+    }
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return import_app('api_server_fixed:app')
+
+    Server().run()
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor Flask de la red social")
+    parser.add_argument('--dev', action='store_true', help="servidor de desarrollo de Flask (un proceso, debug y recarga)")
+    parser.add_argument('--bind', default=WEB_BIND)
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS)
+    parser.add_argument('--threads', type=int, default=WEB_THREADS)
+    parser.add_argument('--worker-class', choices=('gthread', 'gevent'), default=WEB_WORKER_CLASS)
+    args = parser.parse_args()
+
     print(f"Servidor iniciado. Subidas guardadas en: {UPLOAD_FOLDER}/")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    if args.dev:
+        app.run(host='0.0.0.0', port=5000, debug=True)
+    else:
+        serve(args.bind, args.workers, args.threads, args.worker_class)
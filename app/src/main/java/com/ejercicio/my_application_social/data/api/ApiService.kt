@@ -13,6 +13,9 @@ interface ApiService {
     @POST("/auth/login")
     suspend fun login(@Body request: LoginRequest): Response<AuthResponse>
 
+    @POST("/auth/refresh")
+    suspend fun refresh(@Body request: RefreshRequest): Response<AuthResponse>
+
     @GET("/users/me")
     suspend fun getMe(@Header("Authorization") token: String): Response<User>
 
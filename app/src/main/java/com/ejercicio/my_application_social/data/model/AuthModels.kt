@@ -12,4 +12,5 @@ data class User(
 
 data class LoginRequest(val email: String, val password: String)
 data class RegisterRequest(val name: String, val username: String, val email: String, val password: String)
-data class AuthResponse(val token: String, val user_id: Int)
\ No newline at end of file
+data class AuthResponse(val token: String, val user_id: Int, val refresh_token: String? = null)
+data class RefreshRequest(val refresh_token: String)
\ No newline at end of file
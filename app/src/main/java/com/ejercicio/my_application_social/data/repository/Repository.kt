@@ -2,6 +2,7 @@ package com.ejercicio.my_application_social.data.repository
 
 import android.content.Context
 import androidx.datastore.preferences.core.edit
+import androidx.datastore.preferences.core.intPreferencesKey
 import androidx.datastore.preferences.core.stringPreferencesKey
 import androidx.datastore.preferences.preferencesDataStore
 import com.ejercicio.my_application_social.data.api.ApiService
@@ -15,6 +16,7 @@ import okhttp3.MediaType.Companion.toMediaTypeOrNull
 import okhttp3.MultipartBody
 import okhttp3.RequestBody.Companion.asRequestBody
 import okhttp3.RequestBody.Companion.toRequestBody
+import retrofit2.Response
 
 // 🚨 CORRECCIÓN: Quitamos las importaciones innecesarias o que causan conflicto en el helper del token
 import kotlinx.coroutines.flow.first
@@ -33,14 +35,21 @@ class Repository(
 ) {
 
     private val USER_TOKEN_KEY = stringPreferencesKey("auth_token")
+    private val REFRESH_TOKEN_KEY = stringPreferencesKey("refresh_token")
+    private val USER_ID_KEY = intPreferencesKey("user_id")
 
     // --- UTILS DE SESIÓN (DataStore) ---
 
     val currentAuthToken: Flow<String?> = context.dataStore.data.map { it[USER_TOKEN_KEY] }
 
-    suspend fun saveSession(token: String) {
+    // El token es un JWT: el id del usuario se guarda aparte, tal como llega en la respuesta de login
+    val currentUserId: Flow<Int?> = context.dataStore.data.map { it[USER_ID_KEY] }
+
+    suspend fun saveSession(auth: AuthResponse) {
         context.dataStore.edit {
-            it[USER_TOKEN_KEY] = token
+            it[USER_TOKEN_KEY] = auth.token
+            it[USER_ID_KEY] = auth.user_id
+            auth.refresh_token?.let { refresh -> it[REFRESH_TOKEN_KEY] = refresh }
         }
     }
 
@@ -56,6 +65,25 @@ class Repository(
         return "Bearer $token"
     }
 
+    // Pide tokens nuevos con el refresh token; si no hay o ya no vale, cierra la sesión (vuelve al login)
+    private suspend fun refreshSession(): Boolean {
+        val refreshToken = context.dataStore.data.first()[REFRESH_TOKEN_KEY]
+        val authResponse = refreshToken?.let { apiService.refresh(RefreshRequest(it)).body() }
+        if (authResponse == null) {
+            clearSession()
+            return false
+        }
+        saveSession(authResponse)
+        return true
+    }
+
+    // Ejecuta la llamada con el token actual; ante un 401 (token caducado) refresca la sesión y la repite una vez
+    private suspend fun <T> authorized(call: suspend (String) -> Response<T>): Response<T> {
+        val response = call(createBearerToken())
+        if (response.code() != 401 || !refreshSession()) return response
+        return call(createBearerToken())
+    }
+
     // =================================================================
     // AUTHENTICATION (AUTH)
     // =================================================================
@@ -65,7 +93,7 @@ class Repository(
             val response = apiService.login(request)
             //CORRECCIÓN: Si el servidor devuelve 200/201, extraemos el body. Si es null, es un error.
             val authResponse = response.body() ?: throw IllegalStateException("Respuesta de login vacía")
-            saveSession(authResponse.token)
+            saveSession(authResponse)
             Result.success(authResponse)
         } catch (e: Exception) {
             Result.failure(e)
@@ -76,7 +104,7 @@ class Repository(
         return try {
             val response = apiService.register(request)
             val authResponse = response.body() ?: throw IllegalStateException("Respuesta de registro vacía")
-            saveSession(authResponse.token)
+            saveSession(authResponse)
             Result.success(authResponse)
         } catch (e: Exception) {
             Result.failure(e)
@@ -88,9 +116,8 @@ class Repository(
     // =================================================================
 
     suspend fun getMe(): User? {
-        val tokenHeader = createBearerToken()
         // 🚨 CORRECCIÓN: Extraemos el cuerpo de la respuesta o devolvemos null
-        return apiService.getMe(tokenHeader).body()
+        return authorized { apiService.getMe(it) }.body()
     }
 
     // =================================================================
@@ -98,42 +125,35 @@ class Repository(
     // =================================================================
 
     suspend fun getAllPosts(): List<Post> {
-        val tokenHeader = createBearerToken()
         // 🚨 CORRECCIÓN: Extraemos el cuerpo o devolvemos lista vacía
-        return apiService.getPosts(tokenHeader).body() ?: emptyList()
+        return authorized { apiService.getPosts(it) }.body() ?: emptyList()
     }
 
     suspend fun getUserPosts(userId: Int): List<Post> {
-        val tokenHeader = createBearerToken()
-        return apiService.getPostsByUser(tokenHeader, userId).body() ?: emptyList()
+        return authorized { apiService.getPostsByUser(it, userId) }.body() ?: emptyList()
     }
 
     suspend fun createPost(desc: String, file: File): Post? {
-        val tokenHeader = createBearerToken()
-
         val descriptionPart = desc.toRequestBody("text/plain".toMediaTypeOrNull())
         val mediaType = file.extension.toMediaTypeOrNull() ?: "image/jpeg".toMediaTypeOrNull()
         val requestFile = file.asRequestBody(mediaType)
         val filePart = MultipartBody.Part.createFormData("file", file.name, requestFile)
 
-        return apiService.createPost(tokenHeader, descriptionPart, filePart).body()
+        return authorized { apiService.createPost(it, descriptionPart, filePart) }.body()
     }
 
     suspend fun updatePostDescription(postId: Int, description: String): Post? {
-        val tokenHeader = createBearerToken()
         val descriptionPart = description.toRequestBody("text/plain".toMediaTypeOrNull())
 
-        return apiService.updatePost(tokenHeader, postId, descriptionPart).body()
+        return authorized { apiService.updatePost(it, postId, descriptionPart) }.body()
     }
 
     suspend fun deletePost(postId: Int) {
-        val tokenHeader = createBearerToken()
         // No necesita .body() porque Retrofit lo maneja como Response<Unit>
-        apiService.deletePost(tokenHeader, postId)
+        authorized { apiService.deletePost(it, postId) }
     }
     suspend fun getPostById(postId: Int): Post? {
-        val tokenHeader = createBearerToken()
         // Llama al nuevo método de ApiService y extrae el cuerpo
-        return apiService.getPostById(tokenHeader, postId).body()
+        return authorized { apiService.getPostById(it, postId) }.body()
     }
 }
\ No newline at end of file
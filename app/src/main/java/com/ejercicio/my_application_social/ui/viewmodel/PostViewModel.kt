@@ -56,8 +56,8 @@ class PostViewModel(private val repository: Repository) : ViewModel() {
         viewModelScope.launch {
             _state.value = PostState.Loading
             try {
-                val userIdStr = repository.currentAuthToken.first() ?: return@launch
-                val userId = userIdStr.toIntOrNull() ?: return@launch
+                val userId = repository.currentUserId.first()
+                    ?: throw IllegalStateException("Sesión sin id de usuario: vuelve a iniciar sesión")
                 val userPosts = repository.getUserPosts(userId)
                 _myPosts.value = userPosts
                 _state.value = PostState.Success
@@ -1,38 +1,82 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlmodel import Session
+from sqlalchemy.orm import make_transient_to_detached
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.cache import TTLCache
 from app.database import get_session
 from app.models import User
+from app.passwords import pwd_context
 import os
+import time
 
-SECRET_KEY = os.getenv("SECRET_KEY", "secret")
+SECRET_KEY = os.getenv("SECRET_KEY")
+if not SECRET_KEY:
+    # Sin valor por defecto: con una clave conocida cualquiera podría firmar tokens válidos
+    raise RuntimeError("Falta la variable de entorno SECRET_KEY (la misma que usa api_server_fixed.py)")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Mismo formato de token que api_server_fixed.py: sub (email), user_id, username y type
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
+# Usuarios autenticados por token. Se guardan copias "detached" del User para
+# reincorporarlas a la sesión de cada petición sin volver a consultar la BD.
+auth_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+def invalidate_auth_cache(user_id: int):
+    """Descarta los usuarios cacheados tras modificar su perfil o avatar."""
+    auth_cache.discard_where(lambda user: user.id == user_id)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None, token_type: str = "access"):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "type": token_type})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), session: Session = Depends(get_session)):
+def token_claims(user: User) -> dict:
+    return {"sub": user.email, "user_id": user.id, "username": user.username}
+
+def create_tokens(user: User) -> dict:
+    """Cuerpo de Token para register/login/refresh: acceso, refresco e id."""
+    return {
+        "access_token": create_access_token(token_claims(user)),
+        "refresh_token": create_access_token(
+            token_claims(user), timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), token_type="refresh"
+        ),
+        "token_type": "bearer",
+        "user_id": user.id,
+    }
+
+def decode_refresh_token(token: str) -> Optional[str]:
+    """Email (sub) de un refresh token válido, o None."""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub") if payload.get("type") == "refresh" else None
+
+async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_session)):
+    cached = auth_cache.get(token)
+    if cached is not None:
+        return await session.merge(cached, load=False)
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -41,13 +85,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme), session: Session
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
-        if email is None:
+        # Los tokens anteriores a los refresh tokens no llevan type: se tratan como de acceso
+        if email is None or payload.get("type", "access") != "access":
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    statement = User.email == email
-    user = session.query(User).filter(statement).first()
+    statement = select(User).where(User.email == email)
+    user = (await session.exec(statement)).first()
     if user is None:
         raise credentials_exception
-    return user
\ No newline at end of file
+
+    # La entrada nunca sobrevive a la expiración del propio token
+    snapshot = User(**user.dict())
+    make_transient_to_detached(snapshot)
+    auth_cache.set(token, snapshot, ttl=payload["exp"] - time.time())
+    return user
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import itertools
+import json
+import os
+import threading
+import time
+
+# Caché de respuestas de las lecturas calientes: "memory" (LRU local) o una URL redis://
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "memory")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+
+
+class TTLCache:
+    """Caché LRU acotada con expiración por entrada, segura entre hilos."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Guarda un valor; ttl permite acortar (nunca alargar) la expiración por defecto."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard_where(self, predicate: Callable[[Any], bool]):
+        """Elimina todas las entradas cuyo valor cumpla el predicado."""
+        with self._lock:
+            for key in [k for k, (v, _) in self._data.items() if predicate(v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class MemoryCacheBackend:
+    """Backend por defecto: LRU en memoria del proceso."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize, ttl)
+        self._clock = itertools.count(1)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return [self._entries.get(key) for key in keys]
+
+    async def set(self, key: str, value: Any):
+        self._entries.set(key, value)
+
+    async def next_version(self) -> int:
+        return next(self._clock)
+
+
+class RedisCacheBackend:
+    """Backend compartido entre procesos (Redis o compatible); requiere el paquete redis."""
+
+    name = "redis"
+
+    def __init__(self, url: str, ttl: float):
+        from redis import asyncio as aioredis
+        self._redis = aioredis.Redis.from_url(url)
+        self.ttl = int(ttl)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        return [json.loads(value) if value is not None else None for value in await self._redis.mget(keys)]
+
+    async def set(self, key: str, value: Any):
+        await self._redis.set(key, json.dumps(value), ex=self.ttl)
+
+    async def next_version(self) -> int:
+        return await self._redis.incr("respcache:clock")
+
+
+class ResponseCache:
+    """Caché de respuestas JSON por ruta y parámetros, invalidada por etiquetas.
+
+    Cada entrada guarda la versión de sus etiquetas ("feed", "author:3", "post:7",
+    "user:3") en el momento de construirse; invalidar una etiqueta le asigna una
+    versión nueva y todas las entradas que la usaban dejan de ser válidas.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def versions(self, tags: List[str]) -> Dict[str, Any]:
+        values = await self.backend.get_many([f"tag:{tag}" for tag in tags]) if tags else []
+        return dict(zip(tags, values))
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = (await self.backend.get_many([f"resp:{key}"]))[0]
+        if entry is not None and await self.versions(list(entry["tags"])) == entry["tags"]:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, versions: Dict[str, Any], body: str, headers: Dict[str, str]):
+        await self.backend.set(f"resp:{key}", {"tags": versions, "body": body, "headers": headers})
+
+    async def invalidate(self, *tags: str):
+        for tag in tags:
+            await self.backend.set(f"tag:{tag}", await self.backend.next_version())
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+def create_response_cache() -> ResponseCache:
+    if RESPONSE_CACHE_URL == "memory":
+        return ResponseCache(MemoryCacheBackend(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL))
+    return ResponseCache(RedisCacheBackend(RESPONSE_CACHE_URL, RESPONSE_CACHE_TTL))
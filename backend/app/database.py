@@ -1,13 +1,50 @@
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.migrations import run_migrations
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+# Parámetros del pool de conexiones (configurables por entorno)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
 
-def get_session():
-    with Session(engine) as session:
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def make_async_url(database_url: str):
+    """Traduce la URL síncrona (postgresql://, sqlite://) a su driver asíncrono."""
+    url = make_url(database_url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+def create_engine_from_env():
+    url = make_async_url(DATABASE_URL)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() != "sqlite":
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return create_async_engine(url, **options)
+
+engine = create_engine_from_env()
+
+# expire_on_commit=False: tras el commit los objetos siguen legibles sin lazy-load (no permitido en async)
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+async def get_session():
+    async with async_session() as session:
         yield session
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
\ No newline at end of file
+async def create_db_and_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(run_migrations)
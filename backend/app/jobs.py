@@ -0,0 +1,149 @@
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.database import async_session
+from app.models import JOB_DONE, JOB_PENDING, Job
+import asyncio
+import json
+import logging
+import os
+import time
+
+# Cola de trabajos persistente (tabla job) para los efectos secundarios de las escrituras
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))  # segundos antes de reintentar un trabajo cuyo worker murió
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(24 * 3600)))  # segundos que se conservan los trabajos terminados
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "10"))  # espera a los trabajos en curso al parar
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """Cola de trabajos persistente en la tabla job, atendida por tareas asyncio del propio proceso.
+
+    enqueue() inserta con la sesión de la petición, así el trabajo existe si y
+    sólo si el cambio que lo origina se confirma. Un trabajo en curso tiene un
+    plazo (JOB_LEASE): si el proceso muere, otro worker lo vuelve a tomar. Los
+    fallos se reintentan con espera exponencial hasta JOB_MAX_ATTEMPTS, y un
+    idempotency_key repetido no crea un segundo trabajo. Los manejadores deben
+    ser idempotentes, porque un trabajo puede ejecutarse más de una vez.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.handlers: Dict[str, Callable[..., Awaitable[None]]] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._next_cleanup = 0.0
+
+    def handler(self, kind: str):
+        """Decorador que registra la corrutina que ejecuta los trabajos de tipo kind."""
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    async def enqueue(self, session: AsyncSession, kind: str, payload: dict, key: Optional[str] = None):
+        """Añade un trabajo dentro de la transacción en curso (sin commit)."""
+        insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+        now = time.time()
+        await session.exec(
+            insert(Job)
+            .values(kind=kind, payload=json.dumps(payload), idempotency_key=key, run_at=now, created_at=now)
+            .on_conflict_do_nothing(index_elements=[Job.idempotency_key])
+        )
+        self._wakeup.set()
+
+    def start(self):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Deja terminar los trabajos en curso (hasta JOB_SHUTDOWN_TIMEOUT) y para los workers.
+
+        Un trabajo cortado a medias sigue en 'running' y se reintenta al vencer su plazo.
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=JOB_SHUTDOWN_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self):
+        while not self._stopping:
+            try:
+                if await self.run_next():
+                    continue
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en la cola de trabajos")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def run_next(self) -> bool:
+        """Toma y ejecuta el siguiente trabajo vencido; devuelve False si no había ninguno."""
+        now = time.time()
+        # SKIP LOCKED: en Postgres varios workers (o procesos) no se esperan entre sí
+        next_job = (
+            select(Job.id)
+            .where(JOB_PENDING, Job.run_at <= now)
+            .order_by(Job.run_at)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        async with async_session() as session:
+            job = (await session.exec(
+                update(Job)
+                .where(Job.id == next_job)
+                .values(status="running", attempts=Job.attempts + 1, run_at=now + JOB_LEASE)
+                .returning(Job.id, Job.kind, Job.payload, Job.attempts)
+            )).first()
+            await session.commit()
+            if job is None:
+                await self._cleanup(session, now)
+                return False
+
+            try:
+                await self.handlers[job.kind](**json.loads(job.payload))
+            except Exception as e:
+                failed = job.attempts >= JOB_MAX_ATTEMPTS
+                logger.warning("Trabajo %s (%s) falló en el intento %s: %s", job.id, job.kind, job.attempts, e)
+                values = {
+                    "status": "failed" if failed else "pending",
+                    "run_at": time.time() + min(2 ** job.attempts, 300),
+                    "last_error": repr(e),
+                }
+            else:
+                values = {"status": "done", "run_at": time.time()}
+            await session.exec(update(Job).where(Job.id == job.id).values(**values))
+            await session.commit()
+            return True
+
+    async def _cleanup(self, session: AsyncSession, now: float):
+        """Borra de vez en cuando los trabajos terminados hace más de JOB_RETENTION."""
+        if now < self._next_cleanup:
+            return
+        self._next_cleanup = now + 60
+        await session.exec(delete(Job).where(JOB_DONE, Job.run_at < now - JOB_RETENTION))
+        await session.commit()
+
+    async def stats(self) -> dict:
+        async with async_session() as session:
+            rows = (await session.exec(select(Job.status, func.count()).group_by(Job.status))).all()
+        return {status: total for status, total in rows}
+
+job_queue = JobQueue(JOB_WORKERS)
@@ -1,103 +1,406 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
-from fastapi.staticfiles import StaticFiles
-from sqlmodel import Session, select
-from typing import List
-import shutil
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy import delete, or_, tuple_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from fastapi.encoders import jsonable_encoder
+from typing import Awaitable, Callable, List, Optional, Tuple
+import json
 import os
-import uuid
-from app.database import create_db_and_tables, get_session
-from app.models import User, UserCreate, UserRead, UserLogin, Post, PostRead, Token
-from app.auth import get_password_hash, verify_password, create_access_token, get_current_user
-from datetime import timedelta
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el json de la librería estándar
+    orjson = None
+from app.cache import create_response_cache
+from app.database import async_session, create_db_and_tables, engine, get_session
+from app.models import BatchIds, ChangeLog, RefreshRequest, Follow, User, UserCreate, UserRead, UserLogin, Post, PostRead, TimelineEntry, Token
+from app.media_response import FALLBACK_CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL, is_immutable, media_response
+from app.storage import UPLOAD_DIR, RequestSizeLimitMiddleware, add_media_ref, find_variant, release_media_ref, schedule_variants, stage_upload, variant_urls
+from app.jobs import job_queue
+from app.metrics import MetricsMiddleware, install_sql_metrics, profiler, render_metrics
+from app.passwords import account_login_limiter, ip_login_limiter, password_pool
+from app.search import SEARCH_MAX_OFFSET, match_search, search_terms
+from app.sync import SYNC_MAX_CHANGES, record_change
+from app.timeline import FANOUT_ON_READ_THRESHOLD
+from app.auth import create_tokens, decode_refresh_token, get_current_user, invalidate_auth_cache
+from datetime import datetime, timedelta
+
+AUTHOR_REFRESH_BATCH = int(os.getenv("AUTHOR_REFRESH_BATCH", "500"))  # posts por transacción al propagar un cambio de perfil
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))  # filas por lote al listar sin paginar
+MAX_PAGE_SIZE = 100
+MAX_BATCH_IDS = int(os.getenv("MAX_BATCH_IDS", "100"))  # ids por petición en las lecturas por lotes
 
 app = FastAPI()
+app.add_middleware(RequestSizeLimitMiddleware)
+app.add_middleware(MetricsMiddleware)  # la última es la más externa: también mide los 413
+install_sql_metrics(engine)
 
 # Crear carpeta uploads si no existe
-os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+response_cache = create_response_cache()
 
 @app.on_event("startup")
-def on_startup():
-    create_db_and_tables()
+async def on_startup():
+    await create_db_and_tables()
+    # Los trabajos pendientes de una ejecución anterior se atienden desde el arranque
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await job_queue.stop()
+
+# --- PAGINACIÓN ---
+
+def parse_cursor(before: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Convierte el cursor '<created_at ISO>,<id>' en una tupla comparable."""
+    if not before:
+        return None
+    try:
+        created_at, post_id = before.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(post_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate_posts(statement, limit: Optional[int], before: Optional[str]):
+    """Aplica orden (created_at, id) DESC y, si se pide, la condición keyset + LIMIT.
+
+    Devuelve la sentencia y el límite efectivo (None si no se pidió paginación).
+    """
+    cursor = parse_cursor(before)
+    if cursor is not None:
+        statement = statement.where(tuple_(Post.created_at, Post.id) < cursor)
+    statement = statement.order_by(Post.created_at.desc(), Post.id.desc())
+    if limit is None and cursor is None:
+        return statement, None
+    limit = limit or MAX_PAGE_SIZE
+    return statement.limit(limit), limit
+
+def set_next_cursor(response: Response, posts, limit: Optional[int]):
+    """Publica el cursor de la siguiente página en la cabecera X-Next-Cursor."""
+    if limit is not None and len(posts) == limit:
+        last = posts[-1]
+        response.headers["X-Next-Cursor"] = f"{last.created_at.isoformat()},{last.id}"
+
+# --- CONSULTAS DEL FEED ---
+
+def select_post_rows():
+    """SELECT compacto de posts con los datos del autor, sin JOIN (copia guardada en post)."""
+    return select(
+        Post.id,
+        Post.user_id,
+        Post.description,
+        Post.media_url,
+        Post.media_type,
+        Post.created_at,
+        Post.author_username.label("username"),
+        Post.author_avatar_url.label("user_avatar"),
+    )
+
+def format_timestamp(value: datetime) -> str:
+    """datetime UTC sin zona a ISO 8601 con milisegundos (2024-01-01T10:00:00.000Z), como api_server_fixed.py."""
+    return value.isoformat(timespec="milliseconds") + "Z"
+
+def post_rows_to_dicts(rows) -> List[dict]:
+    """Convierte las filas de select_post_rows() en dicts con la forma de PostRead.
+
+    Evita crear un modelo pydantic por post: en listas grandes la validación y
+    jsonable_encoder cuestan más que la propia consulta.
+    """
+    posts = []
+    append = posts.append
+    for post_id, user_id, description, media_url, media_type, created_at, username, user_avatar in rows:
+        append({
+            "description": description,
+            "media_url": media_url,
+            "media_type": media_type,
+            "created_at": format_timestamp(created_at),
+            "id": post_id,
+            "user_id": user_id,
+            "username": username or "Unknown",
+            "user_avatar": user_avatar,
+            **variant_urls(media_url, media_type),
+        })
+    return posts
+
+def post_json_response(post: Post, author: User) -> Response:
+    """Un post recién creado o editado, con la misma forma y formato de fecha que las listas."""
+    row = (post.id, post.user_id, post.description, post.media_url, post.media_type, post.created_at,
+           author.username, author.avatar_url)
+    return Response(dumps(post_rows_to_dicts([row])[0]), media_type="application/json")
+
+def dumps(value) -> str:
+    """Codifica a JSON con orjson si está instalado (varias veces más rápido que json)."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def stream_post_rows(statement) -> StreamingResponse:
+    """Emite la lista completa como array JSON, leyendo por lotes de STREAM_BATCH_SIZE filas.
+
+    Usa un cursor de servidor (session.stream) y su propia sesión, porque la
+    respuesta se sigue enviando después de que el endpoint haya retornado.
+    """
+    async def generate():
+        separator = "["
+        async with async_session() as session:
+            result = await session.stream(statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for rows in result.partitions():
+                yield separator + dumps(post_rows_to_dicts(rows))[1:-1]
+                separator = ","
+        yield "[]" if separator == "[" else "]"
+
+    return StreamingResponse(generate(), media_type="application/json")
+
+# --- LECTURAS POR LOTES ---
+
+def parse_batch_ids(values) -> List[int]:
+    """Convierte ids ('1,2,3' o lista) en enteros sin duplicados, en el orden pedido."""
+    if isinstance(values, str):
+        values = [value for value in values.split(",") if value.strip()]
+    try:
+        ids = list(dict.fromkeys(int(value) for value in values))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+    if not ids or len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BATCH_IDS} ids are allowed")
+    return ids
+
+def batch_response(body: str, missing: List[int]) -> Response:
+    """Respuesta de una lectura por lotes; los ids que no existen viajan en la cabecera X-Missing-Ids."""
+    response = Response(body, media_type="application/json")
+    if missing:
+        response.headers["X-Missing-Ids"] = ",".join(map(str, missing))
+    return response
+
+async def batch_posts_response(session: AsyncSession, ids: List[int]) -> Response:
+    """Resuelve varios posts con una sola consulta IN, en el orden de ids."""
+    rows = (await session.exec(select_post_rows().where(Post.id.in_(ids)))).all()
+    by_id = {row.id: row for row in rows}
+    found = [by_id[post_id] for post_id in ids if post_id in by_id]
+    return batch_response(dumps(post_rows_to_dicts(found)), [post_id for post_id in ids if post_id not in by_id])
+
+async def batch_users_response(session: AsyncSession, ids: List[int]) -> Response:
+    """Resuelve varios usuarios con una sola consulta IN, en el orden de ids."""
+    users = (await session.exec(select(User).where(User.id.in_(ids)))).all()
+    by_id = {user.id: user for user in users}
+    found = [UserRead.from_orm(by_id[user_id]) for user_id in ids if user_id in by_id]
+    return batch_response(dumps(jsonable_encoder(found)), [user_id for user_id in ids if user_id not in by_id])
+
+# --- COPIA DEL AUTOR EN LOS POSTS ---
+
+def author_snapshot(user_id: int):
+    """Valores para author_username/author_avatar_url leídos de user en la propia sentencia."""
+    return {
+        "author_username": select(User.username).where(User.id == user_id).scalar_subquery(),
+        "author_avatar_url": select(User.avatar_url).where(User.id == user_id).scalar_subquery(),
+    }
+
+@job_queue.handler("refresh_author")
+async def refresh_author_snapshot(user_id: int):
+    """Copia el username/avatar actuales del usuario a sus posts, por lotes.
+
+    Cada lote es una transacción corta; se leen los valores vigentes de user,
+    así que repetir el refresco es idempotente. Sólo invalida las cachés si
+    algún post cambió: un refresco repetido no vacía el feed global.
+    """
+    stale_posts = (
+        select(Post.id)
+        .join(User, User.id == Post.user_id)
+        .where(
+            Post.user_id == user_id,
+            or_(
+                Post.author_username.is_distinct_from(User.username),
+                Post.author_avatar_url.is_distinct_from(User.avatar_url),
+            ),
+        )
+        .limit(AUTHOR_REFRESH_BATCH)
+    )
+    statement = (
+        update(Post)
+        .where(Post.id.in_(stale_posts))
+        .values(**author_snapshot(user_id))
+        .execution_options(synchronize_session=False)
+    )
+    updated = 0
+    async with async_session() as session:
+        while True:
+            result = await session.exec(statement)
+            await session.commit()
+            updated += result.rowcount
+            if result.rowcount < AUTHOR_REFRESH_BATCH:
+                break
+    if updated:
+        await response_cache.invalidate("feed", f"author:{user_id}")
+
+# --- CACHÉ DE RESPUESTAS ---
+
+CACHED_RESPONSE_HEADERS = ("x-next-cursor",)
+
+async def cached_json(
+    request: Request,
+    response: Response,
+    tags: List[str],
+    build: Callable[[List[str]], Awaitable[object]],
+) -> Response:
+    """Devuelve la respuesta cacheada de esta petición GET o la construye con build(tags).
+
+    build devuelve datos ya listos para JSON (dicts/listas de tipos básicos) o
+    modelos, que pasan por jsonable_encoder. Puede además añadir etiquetas que
+    sólo conoce tras consultar (p. ej. el autor).
+    Las versiones de las etiquetas se leen antes de consultar la BD, así una
+    invalidación concurrente nunca deja guardada una respuesta vieja.
+    """
+    key = request.url.path + "?" + request.url.query
+    entry = await response_cache.get(key)
+    if entry is not None:
+        return Response(entry["body"], media_type="application/json", headers=entry["headers"])
+
+    tags = list(tags)
+    versions = await response_cache.versions(tags)
+    result = await build(tags)
+    body = dumps(result if isinstance(result, (list, dict)) else jsonable_encoder(result))
+    versions.update(await response_cache.versions([tag for tag in tags if tag not in versions]))
+    headers = {name: response.headers[name] for name in CACHED_RESPONSE_HEADERS if name in response.headers}
+    await response_cache.set(key, versions, body, headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 # --- AUTH ---
 
 @app.post("/auth/register", response_model=Token)
-def register(user: UserCreate, session: Session = Depends(get_session)):
+async def register(user: UserCreate, session: AsyncSession = Depends(get_session)):
     # Check email/username
-    if session.exec(select(User).where(User.email == user.email)).first():
+    if (await session.exec(select(User).where(User.email == user.email))).first():
         raise HTTPException(status_code=400, detail="Email already registered")
-    if session.exec(select(User).where(User.username == user.username)).first():
+    if (await session.exec(select(User).where(User.username == user.username))).first():
         raise HTTPException(status_code=400, detail="Username already taken")
 
-    hashed_pw = get_password_hash(user.password)
-    db_user = User.from_orm(user)
-    db_user.hashed_password = hashed_pw
+    # bcrypt es costoso: se ejecuta en el pool de procesos, fuera del event loop
+    hashed_pw = await password_pool.hash(user.password)
+    db_user = User(**user.dict(exclude={"password"}), hashed_password=hashed_pw)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.flush()
+    await record_change(session, "user", db_user.id)
+    await session.commit()
+    await session.refresh(db_user)
     
-    access_token = create_access_token(data={"sub": db_user.email})
-    return {"access_token": access_token, "token_type": "bearer", "user_id": db_user.id}
+    return create_tokens(db_user)
 
 @app.post("/auth/login", response_model=Token)
-def login(user_data: UserLogin, session: Session = Depends(get_session)):
-    user = session.exec(select(User).where(User.email == user_data.email)).first()
-    if not user or not verify_password(user_data.password, user.hashed_password):
+async def login(user_data: UserLogin, request: Request, session: AsyncSession = Depends(get_session)):
+    account_key, ip_key = user_data.email.lower(), request.client.host if request.client else None
+    retry_after = max(account_login_limiter.retry_after(account_key), ip_login_limiter.retry_after(ip_key))
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many failed attempts", headers={"Retry-After": str(retry_after)})
+
+    user = (await session.exec(select(User).where(User.email == user_data.email))).first()
+    valid, new_hash = await password_pool.verify_and_update(user_data.password, user.hashed_password) if user else (False, None)
+    if not valid:
+        account_login_limiter.record_failure(account_key)
+        ip_login_limiter.record_failure(ip_key)
         raise HTTPException(status_code=400, detail="Incorrect email or password")
-    
-    access_token = create_access_token(data={"sub": user.email})
-    return {"access_token": access_token, "token_type": "bearer", "user_id": user.id}
+    account_login_limiter.reset(account_key)
+
+    if new_hash:
+        # Cambió BCRYPT_ROUNDS: se aprovecha que tenemos la contraseña en claro
+        await session.exec(
+            update(User).where(User.id == user.id, User.hashed_password == user.hashed_password).values(hashed_password=new_hash)
+        )
+        await session.commit()
+
+    return create_tokens(user)
+
+@app.post("/auth/refresh", response_model=Token)
+async def refresh(body: RefreshRequest, session: AsyncSession = Depends(get_session)):
+    """Cambia un refresh token válido por tokens nuevos (con el perfil actual)."""
+    email = decode_refresh_token(body.refresh_token)
+    user = (await session.exec(select(User).where(User.email == email))).first() if email else None
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    return create_tokens(user)
 
 # --- USERS ---
 
 @app.get("/users/me", response_model=UserRead)
-def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
 
 @app.put("/users/me/avatar", response_model=UserRead)
-async def update_avatar(file: UploadFile = File(...), current_user: User = Depends(get_current_user), session: Session = Depends(get_session)):
-    filename = f"{uuid.uuid4()}_{file.filename}"
-    path = f"uploads/{filename}"
-    with open(path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # URL accesible desde fuera (asumiendo localhost:8000 o IP)
-    # En producción usar dominio real. Aquí devolvemos path relativo.
-    current_user.avatar_url = f"/uploads/{filename}"
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+async def update_avatar(file: UploadFile = File(...), current_user: User = Depends(get_current_user), session: AsyncSession = Depends(get_session)):
+    async with stage_upload(file) as staged:
+        # La referencia nueva va primero: en SQLite esa escritura toma el lock antes de leer el avatar actual
+        await add_media_ref(session, staged)
+        # El avatar anterior se lee de user dentro de la transacción (fila bloqueada en Postgres), no de
+        # current_user: la copia de la caché de auth puede estar desfasada y se liberaría otro archivo
+        old_avatar = (await session.exec(
+            select(User.avatar_url).where(User.id == current_user.id).with_for_update()
+        )).one()
+        # URL accesible desde fuera (asumiendo localhost:8000 o IP)
+        # En producción usar dominio real. Aquí devolvemos path relativo.
+        await session.exec(update(User).where(User.id == current_user.id).values(avatar_url=staged.url))
+        await release_media_ref(session, old_avatar)
+        await record_change(session, "user", current_user.id)
+        # refresh_author invalida feed y author al terminar si algún post cambió
+        await job_queue.enqueue(session, "refresh_author", {"user_id": current_user.id})
+        await schedule_variants(session, staged)
+        await session.commit()
+    invalidate_auth_cache(current_user.id)
+    await response_cache.invalidate(f"user:{current_user.id}")
+    await session.refresh(current_user)
     return current_user
 
 @app.put("/users/me", response_model=UserRead)
-def update_profile(bio: str = Form(...), session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
+async def update_profile(bio: str = Form(...), session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
     current_user.bio = bio
     session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
+    await record_change(session, "user", current_user.id)
+    # La bio no forma parte de la copia del autor en los posts: no hace falta refresh_author
+    await session.commit()
+    invalidate_auth_cache(current_user.id)
+    await response_cache.invalidate(f"user:{current_user.id}")
+    await session.refresh(current_user)
     return current_user
 
+@app.get("/users", response_model=List[UserRead])
+async def read_users(ids: str, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    """Varios usuarios en una petición: ?ids=1,2,3 (ver batch_users_response)."""
+    return await batch_users_response(session, parse_batch_ids(ids))
+
+@app.post("/users/batch", response_model=List[UserRead])
+async def read_users_batch(batch: BatchIds, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    return await batch_users_response(session, parse_batch_ids(batch.ids))
+
 @app.get("/users/{user_id}", response_model=UserRead)
-def read_user(user_id: int, session: Session = Depends(get_session)):
-    user = session.get(User, user_id)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user
+async def read_user(user_id: int, request: Request, response: Response, session: AsyncSession = Depends(get_session)):
+    async def build(tags):
+        user = await session.get(User, user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        return UserRead.from_orm(user)
+
+    return await cached_json(request, response, [f"user:{user_id}"], build)
 
 @app.get("/users/{user_id}/posts", response_model=List[PostRead])
-def read_user_posts(user_id: int, session: Session = Depends(get_session)):
-    posts = session.exec(select(Post).where(Post.user_id == user_id).order_by(Post.created_at.desc())).all()
-    # Enriquecer con datos del usuario (ineficiente pero simple para este ejemplo)
-    user = session.get(User, user_id)
-    result = []
-    for p in posts:
-        result.append(PostRead(
-            **p.dict(), 
-            username=user.username, 
-            user_avatar=user.avatar_url
-        ))
-    return result
+async def read_user_posts(
+    user_id: int,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    if limit is None and before is None:
+        # Sin paginar se transmite en streaming y no se cachea: el cuerpo crece con la tabla
+        return stream_post_rows(paginate_posts(select_post_rows().where(Post.user_id == user_id), None, None)[0])
+
+    async def build(tags):
+        statement, page_limit = paginate_posts(select_post_rows().where(Post.user_id == user_id), limit, before)
+        rows = (await session.exec(statement)).all()
+        set_next_cursor(response, rows, page_limit)
+        return post_rows_to_dicts(rows)
+
+    return await cached_json(request, response, [f"author:{user_id}"], build)
 
 
 # --- POSTS ---
@@ -106,57 +409,94 @@ def read_user_posts(user_id: int, session: Session = Depends(get_session)):
 async def create_post(
     description: str = Form(...),
     file: UploadFile = File(...),
-    session: Session = Depends(get_session),
+    session: AsyncSession = Depends(get_session),
     current_user: User = Depends(get_current_user)
 ):
-    filename = f"{uuid.uuid4()}_{file.filename}"
-    path = f"uploads/{filename}"
-    with open(path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
     media_type = "image" if "image" in file.content_type else "video"
     
-    post = Post(
-        description=description,
-        media_url=f"/uploads/{filename}",
-        media_type=media_type,
-        user_id=current_user.id
-    )
-    session.add(post)
-    session.commit()
-    session.refresh(post)
+    async with stage_upload(file) as staged:
+        post = Post(
+            description=description,
+            media_url=staged.url,
+            media_type=media_type,
+            user_id=current_user.id
+        )
+        # El autor se copia de user dentro del INSERT, nunca de la caché de auth
+        # (asignado aparte: el constructor de SQLModel descarta las expresiones SQL)
+        for column, value in author_snapshot(current_user.id).items():
+            setattr(post, column, value)
+        session.add(post)
+        await session.flush()
+        await record_change(session, "post", post.id)
+        await add_media_ref(session, staged)
+        # Efectos secundarios: se confirman junto con el post y se ejecutan fuera de la petición
+        await job_queue.enqueue(session, "fan_out_post", {"post_id": post.id}, key=f"fan_out_post:{post.id}")
+        await schedule_variants(session, staged)
+        await session.commit()
+    await response_cache.invalidate("feed", f"author:{current_user.id}")
     
-    return PostRead(**post.dict(), username=current_user.username, user_avatar=current_user.avatar_url)
+    # La respuesta se arma con lo que ya se conoce, sin volver a leer el post
+    return post_json_response(post, current_user)
 
 @app.get("/posts", response_model=List[PostRead])
-def read_posts(session: Session = Depends(get_session)):
-    posts = session.exec(select(Post).order_by(Post.created_at.desc())).all()
-    # Join manual simple
-    result = []
-    for p in posts:
-        user = session.get(User, p.user_id)
-        result.append(PostRead(
-            **p.dict(),
-            username=user.username if user else "Unknown",
-            user_avatar=user.avatar_url if user else None
-        ))
-    return result
+async def read_posts(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    ids: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    if ids is not None:
+        # ?ids=1,2,3: solo esos posts, en ese orden (ver batch_posts_response)
+        return await batch_posts_response(session, parse_batch_ids(ids))
+    if limit is None and before is None:
+        # Sin paginar se transmite en streaming y no se cachea: el cuerpo crece con la tabla
+        return stream_post_rows(paginate_posts(select_post_rows(), None, None)[0])
+
+    async def build(tags):
+        statement, page_limit = paginate_posts(select_post_rows(), limit, before)
+        rows = (await session.exec(statement)).all()
+        set_next_cursor(response, rows, page_limit)
+        return post_rows_to_dicts(rows)
+
+    return await cached_json(request, response, ["feed"], build)
+
+@app.post("/posts/batch", response_model=List[PostRead])
+async def read_posts_batch(batch: BatchIds, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    return await batch_posts_response(session, parse_batch_ids(batch.ids))
+
+@app.get("/posts/{post_id}", response_model=PostRead)
+async def read_post(post_id: int, request: Request, response: Response, session: AsyncSession = Depends(get_session)):
+    async def build(tags):
+        row = (await session.exec(select_post_rows().where(Post.id == post_id))).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Post not found")
+        tags.append(f"author:{row.user_id}")
+        return post_rows_to_dicts([row])[0]
+
+    return await cached_json(request, response, [f"post:{post_id}"], build)
 
 @app.delete("/posts/{post_id}")
-def delete_post(post_id: int, session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    post = session.get(Post, post_id)
+async def delete_post(post_id: int, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    post = await session.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     if post.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    session.delete(post)
-    session.commit()
+    await session.delete(post)
+    await session.exec(delete(TimelineEntry).where(TimelineEntry.post_id == post_id))
+    await release_media_ref(session, post.media_url)
+    await record_change(session, "post", post_id, deleted=True)
+    await session.commit()
+    await response_cache.invalidate("feed", f"author:{current_user.id}", f"post:{post_id}")
     return {"ok": True}
 
 @app.put("/posts/{post_id}", response_model=PostRead)
-def update_post(post_id: int, description: str = Form(...), session: Session = Depends(get_session), current_user: User = Depends(get_current_user)):
-    post = session.get(Post, post_id)
+async def update_post(post_id: int, description: str = Form(...), session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    post = await session.get(Post, post_id)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
     if post.user_id != current_user.id:
@@ -164,6 +504,183 @@ def update_post(post_id: int, description: str = Form(...), session: Session = D
     
     post.description = description
     session.add(post)
-    session.commit()
-    session.refresh(post)
-    return PostRead(**post.dict(), username=current_user.username, user_avatar=current_user.avatar_url)
+    await record_change(session, "post", post_id)
+    await session.commit()
+    await response_cache.invalidate("feed", f"author:{current_user.id}", f"post:{post_id}")
+    await session.refresh(post)
+    return post_json_response(post, current_user)
+
+# --- SEGUIDORES Y FEED PERSONAL ---
+
+@app.get("/feed/home", response_model=List[PostRead])
+async def read_home_feed(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Posts propios y de las cuentas seguidas, siempre paginado.
+
+    Lee una página de la timeline materializada y la mezcla con los últimos
+    posts de las cuentas seguidas que superan FANOUT_ON_READ_THRESHOLD.
+    """
+    limit = limit or MAX_PAGE_SIZE
+    cursor = parse_cursor(before)
+
+    statement = (
+        select_post_rows()
+        .join(TimelineEntry, TimelineEntry.post_id == Post.id)
+        .where(TimelineEntry.user_id == current_user.id)
+    )
+    if cursor is not None:
+        statement = statement.where(tuple_(TimelineEntry.created_at, TimelineEntry.post_id) < cursor)
+    statement = statement.order_by(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc()).limit(limit)
+    rows = (await session.exec(statement)).all()
+
+    pulled_ids = (await session.exec(
+        select(Follow.followee_id)
+        .join(User, User.id == Follow.followee_id)
+        .where(Follow.follower_id == current_user.id, User.follower_count > FANOUT_ON_READ_THRESHOLD)
+    )).all()
+    if pulled_ids:
+        statement, _ = paginate_posts(select_post_rows().where(Post.user_id.in_(pulled_ids)), limit, before)
+        merged = {row.id: row for row in rows}
+        merged.update((row.id, row) for row in (await session.exec(statement)).all())
+        rows = sorted(merged.values(), key=lambda row: (row.created_at, row.id), reverse=True)[:limit]
+
+    response = Response(dumps(post_rows_to_dicts(rows)), media_type="application/json")
+    set_next_cursor(response, rows, limit)
+    return response
+
+@app.post("/users/{user_id}/follow")
+async def follow_user(user_id: int, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="Cannot follow yourself")
+    if not await session.get(User, user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if not await session.get(Follow, (current_user.id, user_id)):
+        session.add(Follow(follower_id=current_user.id, followee_id=user_id))
+        await session.exec(update(User).where(User.id == user_id).values(follower_count=User.follower_count + 1))
+        await job_queue.enqueue(session, "backfill_timeline", {"follower_id": current_user.id, "followee_id": user_id})
+        await session.commit()
+    return {"ok": True}
+
+@app.delete("/users/{user_id}/follow")
+async def unfollow_user(user_id: int, session: AsyncSession = Depends(get_session), current_user: User = Depends(get_current_user)):
+    follow = await session.get(Follow, (current_user.id, user_id))
+    if follow:
+        await session.delete(follow)
+        await session.exec(update(User).where(User.id == user_id).values(follower_count=User.follower_count - 1))
+        await session.exec(
+            delete(TimelineEntry).where(TimelineEntry.user_id == current_user.id, TimelineEntry.author_id == user_id)
+        )
+        await session.commit()
+    return {"ok": True}
+
+@app.get("/search")
+async def search(
+    q: str,
+    kind: str = Query("posts", alias="type", regex="^(posts|users)$"),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=SEARCH_MAX_OFFSET),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Búsqueda de texto completo en posts o usuarios, ordenada por relevancia.
+
+    Pagina con ?limit=&offset=; el offset siguiente viaja en la cabecera X-Next-Cursor.
+    """
+    terms = search_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Empty search query")
+
+    dialect = session.bind.dialect.name
+    if kind == "posts":
+        statement = match_search(select_post_rows(), Post, dialect, terms).limit(limit).offset(offset)
+        rows = (await session.exec(statement)).all()
+        body = dumps(post_rows_to_dicts(rows))
+    else:
+        statement = match_search(select(User), User, dialect, terms).limit(limit).offset(offset)
+        rows = (await session.exec(statement)).all()
+        body = dumps(jsonable_encoder([UserRead.from_orm(user) for user in rows]))
+
+    response = Response(body, media_type="application/json")
+    if len(rows) == limit and offset + limit <= SEARCH_MAX_OFFSET:
+        response.headers["X-Next-Cursor"] = str(offset + limit)
+    return response
+
+# --- SINCRONIZACIÓN INCREMENTAL ---
+
+@app.get("/sync")
+async def sync(
+    since: int = Query(0, ge=0),
+    limit: int = Query(SYNC_MAX_CHANGES, ge=1, le=SYNC_MAX_CHANGES),
+    session: AsyncSession = Depends(get_session),
+    current_user: User = Depends(get_current_user)
+):
+    """Posts y perfiles cambiados después de la versión since (ver app/sync.py).
+
+    Devuelve {version, has_more, posts, deleted_post_ids, users, deleted_user_ids};
+    el cliente guarda version y repite con ella mientras has_more sea true.
+    since=0 es la sincronización completa. Un cambio de perfil también afecta a
+    username/user_avatar de los posts de ese usuario que el cliente tenga guardados.
+    """
+    changes = (await session.exec(
+        select(ChangeLog).where(ChangeLog.version > since).order_by(ChangeLog.version).limit(limit + 1)
+    )).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    post_ids = [change.entity_id for change in changes if change.entity == "post" and not change.deleted]
+    user_ids = [change.entity_id for change in changes if change.entity == "user" and not change.deleted]
+    # Una fila borrada después de leer el registro se omite: su lápida llega con una versión posterior
+    posts = (await session.exec(select_post_rows().where(Post.id.in_(post_ids)))).all() if post_ids else []
+    users = (await session.exec(select(User).where(User.id.in_(user_ids)))).all() if user_ids else []
+
+    return Response(dumps({
+        "version": changes[-1].version if changes else since,
+        "has_more": has_more,
+        "posts": post_rows_to_dicts(posts),
+        "deleted_post_ids": [change.entity_id for change in changes if change.entity == "post" and change.deleted],
+        "users": jsonable_encoder([UserRead.from_orm(user) for user in users]),
+        "deleted_user_ids": [change.entity_id for change in changes if change.entity == "user" and change.deleted],
+    }), media_type="application/json")
+
+@app.get("/jobs/stats")
+async def jobs_stats(current_user: User = Depends(get_current_user)):
+    """Trabajos de la cola por estado (pending, running, done, failed)."""
+    return await job_queue.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métricas en formato de texto de Prometheus (sin token: la consulta el scraper)."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/slow-requests")
+async def slow_requests(current_user: User = Depends(get_current_user)):
+    """Últimas peticiones lentas con sus pilas muestreadas (PROFILE_SLOW_REQUEST_MS)."""
+    return {"enabled": profiler.enabled, "requests": list(profiler.slow_requests)}
+
+@app.get("/cache/stats")
+async def cache_stats(current_user: User = Depends(get_current_user)):
+    """Aciertos/fallos de la caché de respuestas."""
+    return response_cache.stats()
+
+# --- UPLOADS ---
+
+@app.api_route("/uploads/{path:path}", methods=["GET", "HEAD"])
+async def uploaded_file(path: str, request: Request, variant: Optional[str] = None):
+    """Sirve los archivos subidos; con ?variant=thumb|feed|full la versión redimensionada si ya existe.
+
+    Mientras la variante no se haya generado se sirve el original con una caché corta.
+    """
+    root = os.path.realpath(UPLOAD_DIR)
+    served_path = find_variant(path, variant)
+    file_path = os.path.realpath(os.path.join(root, served_path))
+    if not file_path.startswith(root + os.sep) or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    fallback = variant is not None and served_path == path
+    cache_control = IMMUTABLE_CACHE_CONTROL if is_immutable(path) and not fallback else FALLBACK_CACHE_CONTROL
+    return await media_response(request, root, os.path.relpath(file_path, root), cache_control)
@@ -0,0 +1,97 @@
+from email.utils import formatdate
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from mimetypes import guess_type
+from typing import Optional, Tuple
+import aiofiles
+import aiofiles.os
+import os
+import re
+
+# Los nombres por hash/UUID nunca cambian de contenido: se pueden cachear para siempre
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FALLBACK_CACHE_CONTROL = "public, max-age=60"
+X_ACCEL_REDIRECT_PREFIX = os.getenv("X_ACCEL_REDIRECT_PREFIX")  # p. ej. "/protected-uploads/" detrás de nginx
+HASHED_MEDIA_NAME = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}(?:\.[a-z]+)?)(?:\.[a-z0-9]+)?$")
+UUID_MEDIA_NAME = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}[._]")
+RANGE_CHUNK_SIZE = 64 * 1024
+
+def is_immutable(path: str) -> bool:
+    return bool(HASHED_MEDIA_NAME.match(path) or UUID_MEDIA_NAME.match(path))
+
+def make_etag(path: str, stat_result: os.stat_result) -> str:
+    """ETag fuerte: el hash del nombre si es direccionado por contenido, si no mtime+tamaño."""
+    match = HASHED_MEDIA_NAME.match(path)
+    if match:
+        return f'"{match.group(1)}"'
+    return f'"{int(stat_result.st_mtime_ns):x}-{stat_result.st_size:x}"'
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Interpreta un único rango 'bytes=inicio-fin' (o sufijo 'bytes=-n'); None si no es satisfacible."""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start, end = match.groups()
+    if start == "":
+        length = int(end)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        return None
+    return start, end
+
+async def iter_file_range(file_path: str, start: int, length: int):
+    async with aiofiles.open(file_path, "rb") as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+async def media_response(request: Request, root: str, path: str, cache_control: str) -> Response:
+    """Sirve un archivo de uploads/ con ETag, Cache-Control, 304 y rangos de bytes (206).
+
+    Si X_ACCEL_REDIRECT_PREFIX está definido, el envío del cuerpo se delega en nginx.
+    """
+    file_path = os.path.join(root, path)
+    stat_result = await aiofiles.os.stat(file_path)
+    etag = make_etag(path, stat_result)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    if X_ACCEL_REDIRECT_PREFIX:
+        headers["X-Accel-Redirect"] = X_ACCEL_REDIRECT_PREFIX + path
+        return Response(headers=headers)
+
+    media_type = guess_type(path)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        size = stat_result.st_size
+        byte_range = parse_range(range_header, size)
+        if byte_range is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            iter_file_range(file_path, start, end - start + 1),
+            status_code=206,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    return FileResponse(file_path, media_type=media_type, headers=headers, stat_result=stat_result, method=request.method)
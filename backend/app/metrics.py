@@ -0,0 +1,252 @@
+from collections import Counter as SampleCounter, deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+
+# Métricas en formato Prometheus (/metrics) y muestreo opcional de pilas de las peticiones lentas
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROFILE_SLOW_REQUEST_MS = float(os.getenv("PROFILE_SLOW_REQUEST_MS", "0"))  # 0: profiler desactivado
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))  # peticiones lentas que se conservan en /metrics/slow-requests
+
+logger = logging.getLogger(__name__)
+
+
+def format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class MetricCounter:
+    """Contador de Prometheus con etiquetas, seguro entre hilos."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class MetricHistogram:
+    """Histograma de Prometheus con etiquetas y buckets fijos, seguro entre hilos."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=METRICS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values: Dict[tuple, list] = {}  # etiquetas -> [conteo por bucket..., +Inf, suma]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for labels, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(names, labels + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {series[-1]}")
+                lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+http_request_duration = MetricHistogram(
+    "http_request_duration_seconds", "Latencia de las peticiones HTTP.", ("method", "route", "status"))
+http_request_sql_statements = MetricCounter(
+    "http_request_sql_statements_total", "Sentencias SQL ejecutadas al atender cada ruta.", ("method", "route"))
+http_request_sql_seconds = MetricCounter(
+    "http_request_sql_seconds_total", "Tiempo en la base de datos al atender cada ruta.", ("method", "route"))
+sql_statements = MetricCounter("sql_statements_total", "Sentencias SQL ejecutadas.", ("operation",))
+sql_seconds = MetricCounter("sql_seconds_total", "Tiempo de ejecución de las sentencias SQL.", ("operation",))
+uploads_bytes_served = MetricCounter("uploads_bytes_served_total", "Bytes enviados desde /uploads (sin X-Accel-Redirect).")
+METRICS = [http_request_duration, http_request_sql_statements, http_request_sql_seconds,
+           sql_statements, sql_seconds, uploads_bytes_served]
+
+# Sentencias y segundos de SQL de la petición en curso ([n, segundos] o None fuera de peticiones)
+request_sql_stats: ContextVar[Optional[list]] = ContextVar("request_sql_stats", default=None)
+
+def render_metrics() -> str:
+    """Todas las métricas en el formato de texto de Prometheus."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def sql_operation(statement: str) -> str:
+    statement = statement.lstrip()
+    return statement.split(None, 1)[0].upper() if statement else ""
+
+def install_sql_metrics(engine):
+    """Cuenta y cronometra cada sentencia con los eventos before/after_cursor_execute del engine."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_start"].pop()
+        operation = sql_operation(statement)
+        sql_statements.inc(operation)
+        sql_seconds.inc(operation, amount=elapsed)
+        stats = request_sql_stats.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+
+
+def collapsed_stack(frame, limit: int = 40) -> str:
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SlowRequestProfiler:
+    """Profiler por muestreo: un hilo toma la pila del hilo de cada petición en curso cada PROFILE_SAMPLE_INTERVAL.
+
+    Sólo se conservan (y se registran en el log) las pilas de las peticiones que
+    superan threshold_ms, en formato "collapsed" (func;func;func -> muestras).
+    En el event loop todas las peticiones comparten hilo: las muestras enseñan
+    qué ocupaba el loop mientras la petición estaba en curso (p. ej. código que
+    lo bloquea), no sólo el código de esa petición.
+    """
+
+    def __init__(self, threshold_ms: float, interval: float, keep: int):
+        self.threshold_ms = threshold_ms
+        self.interval = interval
+        self.slow_requests = deque(maxlen=keep)
+        self._active: Dict[int, Tuple[int, SampleCounter]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_ms > 0
+
+    def start(self) -> Optional[int]:
+        """Empieza a muestrear el hilo actual; devuelve la clave para stop() o None si está desactivado."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._sample, name="profiler", daemon=True).start()
+            key = next(self._ids)
+            self._active[key] = (threading.get_ident(), SampleCounter())
+        return key
+
+    def stop(self, key: int, description: str, duration: float):
+        with self._lock:
+            _, samples = self._active.pop(key)
+        duration_ms = duration * 1000
+        if duration_ms < self.threshold_ms:
+            return
+        top = [{"stack": stack, "samples": count} for stack, count in samples.most_common(20)]
+        self.slow_requests.append({"request": description, "duration_ms": round(duration_ms, 1), "stacks": top})
+        logger.warning("Petición lenta %s (%.0f ms); pilas más frecuentes: %s", description, duration_ms, top[:3])
+
+    def _sample(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self._active.values())
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own:
+                    samples[collapsed_stack(frame)] += 1
+
+profiler = SlowRequestProfiler(PROFILE_SLOW_REQUEST_MS, PROFILE_SAMPLE_INTERVAL, PROFILE_KEEP)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia por ruta, SQL por ruta y bytes enviados desde /uploads.
+
+    Mide hasta el último fragmento del cuerpo, así que incluye las respuestas en streaming.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths: Optional[dict] = None
+
+    def route_path(self, scope) -> str:
+        """Plantilla de la ruta (/posts/{post_id}) a partir del endpoint que resolvió el router."""
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stats = [0, 0.0]
+        token = request_sql_stats.set(stats)
+        profile_key = profiler.start()
+        status = 500
+        is_upload = scope["path"].startswith("/uploads/")
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif is_upload and message["type"] == "http.response.body":
+                uploads_bytes_served.inc(amount=len(message.get("body", b"")))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            duration = time.perf_counter() - start
+            request_sql_stats.reset(token)
+            route = self.route_path(scope)
+            http_request_duration.observe(duration, scope["method"], route, str(status))
+            http_request_sql_statements.inc(scope["method"], route, amount=stats[0])
+            http_request_sql_seconds.inc(scope["method"], route, amount=stats[1])
+            if profile_key is not None:
+                description = f"{scope['method']} {scope['path']} -> {status} ({stats[0]} SQL, {stats[1] * 1000:.1f} ms)"
+                profiler.stop(profile_key, description, duration)
@@ -0,0 +1,166 @@
+from datetime import datetime
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, false, insert, inspect, literal,
+    select, text,
+)
+from app.models import ChangeLog, Job, Post, User
+from app.search import create_search_indexes
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock de Postgres: varios workers de uvicorn que arrancan a la vez migran de uno en uno
+MIGRATIONS_LOCK_KEY = 712_023
+
+def add_missing_columns(conn):
+    """Añade (y rellena) las columnas nuevas en bases creadas antes de que existieran."""
+    inspector = inspect(conn)
+    if "follower_count" not in {column["name"] for column in inspector.get_columns("user")}:
+        conn.execute(text('ALTER TABLE "user" ADD COLUMN follower_count INTEGER NOT NULL DEFAULT 0'))
+    if "author_username" in {column["name"] for column in inspector.get_columns("post")}:
+        return
+    conn.execute(text("ALTER TABLE post ADD COLUMN author_username VARCHAR"))
+    conn.execute(text("ALTER TABLE post ADD COLUMN author_avatar_url VARCHAR"))
+    conn.execute(text("""
+        UPDATE post SET
+            author_username = (SELECT username FROM "user" WHERE "user".id = post.user_id),
+            author_avatar_url = (SELECT avatar_url FROM "user" WHERE "user".id = post.user_id)
+    """))
+
+def create_indexes(conn, table, names):
+    """Crea los índices del modelo indicados que todavía no existan."""
+    for index in table.indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+# Tablas de la migración 1 tal como estaban al introducir las migraciones versionadas.
+# Copia congelada: no depende de app.models, cuyos cambios posteriores van en migraciones nuevas.
+INITIAL_SCHEMA = MetaData()
+
+Table(
+    "user", INITIAL_SCHEMA,
+    Column("username", String, nullable=False),
+    Column("email", String, nullable=False),
+    Column("name", String, nullable=False),
+    Column("bio", String),
+    Column("avatar_url", String),
+    Column("id", Integer, primary_key=True),
+    Column("hashed_password", String, nullable=False),
+    Column("follower_count", Integer, nullable=False, server_default="0"),
+    Index("ix_user_username", "username", unique=True),
+    Index("ix_user_email", "email", unique=True),
+)
+
+Table(
+    "post", INITIAL_SCHEMA,
+    Column("description", String, nullable=False),
+    Column("media_url", String, nullable=False),
+    Column("media_type", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("user.id"), nullable=False),
+    Column("author_username", String),
+    Column("author_avatar_url", String),
+    Index("ix_post_created_at_id", "created_at", "id"),
+    Index("ix_post_user_id_created_at_id", "user_id", "created_at", "id"),
+)
+
+Table(
+    "follow", INITIAL_SCHEMA,
+    Column("follower_id", Integer, ForeignKey("user.id"), primary_key=True),
+    Column("followee_id", Integer, ForeignKey("user.id"), primary_key=True),
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_follow_followee_id_follower_id", "followee_id", "follower_id"),
+)
+
+Table(
+    "timeline", INITIAL_SCHEMA,
+    Column("user_id", Integer, primary_key=True, autoincrement=False),
+    Column("created_at", DateTime, primary_key=True),
+    Column("post_id", Integer, primary_key=True, autoincrement=False),
+    Column("author_id", Integer, nullable=False),
+    Index("ix_timeline_post_id", "post_id"),
+)
+
+Table(
+    "job", INITIAL_SCHEMA,
+    Column("id", Integer, primary_key=True),
+    Column("kind", String, nullable=False),
+    Column("payload", String, nullable=False),
+    Column("idempotency_key", String, unique=True),
+    Column("status", String, nullable=False),
+    Column("attempts", Integer, nullable=False),
+    Column("run_at", Float, nullable=False),
+    Column("last_error", String),
+    Column("created_at", Float, nullable=False),
+    Index("ix_job_status_run_at", "status", "run_at"),
+)
+
+Table(
+    "media", INITIAL_SCHEMA,
+    Column("path", String, primary_key=True),
+    Column("size", Integer, nullable=False),
+    Column("refcount", Integer, nullable=False),
+)
+
+def migrate_initial_schema(conn):
+    """Esquema anterior a las migraciones versionadas (INITIAL_SCHEMA).
+
+    Es idempotente: también pone al día las bases creadas antes de schema_migrations.
+    """
+    INITIAL_SCHEMA.create_all(conn)
+    add_missing_columns(conn)
+    create_search_indexes(conn)
+
+def migrate_post_keyset_indexes(conn):
+    """create_all sólo crea índices junto con su tabla: las bases anteriores no tienen los del feed."""
+    create_indexes(conn, Post.__table__, {"ix_post_created_at_id", "ix_post_user_id_created_at_id"})
+
+def migrate_partial_job_indexes(conn):
+    """Un índice parcial por consulta de la cola: los pendientes salen ya ordenados por run_at y la
+    limpieza recorre sólo los terminados."""
+    create_indexes(conn, Job.__table__, {"ix_job_pending_run_at", "ix_job_done_run_at"})
+    conn.execute(text("DROP INDEX IF EXISTS ix_job_status_run_at"))
+
+def migrate_change_log(conn):
+    """Tabla change_log de /sync; los usuarios y posts existentes entran con las primeras versiones."""
+    ChangeLog.__table__.create(conn, checkfirst=True)
+    for entity, model in (("user", User), ("post", Post)):
+        conn.execute(insert(ChangeLog).from_select(
+            ["entity", "entity_id", "deleted"],
+            select(literal(entity), model.id, false()).order_by(model.id),
+        ))
+
+# (versión, descripción, función): las ya publicadas no se modifican; cada cambio de esquema va en una nueva al final
+MIGRATIONS = [
+    (1, "esquema inicial", migrate_initial_schema),
+    (2, "índices keyset de post en bases existentes", migrate_post_keyset_indexes),
+    (3, "índices parciales de la cola de trabajos", migrate_partial_job_indexes),
+    (4, "registro de cambios para /sync", migrate_change_log),
+]
+
+def run_migrations(conn):
+    """Aplica, en orden y una sola vez, las migraciones de MIGRATIONS que faltan en schema_migrations.
+
+    Se ejecuta dentro de la transacción de create_db_and_tables: en Postgres el
+    DDL es transaccional y una migración que falla no deja el esquema a medias.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """))
+    applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        migrate(conn)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:version, :description, :applied_at)"),
+            {"version": version, "description": description, "applied_at": datetime.utcnow()},
+        )
+        logger.info("Migración %s aplicada: %s", version, description)
@@ -1,4 +1,5 @@
-from typing import Optional
+from typing import List, Optional
+from sqlalchemy import Index, UniqueConstraint, text
 from sqlmodel import Field, SQLModel
 from datetime import datetime
 
@@ -12,6 +13,7 @@ class UserBase(SQLModel):
 class User(UserBase, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     hashed_password: str
+    follower_count: int = Field(default=0, sa_column_kwargs={"server_default": "0"})
 
 class UserCreate(UserBase):
     password: str
@@ -23,6 +25,9 @@ class UserLogin(SQLModel):
     email: str
     password: str
 
+class BatchIds(SQLModel):
+    ids: List[int]
+
 class PostBase(SQLModel):
     description: str
     media_url: str
@@ -30,16 +35,88 @@ class PostBase(SQLModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Post(PostBase, table=True):
+    # Índices compuestos para la paginación por cursor (keyset) del feed y de /users/{id}/posts
+    __table_args__ = (
+        Index("ix_post_created_at_id", "created_at", "id"),
+        Index("ix_post_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: int = Field(foreign_key="user.id")
+    # Copia del autor para leer el feed sin JOIN; se actualiza en segundo plano al cambiar el perfil
+    author_username: Optional[str] = None
+    author_avatar_url: Optional[str] = None
 
 class PostRead(PostBase):
     id: int
     user_id: int
     username: str  # Agregamos username para facilitar el display en Android
     user_avatar: Optional[str] = None
+    # Variantes redimensionadas de la imagen (None para videos)
+    thumbnail_url: Optional[str] = None
+    feed_url: Optional[str] = None
+    full_url: Optional[str] = None
+
+class Follow(SQLModel, table=True):
+    __table_args__ = (Index("ix_follow_followee_id_follower_id", "followee_id", "follower_id"),)
+
+    follower_id: int = Field(foreign_key="user.id", primary_key=True)
+    followee_id: int = Field(foreign_key="user.id", primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class TimelineEntry(SQLModel, table=True):
+    # Timeline materializada: la clave primaria es el propio orden de lectura del feed personal
+    __tablename__ = "timeline"
+    __table_args__ = (Index("ix_timeline_post_id", "post_id"),)
+
+    user_id: int = Field(primary_key=True)
+    created_at: datetime = Field(primary_key=True)
+    post_id: int = Field(primary_key=True)
+    author_id: int
+
+# Condiciones literales (no parámetros) de las consultas de la cola: así el planificador puede usar los índices parciales
+JOB_PENDING = text("status IN ('pending', 'running')")
+JOB_DONE = text("status = 'done'")
+
+class Job(SQLModel, table=True):
+    # Cola de trabajos: se escriben en la misma transacción que el cambio que los origina
+    __table_args__ = (
+        Index("ix_job_pending_run_at", "run_at", sqlite_where=JOB_PENDING, postgresql_where=JOB_PENDING),
+        Index("ix_job_done_run_at", "run_at", sqlite_where=JOB_DONE, postgresql_where=JOB_DONE),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    payload: str
+    idempotency_key: Optional[str] = Field(default=None, unique=True)
+    status: str = "pending"
+    attempts: int = 0
+    run_at: float
+    last_error: Optional[str] = None
+    created_at: float
+
+class Media(SQLModel, table=True):
+    # Almacén direccionado por contenido: un archivo por hash con su contador de referencias
+    path: str = Field(primary_key=True)
+    size: int
+    refcount: int = 0
+
+class ChangeLog(SQLModel, table=True):
+    # Registro de cambios para /sync: una fila por post o usuario con la versión de su último cambio
+    # (AUTOINCREMENT en SQLite: una versión borrada nunca se reutiliza)
+    __tablename__ = "change_log"
+    __table_args__ = (UniqueConstraint("entity", "entity_id"), {"sqlite_autoincrement": True})
+
+    version: Optional[int] = Field(default=None, primary_key=True)
+    entity: str  # "post" o "user"
+    entity_id: int
+    deleted: bool = False
 
 class Token(SQLModel):
     access_token: str
     token_type: str
     user_id: int
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(SQLModel):
+    refresh_token: str
@@ -0,0 +1,97 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+from app.cache import TTLCache
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+# Coste de bcrypt: al cambiarlo, los hashes antiguos se recalculan en el siguiente login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "16"))  # más allá se responde 503 en vez de encolar
+LOGIN_MAX_FAILURES = int(os.getenv("LOGIN_MAX_FAILURES", "5"))  # por cuenta (email) y ventana
+LOGIN_IP_MAX_FAILURES = int(os.getenv("LOGIN_IP_MAX_FAILURES", "50"))  # por IP y ventana
+LOGIN_FAILURE_WINDOW = float(os.getenv("LOGIN_FAILURE_WINDOW", "300"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+def verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(válida, hash nuevo si el guardado usa otro coste o esquema; si no, None)."""
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordPool:
+    """Calcula y verifica hashes en un pool de procesos acotado.
+
+    bcrypt es CPU pura: en procesos aparte no compite con el event loop ni con
+    el threadpool, y las ráfagas por encima de max_pending se rechazan con 503.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    async def _run(self, func, *args):
+        if self._pending >= self.max_pending:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, try again",
+                headers={"Retry-After": "1"},
+            )
+        if self._executor is None:
+            # 'spawn': no se hereda el estado (event loop, conexiones) del proceso del servidor
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update, password, hashed_password)
+
+password_pool = PasswordPool(PASSWORD_WORKERS, PASSWORD_MAX_PENDING)
+
+
+class LoginRateLimiter:
+    """Cuenta los logins fallidos por clave (email o IP) en una ventana fija desde el primer fallo."""
+
+    def __init__(self, max_failures: int, window: float, maxsize: int = 100000):
+        self.max_failures = max_failures
+        self.window = window
+        self._failures = TTLCache(maxsize, window)
+        self._lock = threading.Lock()
+
+    def retry_after(self, key: str) -> int:
+        """Segundos que faltan para volver a intentarlo, o 0 si la clave no está bloqueada."""
+        item = self._failures.get(key)
+        if item is None or item[0] < self.max_failures:
+            return 0
+        remaining = item[1] + self.window - time.monotonic()
+        return int(remaining) + 1 if remaining > 0 else 0
+
+    def record_failure(self, key: str):
+        with self._lock:
+            item = self._failures.get(key)
+            if item is None or item[1] + self.window <= time.monotonic():
+                item = (0, time.monotonic())
+            self._failures.set(key, (item[0] + 1, item[1]))
+
+    def reset(self, key: str):
+        with self._lock:
+            self._failures.set(key, (0, time.monotonic()))
+
+account_login_limiter = LoginRateLimiter(LOGIN_MAX_FAILURES, LOGIN_FAILURE_WINDOW)
+ip_login_limiter = LoginRateLimiter(LOGIN_IP_MAX_FAILURES, LOGIN_FAILURE_WINDOW)
@@ -0,0 +1,78 @@
+from sqlalchemy import column, func, literal_column, table, text
+import os
+import re
+
+SEARCH_MAX_TERMS = 8  # palabras de la consulta que se tienen en cuenta
+SEARCH_MAX_OFFSET = int(os.getenv("SEARCH_MAX_OFFSET", "1000"))  # más allá, el ranking deja de ser útil y cuesta más
+
+# Texto indexado por tabla: post.description y "user".username + "user".name
+SEARCH_COLUMNS = {
+    "post": ["description"],
+    "user": ["username", "name"],
+}
+
+def postgres_search_ddl(table_name, columns):
+    """Columna tsvector generada (Postgres la mantiene en cada INSERT/UPDATE) y su índice GIN."""
+    document = " || ' ' || ".join(f"coalesce({name}, '')" for name in columns)
+    return [
+        f'ALTER TABLE "{table_name}" ADD COLUMN IF NOT EXISTS search_vector tsvector '
+        f"GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED",
+        f'CREATE INDEX IF NOT EXISTS ix_{table_name}_search_vector ON "{table_name}" USING GIN (search_vector)',
+    ]
+
+def sqlite_search_ddl(table_name, columns):
+    """Tabla FTS5 de contenido externo y los triggers que la mantienen en cada INSERT/UPDATE/DELETE."""
+    fts = f"{table_name}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{name}" for name in columns)
+    old_values = ", ".join(f"old.{name}" for name in columns)
+    insert_new = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values});"
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{names}, content='{table_name}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON "{table_name}" BEGIN {insert_new} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON "{table_name}" BEGIN {delete_old} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON "{table_name}" '
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+
+def create_search_indexes(conn):
+    """Crea los índices de texto completo; en SQLite se reconstruyen si la tabla FTS es nueva."""
+    if conn.dialect.name == "postgresql":
+        for table_name, columns in SEARCH_COLUMNS.items():
+            for statement in postgres_search_ddl(table_name, columns):
+                conn.execute(text(statement))
+        return
+
+    existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+    for table_name, columns in SEARCH_COLUMNS.items():
+        for statement in sqlite_search_ddl(table_name, columns):
+            conn.execute(text(statement))
+        fts = f"{table_name}_fts"
+        if fts not in existing:
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+def search_terms(query: str):
+    """Palabras de la consulta, en minúsculas y sin operadores (como mucho SEARCH_MAX_TERMS)."""
+    return re.findall(r"\w+", query.lower())[:SEARCH_MAX_TERMS]
+
+def match_search(statement, model, dialect: str, terms):
+    """Filtra statement por las palabras buscadas y lo ordena por relevancia (la última cuenta como prefijo).
+
+    Postgres usa la columna search_vector con ts_rank_cd; SQLite, la tabla FTS5 con bm25.
+    """
+    table_name = model.__tablename__
+    if dialect == "postgresql":
+        vector = literal_column(f'"{table_name}".search_vector')
+        query = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(terms) + ":*")
+        return statement.where(vector.op("@@")(query)).order_by(func.ts_rank_cd(vector, query).desc(), model.id.desc())
+
+    fts_name = f"{table_name}_fts"
+    fts = table(fts_name, column("rowid"), column("rank"), column(fts_name))
+    match = " ".join(f'"{term}"' for term in terms) + "*"
+    return (
+        statement.join(fts, fts.c.rowid == model.id)
+        .where(fts.c[fts_name].op("MATCH")(match))
+        .order_by(fts.c.rank, model.id.desc())
+    )
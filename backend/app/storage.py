@@ -0,0 +1,263 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import NamedTuple, Optional
+from app.database import async_session
+from app.jobs import job_queue
+from app.models import Job, Media
+import aiofiles
+import aiofiles.os
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import uuid
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow es opcional: sin él se sirven siempre los originales
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = "uploads"
+MEDIA_URL_PREFIX = "/uploads/"
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+UPLOAD_FORM_OVERHEAD = 1024 * 1024  # cabeceras multipart y campos de texto que acompañan al archivo
+MAX_REQUEST_SIZE = MAX_UPLOAD_SIZE + UPLOAD_FORM_OVERHEAD
+
+# Variantes redimensionadas de las imágenes (lado mayor en px) generadas en segundo plano
+VARIANT_SIZES = {"thumb": 200, "feed": 720, "full": 1600}
+VARIANT_EXTENSIONS = ("webp", "jpg")
+VARIANT_SOURCE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+VARIANT_QUALITY = int(os.getenv("VARIANT_QUALITY", "80"))
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", "2"))
+
+class StagedUpload(NamedTuple):
+    path: str  # ruta relativa dentro de uploads/: ab/cd/<sha256><ext>
+    size: int
+    sha256: str
+
+    @property
+    def url(self) -> str:
+        return MEDIA_URL_PREFIX + self.path
+
+class RequestSizeLimitMiddleware:
+    """Middleware ASGI: rechaza con 413 los cuerpos mayores que MAX_REQUEST_SIZE antes de parsearlos.
+
+    Si Content-Length ya lo supera responde sin leer nada; si no lo trae (chunked) o
+    miente, cuenta los bytes según llegan y corta en cuanto se pasa. Así el parser
+    multipart no llega a volcar a disco un formulario gigante; stage_upload sigue
+    comprobando el tamaño exacto del archivo.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and (not content_length.isdigit() or int(content_length) > MAX_REQUEST_SIZE):
+            response = JSONResponse({"detail": "File too large"}, status_code=413, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def receive_with_limit():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_SIZE:
+                    raise HTTPException(status_code=413, detail="File too large")
+            return message
+
+        await self.app(scope, receive_with_limit, send)
+
+def media_path(sha256: str, extension: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+def safe_extension(filename: Optional[str]) -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if re.fullmatch(r"\.[a-z0-9]{1,10}", extension) else ""
+
+@asynccontextmanager
+async def stage_upload(file: UploadFile):
+    """Guarda un upload sin bloquear el event loop en el almacén por contenido.
+
+    Escribe por bloques en un temporal dentro de uploads/, corta con 413 en cuanto
+    se supera MAX_UPLOAD_SIZE y calcula el SHA-256 al vuelo. El archivo se publica
+    en su ruta definitiva al salir del bloque sin errores (después del commit que
+    registra la referencia); si algo falla se descarta el temporal. Los archivos
+    con el mismo contenido comparten ruta, así que no se duplican.
+    """
+    tmp_path = os.path.join(UPLOAD_DIR, f".tmp-{uuid.uuid4().hex}")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(status_code=413, detail="File too large")
+                digest.update(chunk)
+                await buffer.write(chunk)
+
+        staged = StagedUpload(media_path(digest.hexdigest(), safe_extension(file.filename)), size, digest.hexdigest())
+        yield staged
+
+        final_path = os.path.join(UPLOAD_DIR, staged.path)
+        if not await aiofiles.os.path.exists(final_path):
+            await aiofiles.os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            await aiofiles.os.replace(tmp_path, final_path)
+    finally:
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+
+async def add_media_ref(session: AsyncSession, staged: StagedUpload):
+    """Suma una referencia al archivo dentro de la transacción del post/avatar."""
+    insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    statement = insert(Media).values(path=staged.path, size=staged.size, refcount=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Media.path],
+        set_={"refcount": Media.refcount + 1},
+    )
+    await session.exec(statement)
+
+async def release_media_ref(session: AsyncSession, url: Optional[str]):
+    """Resta una referencia; si el archivo queda huérfano encola su borrado.
+
+    Las URLs antiguas (nombres UUID) no están en la tabla y se ignoran.
+    """
+    if not url or not url.startswith(MEDIA_URL_PREFIX):
+        return
+    path = url[len(MEDIA_URL_PREFIX):]
+    result = await session.exec(
+        update(Media)
+        .where(Media.path == path)
+        .values(refcount=Media.refcount - 1)
+        .returning(Media.refcount)
+    )
+    refcount = result.scalar_one_or_none()
+    if refcount is not None and refcount <= 0:
+        await session.exec(delete(Media).where(Media.path == path))
+        await job_queue.enqueue(session, "remove_media", {"path": path})
+
+@job_queue.handler("remove_media")
+async def remove_orphan_media(path: str):
+    """Borra el archivo (y sus variantes) si sigue sin referencias.
+
+    Inserta una fila con refcount 0 (o bloquea la existente) antes de comprobar:
+    una subida concurrente del mismo contenido espera a este commit en su upsert
+    y vuelve a publicar el archivo, o ya tenía su referencia y se conserva.
+    """
+    async with async_session() as session:
+        insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+        await session.exec(insert(Media).values(path=path, size=0, refcount=0).on_conflict_do_nothing())
+        refcount = (await session.exec(
+            select(Media.refcount).where(Media.path == path).with_for_update()
+        )).one()
+        if refcount <= 0:
+            file_path = os.path.join(UPLOAD_DIR, path)
+            if await aiofiles.os.path.exists(file_path):
+                await aiofiles.os.remove(file_path)
+            await remove_variants(path)
+            await session.exec(delete(Media).where(Media.path == path))
+            # Si el mismo contenido vuelve a subirse, sus variantes tienen que generarse de nuevo
+            await session.exec(delete(Job).where(Job.idempotency_key == f"variants:{path}"))
+        await session.commit()
+
+# --- VARIANTES DE IMAGEN ---
+
+def variant_file(path: str, variant: str, extension: str) -> str:
+    """Ruta de una variante junto al original: ab/cd/<sha256>.<variant>.<webp|jpg>."""
+    return f"{os.path.splitext(path)[0]}.{variant}.{extension}"
+
+def generate_variants(source_path: str):
+    """Genera las variantes redimensionadas de una imagen (se ejecuta en el pool de procesos)."""
+    use_webp = features.check("webp")
+    extension = "webp" if use_webp else "jpg"
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if not use_webp or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        for variant, max_side in VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side))
+            target = variant_file(source_path, variant, extension)
+            tmp_target = target + ".tmp"
+            resized.save(tmp_target, format="WEBP" if use_webp else "JPEG", quality=VARIANT_QUALITY)
+            os.replace(tmp_target, target)
+
+variant_pool: Optional[ProcessPoolExecutor] = None
+
+async def schedule_variants(session: AsyncSession, staged: StagedUpload):
+    """Encola (en la transacción en curso) la generación de variantes de una imagen.
+
+    La clave de idempotencia es la ruta: el mismo contenido sólo se procesa una vez.
+    """
+    if Image is None or os.path.splitext(staged.path)[1] not in VARIANT_SOURCE_EXTENSIONS:
+        return
+    await job_queue.enqueue(session, "generate_variants", {"path": staged.path}, key=f"variants:{staged.path}")
+
+@job_queue.handler("generate_variants")
+async def run_generate_variants(path: str):
+    """Genera las variantes en el pool de procesos y espera el resultado para poder reintentar.
+
+    El archivo se publica justo después del commit que encoló el trabajo; si aún
+    no existe, el trabajo falla y se reintenta (salvo que ya no tenga referencias).
+    """
+    global variant_pool
+    if variant_pool is None:
+        # 'spawn': no se hereda el estado (event loop, conexiones) del proceso del servidor
+        variant_pool = ProcessPoolExecutor(MEDIA_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(variant_pool, generate_variants, os.path.join(UPLOAD_DIR, path))
+    except FileNotFoundError:
+        async with async_session() as session:
+            if await session.get(Media, path) is not None:
+                raise
+    except Image.UnidentifiedImageError as e:
+        # No es una imagen válida: reintentar no va a cambiar nada
+        logger.warning("No se generan variantes de %s: %s", path, e)
+
+async def remove_variants(path: str):
+    """Borra las variantes de un archivo que ya no tiene referencias."""
+    for variant in VARIANT_SIZES:
+        for extension in VARIANT_EXTENSIONS:
+            file_path = os.path.join(UPLOAD_DIR, variant_file(path, variant, extension))
+            if await aiofiles.os.path.exists(file_path):
+                await aiofiles.os.remove(file_path)
+
+def find_variant(path: str, variant: Optional[str]) -> str:
+    """Ruta a servir: la variante pedida si ya se generó, si no el original."""
+    if variant in VARIANT_SIZES:
+        for extension in VARIANT_EXTENSIONS:
+            candidate = variant_file(path, variant, extension)
+            if os.path.exists(os.path.join(UPLOAD_DIR, candidate)):
+                return candidate
+    return path
+
+def variant_urls(media_url: str, media_type: str) -> dict:
+    """URLs de las variantes; el servidor devuelve el original mientras la variante no exista."""
+    if media_type != "image":
+        return {"thumbnail_url": None, "feed_url": None, "full_url": None}
+    return {
+        "thumbnail_url": f"{media_url}?variant=thumb",
+        "feed_url": f"{media_url}?variant=feed",
+        "full_url": f"{media_url}?variant=full",
+    }
@@ -0,0 +1,22 @@
+from sqlalchemy import delete, text
+from sqlmodel.ext.asyncio.session import AsyncSession
+from app.models import ChangeLog
+import os
+
+SYNC_MAX_CHANGES = int(os.getenv("SYNC_MAX_CHANGES", "500"))  # cambios por respuesta de /sync
+# Clave del advisory lock de Postgres que serializa las escrituras en change_log
+CHANGE_LOG_LOCK_KEY = 712_025
+
+async def record_change(session: AsyncSession, entity: str, entity_id: int, deleted: bool = False):
+    """Anota el cambio de un post o usuario en change_log, dentro de la transacción que lo produce.
+
+    La fila anterior de la entidad se sustituye por otra con una versión nueva.
+    En Postgres una secuencia no reparte los valores en orden de commit: el
+    advisory lock (liberado en el commit) evita que /sync vea aparecer una
+    versión menor después de haber devuelto una mayor. SQLite ya serializa a
+    los escritores.
+    """
+    if session.bind.dialect.name == "postgresql":
+        await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": CHANGE_LOG_LOCK_KEY})
+    await session.execute(delete(ChangeLog).where(ChangeLog.entity == entity, ChangeLog.entity_id == entity_id))
+    session.add(ChangeLog(entity=entity, entity_id=entity_id, deleted=deleted))
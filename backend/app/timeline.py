@@ -0,0 +1,76 @@
+from sqlalchemy import exists, literal, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List
+from app.database import async_session
+from app.jobs import job_queue
+from app.models import Follow, Post, TimelineEntry, User
+import os
+
+# Timelines personales: ids de los últimos posts de las cuentas seguidas, materializados por usuario
+TIMELINE_MAX_LENGTH = int(os.getenv("TIMELINE_MAX_LENGTH", "800"))
+# Cuentas con más seguidores no se reparten al escribir: sus posts se mezclan al leer
+FANOUT_ON_READ_THRESHOLD = int(os.getenv("FANOUT_ON_READ_THRESHOLD", "10000"))
+
+TIMELINE_COLUMNS = ["user_id", "created_at", "post_id", "author_id"]
+
+TRIM_TIMELINE_SQL = text("""
+    DELETE FROM timeline
+    WHERE user_id = :user_id AND (created_at, post_id) <= (
+        SELECT created_at, post_id FROM timeline WHERE user_id = :user_id
+        ORDER BY created_at DESC, post_id DESC LIMIT 1 OFFSET :keep
+    )
+""")
+
+def insert_timeline_entries(session: AsyncSession, rows):
+    """INSERT ... SELECT en timeline que ignora las entradas ya existentes."""
+    insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    return insert(TimelineEntry).from_select(TIMELINE_COLUMNS, rows).on_conflict_do_nothing()
+
+async def trim_timelines(session: AsyncSession, user_ids: List[int]):
+    """Deja cada timeline con sus TIMELINE_MAX_LENGTH entradas más recientes."""
+    if user_ids:
+        await session.execute(TRIM_TIMELINE_SQL, [{"user_id": user_id, "keep": TIMELINE_MAX_LENGTH} for user_id in user_ids])
+
+@job_queue.handler("fan_out_post")
+async def fan_out_post(post_id: int):
+    """Añade un post recién creado a la timeline de su autor y de sus seguidores.
+
+    Los autores con más de FANOUT_ON_READ_THRESHOLD seguidores sólo se escriben
+    en su propia timeline; sus seguidores los leen en /feed/home. Todo sale de un
+    INSERT ... SELECT sobre post, así un post ya borrado no se reparte.
+    """
+    async with async_session() as session:
+        await session.exec(insert_timeline_entries(
+            session,
+            select(Post.user_id, Post.created_at, Post.id, Post.user_id).where(Post.id == post_id),
+        ))
+        await session.exec(insert_timeline_entries(
+            session,
+            select(Follow.follower_id, Post.created_at, Post.id, Post.user_id)
+            .join(Follow, Follow.followee_id == Post.user_id)
+            .join(User, User.id == Post.user_id)
+            .where(Post.id == post_id, User.follower_count <= FANOUT_ON_READ_THRESHOLD),
+        ))
+        # Siempre incluye al autor, aunque no tenga seguidores o supere el umbral y no se reparta a nadie
+        user_ids = (await session.exec(select(TimelineEntry.user_id).where(TimelineEntry.post_id == post_id))).all()
+        await trim_timelines(session, user_ids)
+        await session.commit()
+
+@job_queue.handler("backfill_timeline")
+async def backfill_timeline(follower_id: int, followee_id: int):
+    """Copia los últimos posts de una cuenta recién seguida a la timeline del seguidor."""
+    # EXISTS: si el seguidor ya dejó de seguirla mientras esto esperaba, no se copia nada
+    still_following = exists().where(Follow.follower_id == follower_id, Follow.followee_id == followee_id)
+    async with async_session() as session:
+        await session.exec(insert_timeline_entries(
+            session,
+            select(literal(follower_id), Post.created_at, Post.id, Post.user_id)
+            .where(Post.user_id == followee_id, still_following)
+            .order_by(Post.created_at.desc(), Post.id.desc())
+            .limit(TIMELINE_MAX_LENGTH),
+        ))
+        await trim_timelines(session, [follower_id])
+        await session.commit()
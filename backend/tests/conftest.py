@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = tempfile.mkdtemp()
+# Antes de importar app: database.py crea el engine al importarse
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(DATA_DIR, "test.sqlite"))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+sys.path.insert(0, BACKEND)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient con el arranque de la app (migraciones y cola de trabajos) en un directorio temporal."""
+    os.chdir(DATA_DIR)
+    from fastapi.testclient import TestClient
+    from app.main import app
+    with TestClient(app) as test_client:
+        # El usuario 1 de auth_headers existe antes de que ningún test registre otros
+        db = sqlite3.connect(os.environ["DATABASE_URL"].split("sqlite:///", 1)[1])
+        insert_user(db)
+        db.commit()
+        db.close()
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def database_path(client):
+    return os.environ["DATABASE_URL"].split("sqlite:///", 1)[1]
+
+
+def insert_user(db):
+    db.execute("INSERT OR IGNORE INTO user (id, name, username, email, hashed_password, follower_count) "
+               "VALUES (1, 'Test', 'test', 'test@x', '-', 0)")
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    """Cabecera Bearer del usuario 1."""
+    from app.auth import create_access_token
+    return {"Authorization": "Bearer " + create_access_token({"sub": "test@x"})}
+
+
+@pytest.fixture
+def insert_posts(database_path):
+    """Inserta count posts del usuario 1 (se crea si falta), con created_at crecientes.
+
+    created_at va en el formato en que SQLAlchemy guarda los DateTime en SQLite
+    ('YYYY-MM-DD HH:MM:SS.ffffff'): los cursores se comparan como texto.
+    """
+    def insert(count):
+        db = sqlite3.connect(database_path)
+        insert_user(db)
+        start = db.execute("SELECT count(*) FROM post").fetchone()[0]
+        db.executemany(
+            "INSERT INTO post (user_id, description, media_url, media_type, created_at, author_username) "
+            "VALUES (1, ?, ?, 'image', datetime('2024-01-01', ? || ' seconds') || '.000000', 'test')",
+            [(f"post {i}", f"/uploads/ab/cd/{i}.jpg", start + i + 1) for i in range(count)]
+        )
+        db.commit()
+        db.close()
+    return insert
@@ -0,0 +1,40 @@
+"""Cambiar el avatar libera la referencia del avatar guardado en user, no la de la caché de auth."""
+import sqlite3
+
+GIF = b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+
+
+def upload_avatar(client, headers, content):
+    response = client.put("/users/me/avatar", headers=headers, files={"file": ("a.gif", GIF + content, "image/gif")})
+    assert response.status_code == 200, response.text
+    return response.json()["avatar_url"]
+
+
+def refcount(database_path, url):
+    db = sqlite3.connect(database_path)
+    row = db.execute("SELECT refcount FROM media WHERE path = ?", (url[len("/uploads/"):],)).fetchone()
+    db.close()
+    return row[0] if row else 0
+
+
+def test_stale_auth_cache_does_not_leak_old_avatar(client, database_path):
+    from sqlalchemy.orm import make_transient_to_detached
+    from app.auth import auth_cache
+    from app.models import User
+
+    response = client.post("/auth/register", json={"name": "Avatar", "username": "avatar",
+                                                   "email": "avatar@x", "password": "secreta"})
+    headers = {"Authorization": "Bearer " + response.json()["access_token"]}
+    token = headers["Authorization"].split()[1]
+
+    first = upload_avatar(client, headers, b"primero")
+    assert client.get("/users/me", headers=headers).json()["avatar_url"] == first
+    # Copia desfasada, como la de otro worker que aún no vio el cambio
+    stale = User(**dict(auth_cache.get(token).dict(), avatar_url=None))
+    make_transient_to_detached(stale)
+    auth_cache.set(token, stale, ttl=60)
+
+    second = upload_avatar(client, headers, b"segundo")
+
+    assert refcount(database_path, first) == 0
+    assert refcount(database_path, second) == 1
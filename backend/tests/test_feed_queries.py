@@ -0,0 +1,58 @@
+"""El feed ejecuta el mismo número de sentencias SQL sea cual sea el número de posts."""
+import re
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import event
+
+POSTS = 20
+# Los hilos de la cola de trabajos consultan job en segundo plano: no cuentan para la petición
+JOB_STATEMENT = re.compile(r"\bjob\b", re.IGNORECASE)
+
+
+@pytest.fixture
+def statements(client):
+    from app.database import engine
+
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not JOB_STATEMENT.search(statement):
+            executed.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def wait_for_jobs(database_path, timeout=10):
+    """Espera a que la cola quede vacía: los trabajos de tests anteriores (fan-out...) no deben contarse."""
+    db = sqlite3.connect(database_path)
+    try:
+        deadline = time.monotonic() + timeout
+        while db.execute("SELECT COUNT(*) FROM job WHERE status IN ('pending', 'running')").fetchone()[0]:
+            assert time.monotonic() < deadline, "La cola de trabajos no terminó"
+            time.sleep(0.05)
+    finally:
+        db.close()
+
+
+def count_statements(client, headers, statements, url, database_path):
+    wait_for_jobs(database_path)
+    del statements[:]
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    return len(statements), len(response.json())
+
+
+@pytest.mark.parametrize("url", ["/posts?limit={n}", "/posts", "/users/1/posts?limit={n}", "/users/1/posts"])
+def test_feed_statement_count_is_constant(client, auth_headers, database_path, insert_posts, statements, url):
+    client.get("/users/me", headers=auth_headers)  # el usuario del token queda en la caché de auth
+    insert_posts(POSTS)
+    small, small_posts = count_statements(client, auth_headers, statements, url.format(n=POSTS), database_path)
+    insert_posts(2 * POSTS)
+    large, large_posts = count_statements(client, auth_headers, statements, url.format(n=3 * POSTS), database_path)
+
+    assert large_posts >= small_posts + 2 * POSTS
+    assert small == large
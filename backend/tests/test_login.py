@@ -0,0 +1,76 @@
+"""Login: re-hash de contraseñas con otro coste de bcrypt y límite de intentos fallidos."""
+import sqlite3
+
+import pytest
+from passlib.context import CryptContext
+
+legacy_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+
+
+def insert_user(database_path, email, hashed_password):
+    db = sqlite3.connect(database_path)
+    db.execute("INSERT INTO user (name, username, email, hashed_password, follower_count) VALUES ('Login', ?, ?, ?, 0)",
+               (email.split("@")[0], email, hashed_password))
+    db.commit()
+    db.close()
+
+
+def stored_hash(database_path, email):
+    db = sqlite3.connect(database_path)
+    row = db.execute("SELECT hashed_password FROM user WHERE email = ?", (email,)).fetchone()
+    db.close()
+    return row[0]
+
+
+def login(client, email, password):
+    return client.post("/auth/login", json={"email": email, "password": password})
+
+
+@pytest.fixture
+def limiters(monkeypatch):
+    """Limitadores nuevos (3 fallos por cuenta): los fallos de otros tests no cuentan."""
+    import app.main
+    from app.passwords import LoginRateLimiter
+
+    monkeypatch.setattr(app.main, "account_login_limiter", LoginRateLimiter(3, 60))
+    monkeypatch.setattr(app.main, "ip_login_limiter", LoginRateLimiter(100, 60))
+
+
+def test_legacy_hash_is_rehashed_on_login(client, database_path):
+    from app.passwords import BCRYPT_ROUNDS
+
+    insert_user(database_path, "legacy@x", legacy_context.hash("secreta"))
+
+    assert login(client, "legacy@x", "secreta").status_code == 200
+
+    rehashed = stored_hash(database_path, "legacy@x")
+    assert rehashed.startswith(f"$2b${BCRYPT_ROUNDS:02d}$")
+    assert login(client, "legacy@x", "secreta").status_code == 200
+    assert stored_hash(database_path, "legacy@x") == rehashed
+
+
+def test_repeated_failures_are_rate_limited(client, database_path, limiters):
+    from app.passwords import hash_password
+
+    for email in ("limite@x", "vecina@x"):
+        insert_user(database_path, email, hash_password("secreta"))
+
+    for _ in range(3):
+        assert login(client, "limite@x", "incorrecta").status_code == 400
+
+    response = login(client, "limite@x", "secreta")
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= 60
+    # El límite es por cuenta: otra desde la misma IP sigue entrando
+    assert login(client, "vecina@x", "secreta").status_code == 200
+
+
+def test_successful_login_resets_failures(client, database_path, limiters):
+    from app.passwords import hash_password
+
+    insert_user(database_path, "reinicio@x", hash_password("secreta"))
+
+    for _ in range(2):
+        for _ in range(2):
+            assert login(client, "reinicio@x", "incorrecta").status_code == 400
+        assert login(client, "reinicio@x", "secreta").status_code == 200
@@ -0,0 +1,12 @@
+"""Los endpoints de operación piden token salvo /metrics, que consulta el scraper de Prometheus."""
+import pytest
+
+
+@pytest.mark.parametrize("url", ["/jobs/stats", "/metrics/slow-requests", "/cache/stats"])
+def test_requires_token(client, auth_headers, url):
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=auth_headers).status_code == 200
+
+
+def test_metrics_is_open(client):
+    assert client.get("/metrics").status_code == 200
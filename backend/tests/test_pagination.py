@@ -0,0 +1,49 @@
+"""Paginación por cursor (keyset) de las listas de posts."""
+import sqlite3
+
+import pytest
+
+
+def insert_tied_posts(database_path, count):
+    """count posts del usuario 1 con el mismo created_at: sólo el id los ordena."""
+    db = sqlite3.connect(database_path)
+    db.executemany(
+        "INSERT INTO post (user_id, description, media_url, media_type, created_at, author_username) "
+        "VALUES (1, ?, '/uploads/ab/cd/empate.jpg', 'image', '2024-06-01 00:00:00.000000', 'test')",
+        [(f"empate {i}",) for i in range(count)]
+    )
+    db.commit()
+    db.close()
+
+
+def ids(response):
+    assert response.status_code == 200, response.text
+    return [post["id"] for post in response.json()]
+
+
+@pytest.mark.parametrize("url", ["/posts", "/users/1/posts"])
+def test_pages_cover_the_list_without_duplicates_or_gaps(client, auth_headers, database_path, insert_posts, url):
+    insert_posts(5)
+    insert_tied_posts(database_path, 3)
+    expected = ids(client.get(url, headers=auth_headers))
+
+    pages, cursor = [], None
+    for _ in range(len(expected) + 1):  # acotado: un cursor que no avanza no debe colgar el test
+        params = {"limit": 2, **({"before": cursor} if cursor else {})}
+        response = client.get(url, params=params, headers=auth_headers)
+        pages.append(ids(response))
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    else:
+        pytest.fail("El cursor no avanza")
+
+    assert len(pages) > 2
+    assert [post_id for page in pages for post_id in page] == expected
+
+
+@pytest.mark.parametrize("before", ["abc", "2024-01-01T00:00:00", "2024-01-01T00:00:00,x", "ayer,1"])
+def test_malformed_cursor_is_rejected(client, auth_headers, before):
+    response = client.get("/posts", params={"limit": 2, "before": before}, headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
@@ -0,0 +1,20 @@
+"""created_at sale en UTC con milisegundos y Z, como en api_server_fixed.py."""
+import re
+
+TIMESTAMP = re.compile(r"^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z$")
+GIF = b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+
+
+def test_created_at_matches_flask_format(client, auth_headers):
+    files = {"file": ("a.gif", GIF + b"timestamps", "image/gif")}
+    created = client.post("/posts", headers=auth_headers, data={"description": "fecha"}, files=files)
+    assert created.status_code == 200, created.text
+    post_id = created.json()["id"]
+
+    updated = client.put(f"/posts/{post_id}", headers=auth_headers, data={"description": "fecha editada"})
+    listed = client.get("/posts?limit=1", headers=auth_headers)
+    single = client.get(f"/posts/{post_id}")
+
+    for body in (created.json(), updated.json(), listed.json()[0], single.json()):
+        assert TIMESTAMP.match(body["created_at"]), body["created_at"]
+    assert created.json()["created_at"] == updated.json()["created_at"] == single.json()["created_at"]
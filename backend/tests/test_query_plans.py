@@ -0,0 +1,119 @@
+"""Las sentencias que ejecutan las rutas calientes y la cola de trabajos usan índices.
+
+No se reescriben las consultas: se recorre la API con el TestClient, se
+recoge cada sentencia que SQLAlchemy envía a la base (con sus parámetros) y
+se le pasa EXPLAIN QUERY PLAN. Falla si alguna recorre una tabla entera o
+necesita ordenar. Sólo con SQLite, que es la base de los tests.
+"""
+import re
+import sqlite3
+import time
+
+import pytest
+from sqlalchemy import event
+
+GIF = (b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,"
+       b"\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;")
+# Sentencias sin plan que revisar
+SKIPPED = re.compile(r"^\s*(BEGIN|COMMIT|ROLLBACK|PRAGMA|SAVEPOINT|RELEASE)", re.IGNORECASE)
+# Ordenar es inevitable al mezclar varios autores (como mucho limit filas por autor) y al ordenar por relevancia
+SORT_ALLOWED = re.compile(r"post\.user_id IN \(|MATCH", re.IGNORECASE)
+
+
+def plan_problems(details, allow_sort):
+    """Pasos del plan que delatan un recorrido completo (salvo FTS) o un ordenado."""
+    problems = []
+    for detail in details:
+        if detail.startswith("SCAN ") and " USING " not in detail and "VIRTUAL TABLE" not in detail:
+            problems.append(detail)
+        if "TEMP B-TREE" in detail and not allow_sort:
+            problems.append(detail)
+    return problems
+
+
+@pytest.fixture
+def statements(client):
+    """(sentencia, parámetros) de cada SQL que ejecutan las peticiones y la cola de trabajos durante el test."""
+    from app.database import engine
+
+    if engine.dialect.name != "sqlite":
+        pytest.skip("EXPLAIN QUERY PLAN sólo se revisa con SQLite")
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            executed.append((statement, tuple(parameters or ())))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    yield executed
+    event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+def upload(client, headers, url, description=None, method="post"):
+    data = {"description": description} if description is not None else {}
+    files = {"file": ("a.gif", GIF + (description or "avatar").encode(), "image/gif")}
+    response = client.request(method, url, headers=headers, data=data, files=files)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def wait_for_jobs(database_path, timeout=10):
+    """Espera a que la cola quede vacía, consultándola fuera del engine para no mezclar estas sentencias."""
+    db = sqlite3.connect(database_path)
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pending = db.execute("SELECT COUNT(*) FROM job WHERE status IN ('pending', 'running')").fetchone()[0]
+            if not pending:
+                return
+            time.sleep(0.05)
+        raise AssertionError(f"La cola de trabajos no terminó: {pending} pendientes")
+    finally:
+        db.close()
+
+
+def test_hot_queries_use_indexes(client, auth_headers, database_path, statements, monkeypatch):
+    import app.main
+    import app.timeline
+
+    # Con umbral 0 los posts de las cuentas seguidas se mezclan al leer: se cubren ambos caminos del feed
+    monkeypatch.setattr(app.main, "FANOUT_ON_READ_THRESHOLD", 0)
+    monkeypatch.setattr(app.timeline, "FANOUT_ON_READ_THRESHOLD", 0)
+
+    response = client.post("/auth/register", json={"name": "Autora", "username": "autora",
+                                                   "email": "autora@x", "password": "secreta"})
+    assert response.status_code == 200, response.text
+    author_id = response.json()["user_id"]
+    response = client.post("/auth/login", json={"email": "autora@x", "password": "secreta"})
+    author_headers = {"Authorization": "Bearer " + response.json()["access_token"]}
+
+    assert client.post(f"/users/{author_id}/follow", headers=auth_headers).status_code == 200
+    posts = [upload(client, author_headers, "/posts", f"playa {i}") for i in range(3)]
+    wait_for_jobs(database_path)
+
+    cursor = client.get("/posts?limit=2", headers=auth_headers).headers["X-Next-Cursor"]
+    for url in ["/posts", "/posts?limit=2", f"/posts?limit=2&before={cursor}",
+                f"/users/{author_id}/posts?limit=2", f"/users/{author_id}/posts?limit=2&before={cursor}",
+                "/feed/home?limit=2", f"/feed/home?limit=2&before={cursor}",
+                f"/posts/{posts[0]['id']}", f"/posts?ids={posts[0]['id']},{posts[1]['id']}",
+                f"/users/{author_id}", "/users/me", "/search?q=playa", "/search?q=aut&type=users", "/sync?since=0"]:
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200, (url, response.text)
+
+    assert client.put(f"/posts/{posts[0]['id']}", headers=author_headers, data={"description": "editado"}).status_code == 200
+    assert client.delete(f"/posts/{posts[1]['id']}", headers=author_headers).status_code == 200
+    assert client.put("/users/me", headers=author_headers, data={"bio": "hola"}).status_code == 200
+    upload(client, author_headers, "/users/me/avatar", method="put")
+    assert client.delete(f"/users/{author_id}/follow", headers=auth_headers).status_code == 200
+    wait_for_jobs(database_path)
+
+    db = sqlite3.connect(database_path)
+    failures = {}
+    for sql, parameters in dict.fromkeys(statement for statement in statements if not SKIPPED.match(statement[0])):
+        details = [row[3] for row in db.execute("EXPLAIN QUERY PLAN " + sql, parameters)]
+        problems = plan_problems(details, SORT_ALLOWED.search(sql))
+        if problems:
+            failures[" ".join(sql.split())] = problems
+    db.close()
+    assert len(statements) > 50
+    assert not failures
@@ -0,0 +1,56 @@
+"""Los cuerpos demasiado grandes se rechazan con 413 antes de parsear el formulario."""
+import os
+import sqlite3
+
+import pytest
+
+LIMIT = 1024
+
+
+@pytest.fixture
+def small_limit(monkeypatch):
+    import app.storage
+    monkeypatch.setattr(app.storage, "MAX_REQUEST_SIZE", LIMIT)
+
+
+def post_count(database_path):
+    db = sqlite3.connect(database_path)
+    count = db.execute("SELECT count(*) FROM post").fetchone()[0]
+    db.close()
+    return count
+
+
+def staged_files():
+    return [name for name in os.listdir("uploads") if name.startswith(".tmp-")]
+
+
+def multipart(size):
+    """Formulario de subida con un archivo de size bytes, ya codificado."""
+    boundary = "limite"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"description\"\r\n\r\ngrande\r\n"
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.gif\"\r\n"
+            f"Content-Type: image/gif\r\n\r\n").encode() + b"x" * size + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def test_content_length_over_limit_is_rejected(client, auth_headers, database_path, small_limit):
+    before = post_count(database_path)
+    body, headers = multipart(LIMIT)
+
+    response = client.post("/posts", headers={**auth_headers, **headers}, content=body)
+
+    assert response.status_code == 413
+    assert response.json() == {"detail": "File too large"}
+    assert post_count(database_path) == before
+
+
+def test_streamed_body_over_limit_is_rejected(client, auth_headers, database_path, small_limit):
+    before = post_count(database_path)
+    body, headers = multipart(LIMIT)
+    chunks = (body[i:i + 256] for i in range(0, len(body), 256))  # sin Content-Length: chunked
+
+    response = client.post("/posts", headers={**auth_headers, **headers}, content=chunks)
+
+    assert response.status_code == 413
+    assert post_count(database_path) == before
+    assert staged_files() == []
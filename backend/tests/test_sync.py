@@ -0,0 +1,17 @@
+"""GET /sync: sólo con token, y devuelve los cambios posteriores a since."""
+
+
+def test_sync_requires_token(client):
+    assert client.get("/sync").status_code == 401
+
+
+def test_sync_returns_changes_since_version(client, auth_headers):
+    version = client.get("/sync", headers=auth_headers).json()["version"]
+    post = client.post("/posts", headers=auth_headers, data={"description": "nuevo"},
+                       files={"file": ("a.gif", b"GIF89a-sync", "image/gif")}).json()
+    assert client.delete(f"/posts/{post['id']}", headers=auth_headers).status_code == 200
+
+    changes = client.get("/sync", headers=auth_headers, params={"since": version}).json()
+    assert changes["posts"] == []
+    assert changes["deleted_post_ids"] == [post["id"]]
+    assert changes["version"] > version
@@ -0,0 +1,67 @@
+"""fan_out_post recorta la timeline del autor aunque el post no se reparta a nadie."""
+import sqlite3
+
+import pytest
+
+KEEP = 2
+
+
+def add_user(db, user_id, follower_count=0):
+    db.execute("INSERT INTO user (id, name, username, email, hashed_password, follower_count) VALUES (?, ?, ?, ?, '-', ?)",
+               (user_id, f"Usuario {user_id}", f"user{user_id}", f"user{user_id}@x", follower_count))
+
+
+def fan_out_posts(client, database_path, author_id, count):
+    from app.timeline import fan_out_post
+
+    db = sqlite3.connect(database_path)
+    post_ids = [db.execute(
+        "INSERT INTO post (user_id, description, media_url, media_type, created_at, author_username) "
+        "VALUES (?, 'post', '/uploads/x.jpg', 'image', datetime('2024-01-01', ? || ' seconds'), ?)",
+        (author_id, i, f"user{author_id}")
+    ).lastrowid for i in range(count)]
+    db.commit()
+    db.close()
+    for post_id in post_ids:
+        # En el event loop de la app, donde vive el engine async
+        client.portal.call(fan_out_post, post_id)
+
+
+def timeline_length(database_path, user_id):
+    db = sqlite3.connect(database_path)
+    length = db.execute("SELECT count(*) FROM timeline WHERE user_id = ?", (user_id,)).fetchone()[0]
+    db.close()
+    return length
+
+
+@pytest.fixture
+def keep_two(monkeypatch):
+    import app.timeline
+    monkeypatch.setattr(app.timeline, "TIMELINE_MAX_LENGTH", KEEP)
+
+
+def test_author_without_followers_is_trimmed(client, database_path, keep_two):
+    db = sqlite3.connect(database_path)
+    add_user(db, 101)
+    db.commit()
+    db.close()
+
+    fan_out_posts(client, database_path, 101, 5)
+
+    assert timeline_length(database_path, 101) == KEEP
+
+
+def test_author_over_threshold_is_trimmed(client, database_path, keep_two, monkeypatch):
+    import app.timeline
+    monkeypatch.setattr(app.timeline, "FANOUT_ON_READ_THRESHOLD", 0)
+    db = sqlite3.connect(database_path)
+    add_user(db, 102, follower_count=1)
+    add_user(db, 103)
+    db.execute("INSERT INTO follow (follower_id, followee_id, created_at) VALUES (103, 102, '2024-01-01 00:00:00')")
+    db.commit()
+    db.close()
+
+    fan_out_posts(client, database_path, 102, 5)
+
+    assert timeline_length(database_path, 102) == KEEP
+    assert timeline_length(database_path, 103) == 0  # se lee al vuelo en /feed/home
@@ -0,0 +1,145 @@
+"""Benchmark de serialización de listas de posts (antes/después) por cada 10k posts.
+
+Compara, para ambos servidores, la ruta antigua (sqlite3.Row/PostRead +
+jsonify/jsonable_encoder) con la actual (tuplas/dicts + orjson; en Flask
+además sin JOIN, con la copia del autor guardada en posts). No necesita
+servidor en marcha: trabaja sobre filas generadas en memoria.
+
+    python bench/serialization.py [--posts 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def best_of(repeat, func):
+    """Mejor tiempo (ms) de repeat ejecuciones; el mejor es el menos ruidoso."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def seed_rows(count):
+    """Base SQLite en memoria con count posts de 100 autores, igual que el esquema Flask."""
+    conn = sqlite3.connect(':memory:')
+    conn.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, avatar_url TEXT);
+        CREATE TABLE posts (id INTEGER PRIMARY KEY, user_id INTEGER, description TEXT,
+                            media_url TEXT, media_type TEXT, created_at INTEGER,
+                            author_username TEXT, author_avatar_url TEXT);
+    """)
+    conn.executemany("INSERT INTO users VALUES (?, ?, ?)",
+                     [(i, f"user{i}", f"ab/cd/{i:064x}.jpg" if i % 2 else None) for i in range(100)])
+    base = int(datetime(2024, 1, 1).timestamp() * 1000)
+    conn.executemany("INSERT INTO posts VALUES (?, ?, ?, ?, ?, ?, NULL, NULL)", [
+        (i, i % 100, f"Descripción del post número {i} con algo de texto",
+         f"{i % 256:02x}/{i % 255:02x}/{i:064x}." + ("jpg" if i % 3 else "mp4"),
+         'image' if i % 3 else 'video', base + i * 1000)
+        for i in range(count)
+    ])
+    conn.execute("""
+        UPDATE posts SET author_username = (SELECT username FROM users WHERE users.id = posts.user_id),
+                         author_avatar_url = (SELECT avatar_url FROM users WHERE users.id = posts.user_id)
+    """)
+    return conn
+
+
+def bench_flask(conn, repeat):
+    os.chdir(tempfile.mkdtemp())  # init_db() se ejecuta al importar el servidor
+    os.environ.setdefault('SECRET_KEY', 'bench-secret-key')
+    sys.path.insert(0, ROOT)
+    import api_server_fixed as server
+    from flask import jsonify
+
+    before_sql = ("SELECT p.*, u.username, u.avatar_url AS user_avatar FROM posts p "
+                  "JOIN users u ON p.user_id = u.id ORDER BY p.id DESC")
+    sql = f"SELECT {server.POST_LIST_COLUMNS} FROM posts p ORDER BY p.id DESC"
+
+    def before():
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(before_sql).fetchall()
+        return jsonify([server.post_row_to_json(row) for row in rows]).get_data()
+
+    def after():
+        conn.row_factory = None
+        rows = conn.execute(sql).fetchall()
+        return server.post_tuples_to_json(rows)
+
+    with server.app.test_request_context(base_url='http://localhost:5000'):
+        assert json.loads(before()) == json.loads(after())
+        return best_of(repeat, before), best_of(repeat, after)
+
+
+def bench_fastapi(conn, repeat):
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite'))
+    os.environ.setdefault('SECRET_KEY', 'bench-secret-key')
+    sys.path.insert(0, os.path.join(ROOT, 'backend'))
+    from fastapi.encoders import jsonable_encoder
+    from app.main import dumps, format_timestamp, post_rows_to_dicts
+    from app.models import PostRead
+    from app.storage import variant_urls
+
+    conn.row_factory = None
+    rows = [
+        (post_id, user_id, description, f"/uploads/{media_url}", media_type,
+         datetime.utcfromtimestamp(created_at / 1000), username, avatar)
+        for post_id, user_id, description, media_url, media_type, created_at, username, avatar
+        in conn.execute("SELECT p.id, p.user_id, p.description, p.media_url, p.media_type, p.created_at, "
+                        "u.username, u.avatar_url FROM posts p JOIN users u ON p.user_id = u.id ORDER BY p.id DESC")
+    ]
+
+    def before():
+        posts = [
+            PostRead(id=row[0], user_id=row[1], description=row[2], media_url=row[3], media_type=row[4],
+                     created_at=row[5], username=row[6] or "Unknown", user_avatar=row[7],
+                     **variant_urls(row[3], row[4]))
+            for row in rows
+        ]
+        return json.dumps(jsonable_encoder(posts))
+
+    def after():
+        return dumps(post_rows_to_dicts(rows))
+
+    expected = json.loads(before())
+    for post in expected:
+        # jsonable_encoder usa isoformat() (microsegundos, sin zona); la API sigue el formato de Flask
+        post["created_at"] = format_timestamp(datetime.fromisoformat(post["created_at"]))
+    assert expected == json.loads(after())
+    return best_of(repeat, before), best_of(repeat, after)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = seed_rows(args.posts)
+    scale = 10000 / args.posts
+    results = {}
+    for name, bench in (('flask', bench_flask), ('fastapi', bench_fastapi)):
+        try:
+            before, after = bench(conn, args.repeat)
+        except ImportError as exc:
+            print(f"{name}: omitido ({exc})", file=sys.stderr)
+            continue
+        results[name] = {
+            'before_ms_per_10k': round(before * scale, 1),
+            'after_ms_per_10k': round(after * scale, 1),
+            'speedup': round(before / after, 2),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def server():
+    """api_server_fixed importado en un directorio temporal (init_db crea ahí la base y uploads/)."""
+    os.chdir(tempfile.mkdtemp())
+    os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+    sys.path.insert(0, ROOT)
+    import api_server_fixed
+    # El usuario 1 de auth_headers existe antes de que ningún test registre otros
+    db = api_server_fixed.db_pool.acquire()
+    db.execute("INSERT INTO users (id, name, username, email, passwordHash) VALUES (1, 'Test', 'test', 'test@x', '-')")
+    db.commit()
+    api_server_fixed.db_pool.release(db)
+    return api_server_fixed
+
+
+@pytest.fixture(scope='session')
+def auth_headers(server):
+    """Cabecera Bearer del usuario 1, creado directamente en la base."""
+    token = server.create_token({"id": 1, "username": "test", "email": "test@x"}, 'access')
+    return {'Authorization': f'Bearer {token}'}
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def insert_posts(server):
+    """Inserta count posts del usuario 1, con created_at crecientes dentro de 2024.
+
+    Quedan por detrás de los posts que crean los tests por la API (con la hora actual).
+    """
+    def insert(count):
+        db = server.db_pool.acquire()
+        start = db.execute("SELECT coalesce(max(created_at), 1704067200000) FROM posts "
+                           "WHERE created_at < 1735689600000").fetchone()[0]
+        db.executemany(
+            "INSERT INTO posts (user_id, description, media_url, media_type, created_at, author_username) "
+            "VALUES (1, ?, ?, 'image', ?, 'test')",
+            [(f"post {i}", f"ab/cd/{i}.jpg", start + (i + 1) * 1000) for i in range(count)]
+        )
+        db.commit()
+        server.db_pool.release(db)
+    return insert
+
+
+@pytest.fixture
+def statements(server, monkeypatch):
+    """(hilo, sentencia) de cada SQL que ejecutan las peticiones y la cola de trabajos durante el test.
+
+    Usa set_trace_callback sobre las conexiones de un pool nuevo, que reciben
+    la sentencia con sus parámetros ya sustituidos.
+    """
+    executed = []
+
+    class TracedPool(server.ConnectionPool):
+        def _connect(self):
+            db = super()._connect()
+            db.set_trace_callback(lambda sql: executed.append((threading.current_thread(), sql)))
+            return db
+
+    pool = TracedPool(server.DATABASE, server.SQLITE_POOL_SIZE)
+    monkeypatch.setattr(server, 'db_pool', pool)
+    monkeypatch.setattr(server.job_queue, 'pool', pool)
+    return executed
@@ -0,0 +1,32 @@
+"""Cambiar la bio no toca la copia del autor en los posts ni invalida el feed."""
+
+
+def test_bio_update_does_not_refresh_author(server, client, auth_headers):
+    response = client.put('/users/me', headers=auth_headers, data={'bio': 'nueva bio'})
+    assert response.status_code == 200
+    db = server.db_pool.acquire()
+    jobs = db.execute("SELECT count(*) FROM jobs WHERE kind = 'refresh_author'").fetchone()[0]
+    server.db_pool.release(db)
+    assert jobs == 0
+
+
+def test_refresh_without_stale_posts_keeps_feed_cache(server, insert_posts, monkeypatch):
+    insert_posts(3)
+    invalidated = []
+    monkeypatch.setattr(server.response_cache, 'invalidate', lambda *tags: invalidated.append(tags))
+    server.refresh_author_snapshot(1)
+    assert invalidated == []
+
+    db = server.db_pool.acquire()
+    db.execute("UPDATE users SET username = 'renombrado' WHERE id = 1")
+    db.commit()
+    server.db_pool.release(db)
+    try:
+        server.refresh_author_snapshot(1)
+    finally:
+        db = server.db_pool.acquire()
+        db.execute("UPDATE users SET username = 'test' WHERE id = 1")
+        db.execute("UPDATE posts SET author_username = 'test' WHERE user_id = 1")
+        db.commit()
+        server.db_pool.release(db)
+    assert invalidated == [('feed', 'author:1')]
@@ -0,0 +1,56 @@
+"""Dos cambios de avatar simultáneos liberan cada archivo anterior una sola vez."""
+import io
+import threading
+import time
+
+GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,'
+       b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+
+def upload_avatar(client, headers, content, results=None):
+    response = client.put('/users/me/avatar', headers=headers, data={'file': (io.BytesIO(GIF + content), 'a.gif')})
+    assert response.status_code == 200, response.data
+    path = response.get_json()['avatar_url'].split('/uploads/', 1)[1]  # la API devuelve la URL completa
+    if results is not None:
+        results.append(path)
+    return path
+
+
+def refcount(server, path):
+    db = server.db_pool.acquire()
+    row = db.execute("SELECT refcount FROM media WHERE path = ?", (path,)).fetchone()
+    server.db_pool.release(db)
+    return row[0] if row else 0
+
+
+def test_concurrent_avatar_updates_release_each_old_file_once(server, monkeypatch):
+    client = server.app.test_client()
+    response = client.post('/auth/register', json={'name': 'Avatar', 'username': 'avatar',
+                                                   'email': 'avatar@x', 'password': 'secreta'})
+    assert response.status_code == 201, response.data
+    headers = {'Authorization': 'Bearer ' + response.get_json()['token']}
+    first = upload_avatar(client, headers, b'primero')
+
+    # Cada subida se queda un momento dentro de su transacción: la otra llega mientras tanto
+    add_media_ref = server.add_media_ref
+
+    def slow_add_media_ref(cursor, path, size):
+        add_media_ref(cursor, path, size)
+        time.sleep(0.2)
+
+    monkeypatch.setattr(server, 'add_media_ref', slow_add_media_ref)
+    results = []
+    threads = [threading.Thread(target=upload_avatar, args=(server.app.test_client(), headers, content, results))
+               for content in (b'segundo', b'tercero')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    db = server.db_pool.acquire()
+    current = db.execute("SELECT avatar_url FROM users WHERE username = 'avatar'").fetchone()[0]
+    server.db_pool.release(db)
+    replaced = [path for path in results if path != current]
+    assert refcount(server, first) == 0
+    assert [refcount(server, path) for path in replaced] == [0]
+    assert refcount(server, current) == 1
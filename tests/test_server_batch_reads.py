@@ -0,0 +1,68 @@
+"""Lecturas por lotes de posts y usuarios."""
+import io
+
+import pytest
+
+GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,'
+       b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+MISSING = 999999
+
+
+def create_post(client, headers, description):
+    data = {'description': description, 'file': (io.BytesIO(GIF + description.encode()), 'a.gif')}
+    response = client.post('/posts', headers=headers, data=data)
+    assert response.status_code == 201, response.data
+    return response.get_json()['id']
+
+
+def batch(client, headers, kind, ids, method):
+    if method == 'GET':
+        response = client.get(f"/{kind}?ids={','.join(map(str, ids))}", headers=headers)
+    else:
+        response = client.post(f'/{kind}/batch', headers=headers, json={'ids': ids})
+    assert response.status_code == 200, response.data
+    return [item['id'] for item in response.get_json()], response.headers.get('X-Missing-Ids')
+
+
+@pytest.fixture
+def post_ids(client, auth_headers):
+    return [create_post(client, auth_headers, f'lote {i}') for i in range(3)]
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+def test_batch_reads_require_token(client, method):
+    response = client.get('/posts?ids=1') if method == 'GET' else client.post('/posts/batch', json={'ids': [1]})
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+def test_posts_keep_requested_order_and_report_missing(client, auth_headers, post_ids, method):
+    a, b, c = post_ids
+
+    found, missing = batch(client, auth_headers, 'posts', [c, a, MISSING, b, a], method)
+
+    assert found == [c, a, b]
+    assert missing == str(MISSING)
+
+
+@pytest.mark.parametrize('method', ['GET', 'POST'])
+def test_users_keep_requested_order_and_report_missing(client, auth_headers, method):
+    response = client.post('/auth/register', json={'name': 'Lote', 'username': f'lote{method}',
+                                                   'email': f'lote{method}@x', 'password': 'secreta'})
+    user_id = response.get_json()['user_id']
+
+    found, missing = batch(client, auth_headers, 'users', [MISSING, user_id, 1, MISSING + 1], method)
+
+    assert found == [user_id, 1]
+    assert missing == f'{MISSING},{MISSING + 1}'
+
+
+def test_no_missing_header_when_all_found(client, auth_headers, post_ids):
+    assert batch(client, auth_headers, 'posts', post_ids, 'GET') == (post_ids, None)
+
+
+def test_invalid_batches_are_rejected(server, client, auth_headers):
+    too_many = list(range(1, server.MAX_BATCH_IDS + 2))
+    assert client.get('/posts?ids=1,x', headers=auth_headers).status_code == 400
+    assert client.post('/posts/batch', headers=auth_headers, json={'ids': []}).status_code == 400
+    assert client.post('/users/batch', headers=auth_headers, json={'ids': too_many}).status_code == 400
@@ -0,0 +1,27 @@
+"""El feed ejecuta el mismo número de sentencias SQL sea cual sea el número de posts."""
+import threading
+
+import pytest
+
+POSTS = 20
+
+
+def count_statements(client, statements, url, headers):
+    """Sentencias del hilo de la petición (no las de la cola de trabajos) y posts devueltos."""
+    del statements[:]
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    response.get_data()  # consume el stream de las listas sin paginar
+    thread = threading.current_thread()
+    return sum(1 for executed_by, _ in statements if executed_by is thread), len(response.get_json())
+
+
+@pytest.mark.parametrize('url', ['/posts?limit={n}', '/posts', '/users/1/posts?limit={n}', '/users/1/posts'])
+def test_feed_statement_count_is_constant(client, auth_headers, insert_posts, statements, url):
+    insert_posts(POSTS)
+    small, small_posts = count_statements(client, statements, url.format(n=POSTS), auth_headers)
+    insert_posts(2 * POSTS)
+    large, large_posts = count_statements(client, statements, url.format(n=3 * POSTS), auth_headers)
+
+    assert large_posts >= small_posts + 2 * POSTS
+    assert small == large
@@ -0,0 +1,65 @@
+"""Login: re-hash de contraseñas con un método antiguo y límite de intentos fallidos."""
+import pytest
+from werkzeug.security import generate_password_hash
+
+LEGACY_METHOD = 'pbkdf2:sha256:1000'
+
+
+def insert_user(server, email, password_hash):
+    db = server.db_pool.acquire()
+    db.execute("INSERT INTO users (name, username, email, passwordHash) VALUES ('Login', ?, ?, ?)",
+               (email.split('@')[0], email, password_hash))
+    db.commit()
+    server.db_pool.release(db)
+
+
+def stored_hash(server, email):
+    db = server.db_pool.acquire()
+    row = db.execute("SELECT passwordHash FROM users WHERE email = ?", (email,)).fetchone()
+    server.db_pool.release(db)
+    return row[0]
+
+
+def login(client, email, password):
+    return client.post('/auth/login', json={'email': email, 'password': password})
+
+
+def test_legacy_hash_is_rehashed_on_login(server, client):
+    insert_user(server, 'legacy@x', generate_password_hash('secreta', LEGACY_METHOD))
+
+    assert login(client, 'legacy@x', 'secreta').status_code == 200
+
+    rehashed = stored_hash(server, 'legacy@x')
+    assert rehashed.startswith(server.PASSWORD_HASH_METHOD + '$')
+    assert login(client, 'legacy@x', 'secreta').status_code == 200
+    assert stored_hash(server, 'legacy@x') == rehashed
+
+
+@pytest.fixture
+def limiters(server, monkeypatch):
+    """Limitadores nuevos (3 fallos por cuenta): los fallos de otros tests no cuentan."""
+    monkeypatch.setattr(server, 'account_login_limiter', server.LoginRateLimiter(3, 60))
+    monkeypatch.setattr(server, 'ip_login_limiter', server.LoginRateLimiter(100, 60))
+
+
+def test_repeated_failures_are_rate_limited(server, client, limiters):
+    for email in ('limite@x', 'vecina@x'):
+        insert_user(server, email, generate_password_hash('secreta', server.PASSWORD_HASH_METHOD))
+
+    for _ in range(3):
+        assert login(client, 'limite@x', 'incorrecta').status_code == 401
+
+    response = login(client, 'limite@x', 'secreta')
+    assert response.status_code == 429
+    assert 0 < int(response.headers['Retry-After']) <= 60
+    # El límite es por cuenta: otra desde la misma IP sigue entrando
+    assert login(client, 'vecina@x', 'secreta').status_code == 200
+
+
+def test_successful_login_resets_failures(server, client, limiters):
+    insert_user(server, 'reinicio@x', generate_password_hash('secreta', server.PASSWORD_HASH_METHOD))
+
+    for _ in range(2):
+        for _ in range(2):
+            assert login(client, 'reinicio@x', 'incorrecta').status_code == 401
+        assert login(client, 'reinicio@x', 'secreta').status_code == 200
@@ -0,0 +1,48 @@
+"""Paginación por cursor (keyset) de las listas de posts."""
+import pytest
+
+
+def insert_tied_posts(server, count):
+    """count posts del usuario 1 con el mismo created_at: sólo el id los ordena."""
+    db = server.db_pool.acquire()
+    created_at = db.execute("SELECT max(created_at) FROM posts WHERE created_at < 1735689600000").fetchone()[0] + 1000
+    db.executemany(
+        "INSERT INTO posts (user_id, description, media_url, media_type, created_at, author_username) "
+        "VALUES (1, ?, 'ab/cd/empate.jpg', 'image', ?, 'test')",
+        [(f"empate {i}", created_at) for i in range(count)]
+    )
+    db.commit()
+    server.db_pool.release(db)
+
+
+def ids(response):
+    assert response.status_code == 200, response.data
+    return [post['id'] for post in response.get_json()]
+
+
+@pytest.mark.parametrize('url', ['/posts', '/users/1/posts'])
+def test_pages_cover_the_list_without_duplicates_or_gaps(server, client, auth_headers, insert_posts, url):
+    insert_posts(5)
+    insert_tied_posts(server, 3)
+    server.response_cache.invalidate('feed', 'author:1')  # las filas se insertaron sin pasar por la API
+    expected = ids(client.get(url, headers=auth_headers))
+
+    pages, cursor = [], None
+    for _ in range(len(expected) + 1):  # acotado: un cursor que no avanza no debe colgar el test
+        query = f"{url}?limit=2" + (f"&before={cursor}" if cursor else "")
+        response = client.get(query, headers=auth_headers)
+        pages.append(ids(response))
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    else:
+        pytest.fail('El cursor no avanza')
+
+    assert len(pages) > 2
+    assert [post_id for page in pages for post_id in page] == expected
+
+
+@pytest.mark.parametrize('before', ['abc', '123', '1,x', 'x,1'])
+def test_malformed_cursor_is_rejected(client, auth_headers, before):
+    response = client.get(f'/posts?limit=2&before={before}', headers=auth_headers)
+    assert response.status_code == 400
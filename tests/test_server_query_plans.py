@@ -0,0 +1,98 @@
+"""Las sentencias que ejecutan las rutas calientes y la cola de trabajos usan índices.
+
+No se reescriben las consultas: se recorre la API con el test client, se
+recoge cada sentencia ejecutada (con sus parámetros) y se le pasa EXPLAIN
+QUERY PLAN. Falla si alguna recorre una tabla entera o necesita ordenar.
+"""
+import io
+import re
+import sqlite3
+import time
+
+GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,'
+       b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+# Sentencias sin plan que revisar y las que FTS5 lanza sobre sus tablas internas ('main'.'posts_fts_config'...)
+SKIPPED = re.compile(r"^\s*(--|BEGIN|COMMIT|ROLLBACK|PRAGMA)|'main'\.'\w+_fts_", re.IGNORECASE)
+# Ordenar es inevitable al mezclar varios autores (como mucho limit filas por autor) y al ordenar por relevancia
+SORT_ALLOWED = re.compile(r'p\.user_id IN \(|MATCH', re.IGNORECASE)
+
+
+def plan_problems(details, allow_sort):
+    """Pasos del plan que delatan un recorrido completo (salvo FTS) o un ordenado."""
+    problems = []
+    for detail in details:
+        if detail.startswith('SCAN ') and ' USING ' not in detail and 'VIRTUAL TABLE' not in detail:
+            problems.append(detail)
+        if 'TEMP B-TREE' in detail and not allow_sort:
+            problems.append(detail)
+    return problems
+
+
+def upload(client, headers, description):
+    data = {'description': description, 'file': (io.BytesIO(GIF + description.encode()), 'a.gif')}
+    response = client.post('/posts', headers=headers, data=data)
+    assert response.status_code == 201, response.data
+    return response.get_json()
+
+
+def wait_for_jobs(server, timeout=10):
+    """Espera a que la cola quede vacía, consultándola fuera del pool para no mezclar estas sentencias."""
+    db = sqlite3.connect(server.DATABASE)
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pending = db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+            if not pending:
+                return
+            server.job_queue._wakeup.set()
+            time.sleep(0.05)
+        raise AssertionError(f"La cola de trabajos no terminó: {pending} pendientes")
+    finally:
+        db.close()
+
+
+def test_hot_queries_use_indexes(server, client, auth_headers, statements, monkeypatch):
+    # Con umbral 0 los posts de las cuentas seguidas se mezclan al leer: se cubren ambos caminos del feed
+    monkeypatch.setattr(server, 'FANOUT_ON_READ_THRESHOLD', 0)
+
+    response = client.post('/auth/register', json={'name': 'Autora', 'username': 'autora',
+                                                   'email': 'autora@x', 'password': 'secreta'})
+    assert response.status_code == 201, response.data
+    author_id = response.get_json()['user_id']
+    response = client.post('/auth/login', json={'email': 'autora@x', 'password': 'secreta'})
+    author_headers = {'Authorization': 'Bearer ' + response.get_json()['token']}
+
+    assert client.post(f'/users/{author_id}/follow', headers=auth_headers).status_code == 204
+    posts = [upload(client, author_headers, f"playa {i}") for i in range(3)]
+    wait_for_jobs(server)
+
+    first = client.get('/posts?limit=2', headers=auth_headers)
+    cursor = first.headers['X-Next-Cursor']
+    since = cursor.split(',')[0]
+    for url in ['/posts', f'/posts?limit=2&before={cursor}', f'/posts?since={since}&limit=2',
+                f'/users/{author_id}/posts?limit=2', f'/users/{author_id}/posts?limit=2&before={cursor}',
+                '/feed/home?limit=2', f'/feed/home?limit=2&before={cursor}', f'/feed/home?since={since}',
+                f"/posts/{posts[0]['id']}", f"/posts?ids={posts[0]['id']},{posts[1]['id']}",
+                f'/users/{author_id}', '/users/me', '/search?q=playa', '/search?q=aut&type=users', '/sync?since=0']:
+        response = client.get(url, headers=auth_headers)
+        assert response.status_code == 200, (url, response.data)
+        response.get_data()
+
+    assert client.put(f"/posts/{posts[0]['id']}", headers=author_headers, data={'description': 'editado'}).status_code == 200
+    assert client.delete(f"/posts/{posts[1]['id']}", headers=author_headers).status_code == 204
+    assert client.put('/users/me', headers=author_headers, data={'bio': 'hola'}).status_code == 200
+    assert client.put('/users/me/avatar', headers=author_headers,
+                      data={'file': (io.BytesIO(GIF + b'avatar'), 'a.gif')}).status_code == 200
+    assert client.delete(f'/users/{author_id}/follow', headers=auth_headers).status_code == 204
+    wait_for_jobs(server)
+
+    db = sqlite3.connect(server.DATABASE)
+    failures = {}
+    for sql in dict.fromkeys(sql for _, sql in statements if not SKIPPED.search(sql)):
+        details = [row[3] for row in db.execute("EXPLAIN QUERY PLAN " + sql)]
+        problems = plan_problems(details, SORT_ALLOWED.search(sql))
+        if problems:
+            failures[" ".join(sql.split())] = problems
+    db.close()
+    assert len(statements) > 50
+    assert not failures
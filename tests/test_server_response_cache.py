@@ -0,0 +1,144 @@
+"""Cada escritura invalida las respuestas cacheadas a las que afecta."""
+import io
+import itertools
+import sqlite3
+import time
+
+import pytest
+
+GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,'
+       b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+authors = itertools.count()
+
+
+def wait_for_jobs(server, timeout=10):
+    """Espera a que la cola quede vacía: sus manejadores también invalidan la caché."""
+    db = sqlite3.connect(server.DATABASE)
+    try:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pending = db.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')").fetchone()[0]
+            if not pending:
+                return
+            server.job_queue._wakeup.set()
+            time.sleep(0.05)
+        raise AssertionError(f"La cola de trabajos no terminó: {pending} pendientes")
+    finally:
+        db.close()
+
+
+def cached(server, client, url, headers):
+    """GET que ya sale de la caché: falla si la respuesta no se está cacheando."""
+    wait_for_jobs(server)
+    client.get(url, headers=headers)
+    hits = server.response_cache.hits
+    response = client.get(url, headers=headers)
+    assert server.response_cache.hits == hits + 1, url
+    return response
+
+
+def fresh(client, url, headers):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.data
+    return response.get_json()
+
+
+def ids(posts):
+    return [post['id'] for post in posts]
+
+
+def media_path(url):
+    return url.split('/uploads/', 1)[1] if url else None
+
+
+@pytest.fixture
+def author(client):
+    """(id, cabeceras) de un usuario nuevo registrado por la API."""
+    n = next(authors)
+    response = client.post('/auth/register', json={'name': 'Autora', 'username': f'cache{n}',
+                                                   'email': f'cache{n}@x', 'password': 'secreta'})
+    assert response.status_code == 201, response.data
+    body = response.get_json()
+    return body['user_id'], {'Authorization': 'Bearer ' + body['token']}
+
+
+def create_post(client, headers, description):
+    data = {'description': description, 'file': (io.BytesIO(GIF + description.encode()), 'a.gif')}
+    response = client.post('/posts', headers=headers, data=data)
+    assert response.status_code == 201, response.data
+    return response.get_json()['id']
+
+
+def test_create_post_invalidates_lists(server, client, author):
+    author_id, headers = author
+    lists = ['/posts?limit=5', f'/users/{author_id}/posts?limit=5']
+    for url in lists:
+        cached(server, client, url, headers)
+
+    post_id = create_post(client, headers, 'nuevo')
+
+    for url in lists:
+        assert ids(fresh(client, url, headers))[0] == post_id
+
+
+def test_edit_post_invalidates_post_and_lists(server, client, author):
+    author_id, headers = author
+    post_id = create_post(client, headers, 'antes')
+    urls = [f'/posts/{post_id}', '/posts?limit=5', f'/users/{author_id}/posts?limit=5']
+    for url in urls:
+        cached(server, client, url, headers)
+
+    assert client.put(f'/posts/{post_id}', headers=headers, data={'description': 'después'}).status_code == 200
+
+    assert fresh(client, urls[0], headers)['description'] == 'después'
+    for url in urls[1:]:
+        assert {post['id']: post['description'] for post in fresh(client, url, headers)}[post_id] == 'después'
+
+
+def test_delete_post_invalidates_post_and_lists(server, client, author):
+    author_id, headers = author
+    post_id = create_post(client, headers, 'borrar')
+    urls = [f'/posts/{post_id}', '/posts?limit=5', f'/users/{author_id}/posts?limit=5']
+    for url in urls:
+        cached(server, client, url, headers)
+
+    assert client.delete(f'/posts/{post_id}', headers=headers).status_code == 204
+
+    assert client.get(urls[0], headers=headers).status_code == 404
+    for url in urls[1:]:
+        assert post_id not in ids(fresh(client, url, headers))
+
+
+def test_profile_and_avatar_invalidate_user_and_author_posts(server, client, author):
+    author_id, headers = author
+    create_post(client, headers, 'con avatar')
+    urls = [f'/users/{author_id}', f'/users/{author_id}/posts?limit=5']
+    for url in urls:
+        cached(server, client, url, headers)
+
+    assert client.put('/users/me', headers=headers, data={'bio': 'nueva bio'}).status_code == 200
+    assert fresh(client, urls[0], headers)['bio'] == 'nueva bio'
+
+    cached(server, client, urls[0], headers)
+    response = client.put('/users/me/avatar', headers=headers, data={'file': (io.BytesIO(GIF + b'avatar'), 'a.gif')})
+    assert response.status_code == 200, response.data
+    avatar = media_path(response.get_json()['avatar_url'])
+
+    assert media_path(fresh(client, urls[0], headers)['avatar_url']) == avatar
+    wait_for_jobs(server)  # refresh_author copia el avatar nuevo en los posts e invalida sus listas
+    assert {media_path(post['user_avatar']) for post in fresh(client, urls[1], headers)} == {avatar}
+
+
+def test_follow_and_unfollow_are_reflected_in_home_feed(server, client, auth_headers, author):
+    author_id, headers = author
+    post_id = create_post(client, headers, 'para seguidores')
+    wait_for_jobs(server)
+    assert post_id not in ids(fresh(client, '/feed/home?limit=50', auth_headers))
+
+    assert client.post(f'/users/{author_id}/follow', headers=auth_headers).status_code == 204
+    wait_for_jobs(server)
+    assert post_id in ids(fresh(client, '/feed/home?limit=50', auth_headers))
+
+    assert client.delete(f'/users/{author_id}/follow', headers=auth_headers).status_code == 204
+    wait_for_jobs(server)
+    assert post_id not in ids(fresh(client, '/feed/home?limit=50', auth_headers))
@@ -0,0 +1,69 @@
+"""Búsqueda de texto completo: relevancia, prefijos y paginación."""
+import io
+
+import pytest
+
+GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,'
+       b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+
+def create_post(client, headers, description):
+    data = {'description': description, 'file': (io.BytesIO(GIF + description.encode()), 'a.gif')}
+    response = client.post('/posts', headers=headers, data=data)
+    assert response.status_code == 201, response.data
+    return response.get_json()['id']
+
+
+def search(client, headers, **params):
+    response = client.get('/search', headers=headers, query_string=params)
+    assert response.status_code == 200, response.data
+    return [item['id'] for item in response.get_json()], response.headers.get('X-Next-Cursor')
+
+
+@pytest.mark.parametrize('url', ['/search?q=test', '/search?q=test&type=users'])
+def test_search_requires_token(client, auth_headers, url):
+    assert client.get(url).status_code == 401
+    assert client.get(url, headers=auth_headers).status_code == 200
+
+
+def test_posts_are_ranked_by_relevance(client, auth_headers):
+    # El más relevante se crea primero: el desempate por id lo pondría detrás
+    focused = create_post(client, auth_headers, 'zorzal zorzal zorzal')
+    passing = create_post(client, auth_headers, 'un zorzal cantando entre otras aves del parque esta mañana')
+
+    assert search(client, auth_headers, q='zorzal')[0] == [focused, passing]
+
+
+def test_last_term_matches_as_prefix(client, auth_headers):
+    post_id = create_post(client, auth_headers, 'petirrojo en la ventana')
+
+    assert search(client, auth_headers, q='petirr')[0] == [post_id]
+    assert search(client, auth_headers, q='petirrojo vent')[0] == [post_id]
+    # Sólo la última palabra es prefijo
+    assert search(client, auth_headers, q='petirr ventana')[0] == []
+
+
+def test_users_match_username_and_name_prefix(client):
+    response = client.post('/auth/register', json={'name': 'Golondrina Azul', 'username': 'golondrina',
+                                                   'email': 'golondrina@x', 'password': 'secreta'})
+    assert response.status_code == 201, response.data
+    body = response.get_json()
+    headers = {'Authorization': 'Bearer ' + body['token']}
+
+    assert search(client, headers, q='golon', type='users')[0] == [body['user_id']]
+    assert search(client, headers, q='azu', type='users')[0] == [body['user_id']]
+
+
+def test_results_are_paginated_with_offset(client, auth_headers):
+    posts = {create_post(client, auth_headers, f'gorrion numero {i}') for i in range(3)}
+
+    first, cursor = search(client, auth_headers, q='gorrion', limit=2)
+    second, last_cursor = search(client, auth_headers, q='gorrion', limit=2, offset=cursor)
+
+    assert cursor == '2' and last_cursor is None
+    assert len(first) == 2 and set(first + second) == posts
+
+
+@pytest.mark.parametrize('params', [{'q': ''}, {'q': '!!'}, {'q': 'x', 'type': 'grupos'}, {'q': 'x', 'limit': 0}])
+def test_invalid_queries_are_rejected(client, auth_headers, params):
+    assert client.get('/search', headers=auth_headers, query_string=params).status_code == 400
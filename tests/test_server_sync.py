@@ -0,0 +1,58 @@
+"""GET /sync: sólo con token, y devuelve los cambios (con lápidas) posteriores a since."""
+import io
+
+GIF = (b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,'
+       b'\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;')
+
+
+def create_post(client, headers, description):
+    data = {'description': description, 'file': (io.BytesIO(GIF + description.encode()), 'a.gif')}
+    response = client.post('/posts', headers=headers, data=data)
+    assert response.status_code == 201, response.data
+    return response.get_json()['id']
+
+
+def sync(client, headers, **params):
+    response = client.get('/sync', headers=headers, query_string=params)
+    assert response.status_code == 200, response.data
+    return response.get_json()
+
+
+def test_sync_requires_token(server, client):
+    assert client.get('/sync').status_code == 401
+    refresh_token = server.create_token({"id": 1, "username": "test", "email": "test@x"}, 'refresh')
+    assert client.get('/sync', headers={'Authorization': f'Bearer {refresh_token}'}).status_code == 401
+
+
+def test_sync_returns_changes_and_tombstones_since_version(client, auth_headers):
+    version = sync(client, auth_headers)['version']
+    kept = create_post(client, auth_headers, 'se queda')
+    deleted = create_post(client, auth_headers, 'se borra')
+    assert client.delete(f'/posts/{deleted}', headers=auth_headers).status_code == 204
+    assert client.put('/users/me', headers=auth_headers, data={'bio': 'sincronizada'}).status_code == 200
+
+    changes = sync(client, auth_headers, since=version)
+
+    assert [post['id'] for post in changes['posts']] == [kept]
+    assert changes['deleted_post_ids'] == [deleted]
+    assert [(user['id'], user['bio']) for user in changes['users']] == [(1, 'sincronizada')]
+    assert changes['deleted_user_ids'] == []
+    assert changes['version'] > version
+    assert not changes['has_more']
+    assert sync(client, auth_headers, since=changes['version'])['version'] == changes['version']
+
+
+def test_sync_pages_with_limit(client, auth_headers):
+    version = sync(client, auth_headers)['version']
+    posts = [create_post(client, auth_headers, f'lote {i}') for i in range(3)]
+
+    first = sync(client, auth_headers, since=version, limit=2)
+    second = sync(client, auth_headers, since=first['version'], limit=2)
+
+    assert first['has_more'] and not second['has_more']
+    assert sorted(post['id'] for post in first['posts'] + second['posts']) == posts
+
+
+def test_sync_rejects_invalid_parameters(client, auth_headers):
+    for params in ({'since': 'x'}, {'since': -1}, {'limit': 0}):
+        assert client.get('/sync', headers=auth_headers, query_string=params).status_code == 400
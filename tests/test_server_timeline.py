@@ -0,0 +1,61 @@
+"""fan_out_post recorta la timeline del autor aunque el post no se reparta a nadie."""
+import pytest
+
+KEEP = 2
+
+
+def add_user(db, user_id, follower_count=0):
+    db.execute("INSERT INTO users (id, name, username, email, passwordHash, follower_count) VALUES (?, ?, ?, ?, '-', ?)",
+               (user_id, f"Usuario {user_id}", f"user{user_id}", f"user{user_id}@x", follower_count))
+
+
+def fan_out_posts(server, author_id, count):
+    db = server.db_pool.acquire()
+    post_ids = []
+    for i in range(count):
+        post_ids.append(db.execute(
+            "INSERT INTO posts (user_id, description, media_url, media_type, created_at, author_username) "
+            "VALUES (?, 'post', 'ab/cd/x.jpg', 'image', ?, ?)", (author_id, 1704067200000 + i * 1000, f"user{author_id}")
+        ).lastrowid)
+    db.commit()
+    server.db_pool.release(db)
+    for post_id in post_ids:
+        server.fan_out_post(post_id)
+
+
+def timeline_length(server, user_id):
+    db = server.db_pool.acquire()
+    length = db.execute("SELECT count(*) FROM timeline WHERE user_id = ?", (user_id,)).fetchone()[0]
+    server.db_pool.release(db)
+    return length
+
+
+@pytest.fixture
+def keep_two(server, monkeypatch):
+    monkeypatch.setattr(server, 'TIMELINE_MAX_LENGTH', KEEP)
+
+
+def test_author_without_followers_is_trimmed(server, keep_two):
+    db = server.db_pool.acquire()
+    add_user(db, 101)
+    db.commit()
+    server.db_pool.release(db)
+
+    fan_out_posts(server, 101, 5)
+
+    assert timeline_length(server, 101) == KEEP
+
+
+def test_author_over_threshold_is_trimmed(server, keep_two, monkeypatch):
+    monkeypatch.setattr(server, 'FANOUT_ON_READ_THRESHOLD', 0)
+    db = server.db_pool.acquire()
+    add_user(db, 102, follower_count=1)
+    add_user(db, 103)
+    db.execute("INSERT INTO follows (follower_id, followee_id, created_at) VALUES (103, 102, '2024-01-01 00:00:00')")
+    db.commit()
+    server.db_pool.release(db)
+
+    fan_out_posts(server, 102, 5)
+
+    assert timeline_length(server, 102) == KEEP
+    assert timeline_length(server, 103) == 0  # se lee al vuelo en /feed/home
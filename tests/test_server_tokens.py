@@ -0,0 +1,50 @@
+"""Tokens JWT de acceso y de refresco."""
+from jose import jwt
+
+USER = {"id": 1, "username": "test", "email": "test@x"}
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_expired_access_token_is_rejected(server, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, 'ACCESS_TOKEN_EXPIRE_MINUTES', -1)
+    expired = server.create_token(USER, 'access')
+
+    assert client.get('/users/me', headers=bearer(expired)).status_code == 401
+
+
+def test_token_signed_with_another_key_is_rejected(server, client, auth_headers):
+    claims = jwt.get_unverified_claims(auth_headers['Authorization'].split()[1])
+    forged = jwt.encode(claims, 'otra-clave', algorithm=server.JWT_ALGORITHM)
+
+    assert client.get('/users/me', headers=bearer(forged)).status_code == 401
+
+
+def test_refresh_returns_working_tokens(server, client, auth_headers):
+    refresh_token = server.create_token(USER, 'refresh')
+
+    response = client.post('/auth/refresh', json={'refresh_token': refresh_token})
+
+    assert response.status_code == 200, response.data
+    body = response.get_json()
+    assert body['user_id'] == 1
+    assert client.get('/users/me', headers=bearer(body['token'])).get_json()['id'] == 1
+    assert client.post('/auth/refresh', json={'refresh_token': body['refresh_token']}).status_code == 200
+
+
+def test_token_types_are_not_interchangeable(server, client, auth_headers):
+    refresh_token = server.create_token(USER, 'refresh')
+    access_token = auth_headers['Authorization'].split()[1]
+
+    assert client.get('/users/me', headers=bearer(refresh_token)).status_code == 401
+    assert client.post('/auth/refresh', json={'refresh_token': access_token}).status_code == 401
+    assert client.post('/auth/refresh', json={}).status_code == 401
+
+
+def test_expired_refresh_token_is_rejected(server, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, 'REFRESH_TOKEN_EXPIRE_DAYS', -1)
+    expired = server.create_token(USER, 'refresh')
+
+    assert client.post('/auth/refresh', json={'refresh_token': expired}).status_code == 401
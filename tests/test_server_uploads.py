@@ -0,0 +1,24 @@
+"""Límite de tamaño de las subidas."""
+import io
+import os
+
+
+def test_oversized_body_is_rejected_before_parsing(server, client, auth_headers, monkeypatch):
+    monkeypatch.setitem(server.app.config, 'MAX_CONTENT_LENGTH', 1024)
+    data = {'description': 'grande', 'file': (io.BytesIO(b'x' * 4096), 'a.jpg')}
+
+    response = client.post('/posts', headers=auth_headers, data=data)
+
+    assert response.status_code == 413
+    assert response.get_json() == {"message": "El archivo es demasiado grande"}
+    assert not [name for name in os.listdir(server.UPLOAD_FOLDER) if name.startswith('.tmp-')]
+
+
+def test_upload_over_max_upload_size_is_rejected(server, client, auth_headers, monkeypatch):
+    monkeypatch.setattr(server, 'MAX_UPLOAD_SIZE', 1024)
+    data = {'description': 'grande', 'file': (io.BytesIO(b'x' * 4096), 'a.jpg')}
+
+    response = client.post('/posts', headers=auth_headers, data=data)
+
+    assert response.status_code == 413
+    assert response.get_json() == {"message": "El archivo es demasiado grande"}